@@ -0,0 +1,166 @@
+"""Optional columnar copy of the logs in an embedded DuckDB database, for aggregate queries"""
+import threading
+
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:  # the analytics store is optional
+    duckdb = None
+
+# Columns of the store's logs table, in the order sync copies them from SQLite.
+# api_id is kept next to api so results can still be matched with the sketches.
+STORE_COLUMNS = (
+    ('id', 'BIGINT'),
+    ('file_id', 'BIGINT'),
+    ('ts_epoch', 'BIGINT'),
+    ('ip', 'VARCHAR'),
+    ('request_type', 'VARCHAR'),
+    ('api_id', 'BIGINT'),
+    ('api', 'VARCHAR'),
+    ('status_code', 'INTEGER'),
+    ('bytes', 'BIGINT'),
+    ('referrer', 'VARCHAR'),
+    ('user_agent', 'VARCHAR'),
+    ('response_time', 'DOUBLE'),
+)
+
+# The log_entries rows above an id, with their interned values resolved
+SYNC_SELECT_SQL = '''
+SELECT e.id, e.file_id, e.ts_epoch, e.ip, e.request_type, e.api_id, a.value, e.status_code,
+       e.bytes, r.value, u.value, e.response_time
+FROM log_entries e
+JOIN strings a ON a.id = e.api_id
+JOIN strings r ON r.id = e.referrer_id
+JOIN strings u ON u.id = e.user_agent_id
+WHERE e.id > ?
+ORDER BY e.id
+LIMIT ?
+'''
+
+
+class AnalyticsStore:
+    """Columnar copy of log_entries in a DuckDB file, for GROUP BY queries over many rows
+
+    DuckDB runs aggregates vectorized over compressed column segments, and keeps
+    min/max statistics per row group. Rows are appended in id order, which is
+    per file and mostly chronological, so filters on file_id and ts_epoch skip
+    whole row groups the way file and time partitions would.
+
+    The copy is refreshed from SQLite by sync(), keyed on the app's
+    log_data_version: SQLite commits ids in increasing order, so while the
+    'deletes' generation is unchanged the rows above the highest id stored are
+    exactly the ones missing. Any delete (a file, a reset, the duplicate rows
+    removed by a migration) bumps the generation, and the copy is rebuilt.
+    Row lookups (/logs) stay on SQLite. A DuckDB file can only be opened by
+    one process at a time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = duckdb.connect(path)
+        self.lock = threading.Lock()
+        columns = ', '.join(f'{name} {type_}' for name, type_ in STORE_COLUMNS)
+        self.conn.execute(f'CREATE TABLE IF NOT EXISTS logs ({columns})')
+        # The 'deletes' generation the copy was made at; empty until the first
+        # sync, so stores from before it are rebuilt once
+        self.conn.execute('CREATE TABLE IF NOT EXISTS sync_state (deletes BIGINT)')
+
+    def sync(self, sqlite_conn, version, chunk_rows=100000):
+        """Bring the copy up to date with a SQLite connection's database; returns the rows copied
+
+        version is the database's log_data_version, read before the call: rows
+        deleted after it are caught by the next sync, which sees a newer generation.
+        """
+        max_id, deletes = version
+        sqlite_cursor = sqlite_conn.cursor()
+        sqlite_cursor.row_factory = None
+        with self.lock:
+            cursor = self.conn.cursor()
+            try:
+                row = cursor.execute('SELECT deletes FROM sync_state').fetchone()
+                rebuild = row is None or row[0] != deletes
+                last_id = 0 if rebuild else cursor.execute('SELECT COALESCE(MAX(id), 0) FROM logs').fetchone()[0]
+                if last_id >= max_id and not rebuild:
+                    return 0
+
+                # One transaction, so queries never see a partly rebuilt copy and
+                # an interrupted sync leaves the old copy and generation in place
+                cursor.execute('BEGIN TRANSACTION')
+                try:
+                    if rebuild:
+                        cursor.execute('DELETE FROM logs')
+                    copied = 0
+                    while True:
+                        sqlite_cursor.execute(SYNC_SELECT_SQL, (last_id, chunk_rows))
+                        rows = sqlite_cursor.fetchall()
+                        if not rows:
+                            break
+                        # Scanned by DuckDB straight from the DataFrame; NaN becomes NULL
+                        cursor.register('new_rows', pd.DataFrame(rows, columns=[name for name, _ in STORE_COLUMNS]))
+                        cursor.execute('INSERT INTO logs SELECT * FROM new_rows')
+                        cursor.unregister('new_rows')
+                        last_id = rows[-1][0]
+                        copied += len(rows)
+                    cursor.execute('DELETE FROM sync_state')
+                    cursor.execute('INSERT INTO sync_state VALUES (?)', [deletes])
+                    cursor.execute('COMMIT')
+                except Exception:
+                    cursor.execute('ROLLBACK')
+                    raise
+                return copied
+            finally:
+                cursor.close()
+
+    def query(self, sql, params=()):
+        """Run a query on the copy (table logs, STORE_COLUMNS) and return all its rows as tuples"""
+        cursor = self.conn.cursor()
+        try:
+            return cursor.execute(sql, list(params)).fetchall()
+        finally:
+            cursor.close()
+
+
+# Open stores by path, or None for a path that could not be opened
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_analytics_store(path):
+    """Return the AnalyticsStore at path, opening it on first use
+
+    Returns None when path is not set, and (after printing why, once) when
+    duckdb is not installed or the file cannot be opened, e.g. because another
+    process has it open. Callers then query SQLite instead.
+    """
+    if not path:
+        return None
+    with _stores_lock:
+        if path not in _stores:
+            if duckdb is None:
+                print('The analytics store requires the duckdb package; using SQLite for aggregates')
+                _stores[path] = None
+            else:
+                try:
+                    _stores[path] = AnalyticsStore(path)
+                except duckdb.Error as e:
+                    print(f'Cannot open the analytics store {path}: {e}')
+                    _stores[path] = None
+        return _stores[path]
+
+
+def synced_analytics_store(path, sqlite_conn, version):
+    """get_analytics_store(path), first brought up to date with sqlite_conn's database at version
+
+    The store only holds derived data, so a failed update is printed and left
+    for the next one to catch up on; None is returned then, as without a store.
+    """
+    store = get_analytics_store(path)
+    if store is None:
+        return None
+    try:
+        store.sync(sqlite_conn, version)
+    except Exception as e:
+        print(f'Error updating the analytics store: {e}')
+        return None
+    return store
@@ -1,12 +1,31 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import os
 import json
 import re
-from datetime import datetime
+import hashlib
+import ipaddress
+import socket
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import chain, islice
 import sqlite3
 import plotly
 import plotly.graph_objects as go
+from analytics_store import synced_analytics_store
+from http_encoding import choose_encoding, compress_body, dumps_json
+from log_export import EXPORT_FORMATS, export_available, export_chunks
+from log_follower import LogFollower
+from log_formats import LOG_FORMATS, detect_log_format, get_log_format, parse_apache_timestamp, register_log_format
+from log_receiver import LogReceiver
+from log_streams import CountingReader, is_compressed_file, open_log_stream, skip_bytes
+from sketches import (SKETCH_BUCKET_SECONDS, SKETCH_TOTAL_BUCKET, HyperLogLog, LatencyHistogram, SpaceSaving,
+                      latency_bin, load_sketch)
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -14,12 +33,137 @@ app.secret_key = 'loganalyzer_secret_key'
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['DATABASE'] = 'log_data.db'
 app.config['MAX_CONTENT_LENGTH'] = 300 * 1024 * 1024  # 300MB max file size
+app.config['UPLOAD_PART_TIMEOUT'] = 600  # Seconds without writes after which a .part upload file is a leftover
+app.config['PARALLEL_INGEST'] = True
+app.config['PARALLEL_INGEST_MIN_SIZE'] = 16 * 1024 * 1024  # Files smaller than this are parsed on one thread
+app.config['INGEST_PROCESSES'] = os.cpu_count() or 1
+app.config['INGEST_CHUNK_SIZE'] = 4 * 1024 * 1024  # Byte range handed to each parser process
+app.config['INGEST_COMMIT_ROWS'] = 20000  # Rows stored per transaction (and checkpoint) by single-pass ingestion
+app.config['BULK_LOAD_MIN_SIZE'] = 16 * 1024 * 1024  # Uploads at least this big are loaded in bulk mode
+app.config['BULK_LOAD_MAX_DB_RATIO'] = 4  # ...unless the database is already this many times larger
+app.config['BULK_LOAD_COMMIT_ROWS'] = 100000  # Rows per transaction of a bulk load; other writers run in between
+app.config['WRITE_LOCK_YIELD_INTERVAL'] = 2  # Seconds of ingestion between pauses that let other writers commit
+app.config['INGEST_POOL_SIZE'] = 2  # Ingestion jobs run concurrently by each app process
+app.config['INGEST_POLL_INTERVAL'] = 2  # Seconds between queue checks for jobs queued by other processes
+app.config['PROCESSING_STATUS_TTL'] = 300  # Seconds the live status of a finished job is kept; ingest_jobs has it afterwards
+app.config['LOG_FORMATS'] = {}  # Extra formats by name: an Apache LogFormat or nginx log_format string
+app.config['DEFAULT_LOG_FORMAT'] = 'apache_combined_time'  # Used when no format matches a file's sample
+app.config['LOG_FORMAT_SAMPLE_LINES'] = 100  # Lines read from the start of a file to detect its format
+app.config['TOP_K_CAPACITY'] = 100  # Counters per heavy-hitter sketch; more is more accurate and larger
+app.config['HLL_PRECISION'] = 12  # Distinct-count sketches have 2 ** HLL_PRECISION registers (1.6% error at 12)
+app.config['EXACT_DISTINCT_COUNTS'] = False  # Count unique IPs/APIs with COUNT(DISTINCT) instead of sketches
+app.config['EXPORT_BATCH_ROWS'] = 5000  # Rows fetched and encoded at a time by /api/logs/export
+app.config['API_COMPRESS_MIN_BYTES'] = 1024  # Smaller /api/logs responses are sent uncompressed
+app.config['ANALYTICS_STORE'] = None  # DuckDB file (e.g. 'analytics.duckdb') for a columnar copy of the logs; needs duckdb
+app.config['TAIL_PATHS'] = []  # Live log files to follow (glob patterns), e.g. ['/var/log/apache2/*access.log']
+app.config['TAIL_POLL_INTERVAL'] = 1  # Seconds between checks of followed files for new lines
+app.config['TAIL_BATCH_LINES'] = 500  # Most lines committed in one transaction by the follower
+app.config['RECEIVER_HOST'] = '127.0.0.1'  # Interface the network log receiver listens on
+app.config['RECEIVER_TCP_PORT'] = None  # Set a port to accept newline-delimited log lines over TCP
+app.config['RECEIVER_UDP_PORT'] = None  # Set a port to accept log lines (or syslog messages) over UDP
+app.config['RECEIVER_FILE_NAME'] = 'network.log'  # files record the received lines are stored under
+app.config['RECEIVER_QUEUE_SIZE'] = 10000  # Lines buffered before TCP senders are throttled (UDP drops)
+app.config['RECEIVER_BATCH_LINES'] = 500  # Most lines committed in one transaction by the receiver
+app.config['RECEIVER_FLUSH_INTERVAL'] = 0.5  # Seconds a received line may wait for its batch to fill
 
 # Create upload folder if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Regular expression for parsing Apache logs
 APACHE_LOG_PATTERN = r'(\S+) (\S+) (\S+) \[([\w:/]+\s[+\-]\d{4})\] "(\S+) (\S+) (\S+)" (\d+) (\S+) "([^"]*)" "([^"]*)" (\S+)'
+APACHE_LOG_REGEX = re.compile(APACHE_LOG_PATTERN)
+
+# Bump when a step is added to SCHEMA_MIGRATIONS (stored in PRAGMA user_version)
+SCHEMA_VERSION = 14
+
+# Width of the time buckets of log_rollups, in seconds
+ROLLUP_BUCKET_SECONDS = 60
+
+# Adds rows to log_rollups: one (file_id, bucket, status_code, request_type,
+# requests, bytes, response_time_sum, response_time_count) per rollup row, from
+# the counts of count_log_rollups
+ROLLUP_UPSERT_SQL = '''
+INSERT INTO log_rollups (file_id, bucket, status_code, request_type, requests, bytes,
+                         response_time_sum, response_time_count)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (file_id, bucket, status_code, request_type) DO UPDATE SET
+    requests = requests + excluded.requests,
+    bytes = bytes + excluded.bytes,
+    response_time_sum = response_time_sum + excluded.response_time_sum,
+    response_time_count = response_time_count + excluded.response_time_count
+'''
+
+# Builds log_rollups from the rows already in log_entries (used by the migration
+# that introduced it, when nothing else is writing)
+ROLLUP_BACKFILL_SQL = f'''
+INSERT INTO log_rollups (file_id, bucket, status_code, request_type, requests, bytes,
+                         response_time_sum, response_time_count)
+SELECT file_id, COALESCE(ts_epoch / {ROLLUP_BUCKET_SECONDS} * {ROLLUP_BUCKET_SECONDS}, -1),
+       COALESCE(status_code, 0), COALESCE(request_type, '-'), COUNT(*), TOTAL(bytes),
+       TOTAL(response_time), COUNT(response_time)
+FROM log_entries
+GROUP BY 1, 2, 3, 4
+'''
+
+# Columns insert_log_batch writes, in the order of the row tuples it passes on
+# to the rollups (and reads back when some rows were duplicates)
+LOG_ENTRY_COLUMNS = ('file_id', 'ip', 'remote_log_name', 'user_id', 'timestamp', 'request_type', 'api_id',
+                     'protocol_id', 'status_code', 'bytes', 'referrer_id', 'user_agent_id', 'response_time',
+                     'upload_date_id', 'ts_epoch', 'ip_key')
+
+# Sketch kinds kept in log_sketches: kind -> (sketch class, log_entries column,
+# config key of the size new sketches are created with)
+SKETCH_KINDS = {
+    'top_ip': (SpaceSaving, 'ip', 'TOP_K_CAPACITY'),
+    'top_api': (SpaceSaving, 'api_id', 'TOP_K_CAPACITY'),
+    'distinct_ip': (HyperLogLog, 'ip', 'HLL_PRECISION'),
+    'distinct_api': (HyperLogLog, 'api_id', 'HLL_PRECISION'),
+}
+
+# Adds rows of log_entries to latency_rollups, from their response times binned
+# by count_latency_rollups
+LATENCY_UPSERT_SQL = '''
+INSERT INTO latency_rollups (file_id, bucket, api_id, bin, requests)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (file_id, bucket, api_id, bin) DO UPDATE SET
+    requests = requests + excluded.requests
+'''
+
+# Secondary indexes on log_entries, shaped after the filters used by /logs,
+# /api/logs, the dashboard and the Dash callbacks. Bulk loads drop and rebuild them.
+# Plain ts_epoch lookups use the leading column of the dedup index. Migrations
+# create the indexes of their own version, not these (see create_log_indexes).
+LOG_INDEXES = {
+    'idx_log_entries_file_status': 'log_entries (file_id, status_code)',
+    'idx_log_entries_file_ts_epoch': 'log_entries (file_id, ts_epoch)',
+    'idx_log_entries_status': 'log_entries (status_code)',
+    'idx_log_entries_request_type': 'log_entries (request_type)',
+    'idx_log_entries_ip_key': 'log_entries (ip_key)',
+    'idx_log_entries_api': 'log_entries (api_id)',
+    'idx_log_entries_referrer': 'log_entries (referrer_id)',
+    'idx_log_entries_user_agent': 'log_entries (user_agent_id)',
+}
+
+# Duplicate detection: a row is a duplicate of any stored row, from any file,
+# with the same key. The index is ordered by time, so mostly chronological
+# inserts append near the right edge of the B-tree. It is never dropped by
+# bulk loads, since INSERT OR IGNORE relies on it.
+DEDUP_INDEX_SQL = '''
+CREATE UNIQUE INDEX IF NOT EXISTS idx_log_entries_dedup
+ON log_entries (ts_epoch, ip, api_id, request_type, status_code)
+'''
+
+# SQLite treats NULLs as distinct in unique indexes, so rows whose timestamp
+# could not be parsed (ts_epoch NULL) never conflict above. They are checked on
+# their raw timestamp instead, in an index that only holds those rows. Formats
+# without a timestamp store '' for it, and those rows are never duplicates:
+# the key would reduce to the IP and request.
+UNPARSED_DEDUP_WHERE = "ts_epoch IS NULL AND timestamp != ''"
+UNPARSED_DEDUP_INDEX_SQL = f'''
+CREATE UNIQUE INDEX IF NOT EXISTS idx_log_entries_dedup_unparsed
+ON log_entries (timestamp, ip, api_id, request_type, status_code)
+WHERE {UNPARSED_DEDUP_WHERE}
+'''
 
 def get_db_connection():
     """Get a new database connection with timeout and proper settings"""
@@ -34,46 +178,498 @@ def init_db():
     try:
         cursor = conn.cursor()
         
-        # Create logs table
+        # Create files table to track uploaded files
         cursor.execute('''
-        CREATE TABLE IF NOT EXISTS logs (
+        CREATE TABLE IF NOT EXISTS files (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_name TEXT,
+            file_name TEXT UNIQUE,  
+            upload_date TEXT,
+            record_count INTEGER,
+            duplicate_count INTEGER DEFAULT 0,
+            content_hash TEXT,
+            size INTEGER
+        )
+        ''')
+        
+        # Lookup table for repeated text values (APIs, user agents, referrers, ...)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS strings (
+            id INTEGER PRIMARY KEY,
+            value TEXT UNIQUE
+        )
+        ''')
+        
+        # Full-text index of strings (external content: the values themselves stay
+        # in strings), kept in step by StringInterner. Searches on api, referrer
+        # and user_agent match the distinct values here, then the logs by id.
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS strings_fts USING fts5(
+            value,
+            content='strings',
+            content_rowid='id',
+            prefix='2 3'
+        )
+        ''')
+        
+        # Compact log storage: high-cardinality text columns are stored as
+        # strings ids and the file as a files id
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS log_entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_id INTEGER NOT NULL,
             ip TEXT,
             remote_log_name TEXT,
             user_id TEXT,
             timestamp TEXT,
             request_type TEXT,
-            api TEXT,
-            protocol TEXT,
+            api_id INTEGER,
+            protocol_id INTEGER,
             status_code INTEGER,
             bytes INTEGER,
-            referrer TEXT,
-            user_agent TEXT,
+            referrer_id INTEGER,
+            user_agent_id INTEGER,
             response_time REAL,
-            upload_date TEXT
+            upload_date_id INTEGER,
+            ts_epoch INTEGER,
+            ip_key BLOB
         )
         ''')
         
-        # Create files table to track uploaded files
+        # Ingestion job queue shared by all app processes. The checkpoint columns
+        # (byte_offset, lines_read and the counts) are updated in the same
+        # transaction as each batch of rows so a job can resume from its last
+        # commit. byte_offset is a line boundary in the (decompressed) log stream.
         cursor.execute('''
-        CREATE TABLE IF NOT EXISTS files (
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_name TEXT UNIQUE,  
-            upload_date TEXT,
-            record_count INTEGER
+            file_id INTEGER NOT NULL UNIQUE,
+            status TEXT NOT NULL DEFAULT 'queued',
+            priority INTEGER NOT NULL DEFAULT 0,
+            source TEXT NOT NULL DEFAULT 'upload',
+            content_hash TEXT,
+            byte_offset INTEGER NOT NULL DEFAULT 0,
+            lines_read INTEGER NOT NULL DEFAULT 0,
+            record_count INTEGER NOT NULL DEFAULT 0,
+            duplicate_count INTEGER NOT NULL DEFAULT 0,
+            progress INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            worker TEXT,
+            created_at TEXT,
+            started_at TEXT,
+            updated_at TEXT,
+            finished_at TEXT
         )
         ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_ingest_jobs_queue ON ingest_jobs (status, priority, id)')
+        
+        # Request counts per file, time bucket (ROLLUP_BUCKET_SECONDS, -1 when the
+        # timestamp could not be parsed), status code and method, kept up to date
+        # by insert_log_batch. The dashboards aggregate these instead of log_entries.
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS log_rollups (
+            file_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            status_code INTEGER NOT NULL,
+            request_type TEXT NOT NULL,
+            requests INTEGER NOT NULL,
+            bytes INTEGER NOT NULL,
+            response_time_sum REAL NOT NULL,
+            response_time_count INTEGER NOT NULL,
+            PRIMARY KEY (file_id, bucket, status_code, request_type)
+        ) WITHOUT ROWID
+        ''')
+        
+        # Mergeable summaries (see sketches.py) per file, kind and time bucket
+        # (SKETCH_BUCKET_SECONDS, with -1 for rows without a timestamp and the
+        # whole-file SKETCH_TOTAL_BUCKET), kept up to date by insert_log_batch
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS log_sketches (
+            file_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (file_id, kind, bucket)
+        ) WITHOUT ROWID
+        ''')
+        
+        # Latency histograms (see sketches.LatencyHistogram): requests per file,
+        # time bucket (SKETCH_BUCKET_SECONDS, -1 without a timestamp), API and
+        # response time bin, kept up to date by insert_log_batch
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS latency_rollups (
+            file_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            api_id INTEGER NOT NULL,
+            bin INTEGER NOT NULL,
+            requests INTEGER NOT NULL,
+            PRIMARY KEY (file_id, bucket, api_id, bin)
+        ) WITHOUT ROWID
+        ''')
+        
+        # Position of the log follower in each followed path, saved in the same
+        # transaction as the rows read from it. device and inode identify the
+        # file the offset belongs to, so rotation is noticed across restarts.
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tail_state (
+            path TEXT PRIMARY KEY,
+            file_id INTEGER,
+            device INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            byte_offset INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        )
+        ''')
+        
+        # Counters bumped by bump_generation, e.g. the 'deletes' generation each
+        # time files or strings are deleted, which invalidates cached ids
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS generations (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+        ''')
+        
+        migrated = migrate_schema(conn)
+        create_missing_log_indexes(conn)
+        
+        # The logs view keeps the original row shape for readers
+        cursor.execute('''
+        CREATE VIEW IF NOT EXISTS logs AS
+        SELECT
+            e.id, f.file_name, e.ip, e.remote_log_name, e.user_id, e.timestamp,
+            e.request_type, a.value AS api, p.value AS protocol, e.status_code,
+            e.bytes, r.value AS referrer, u.value AS user_agent, e.response_time,
+            d.value AS upload_date, e.ts_epoch
+        FROM log_entries e
+        JOIN files f ON f.id = e.file_id
+        JOIN strings a ON a.id = e.api_id
+        JOIN strings p ON p.id = e.protocol_id
+        JOIN strings r ON r.id = e.referrer_id
+        JOIN strings u ON u.id = e.user_agent_id
+        JOIN strings d ON d.id = e.upload_date_id
+        ''')
         
         conn.commit()
+        
+        # Reclaim the space freed by dropping the old wide table
+        if migrated:
+            conn.execute('VACUUM')
     except sqlite3.Error as e:
         print(f"Database error: {e}")
     finally:
         conn.close()
 
+def migrate_schema(conn):
+    """Run the schema migrations newer than the database's user_version
+    
+    Returns True if the legacy wide logs table was migrated (the caller vacuums).
+    """
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    migrated = False
+    for step_version, step in SCHEMA_MIGRATIONS:
+        if version < step_version:
+            migrated = step(conn) or migrated
+            conn.execute(f'PRAGMA user_version = {step_version}')
+    return migrated
+
+def migrate_legacy_logs(conn):
+    """Move rows from the original wide logs table into log_entries and drop it"""
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT type FROM sqlite_master WHERE name = 'logs'")
+    legacy = cursor.fetchone()
+    if legacy is None or legacy['type'] != 'table':
+        return False
+    
+    # Databases created before ts_epoch existed get a backfill first
+    columns = [row['name'] for row in cursor.execute('PRAGMA table_info(logs)')]
+    if 'ts_epoch' not in columns:
+        cursor.execute('ALTER TABLE logs ADD COLUMN ts_epoch INTEGER')
+        conn.create_function('apache_epoch', 1, parse_apache_timestamp)
+        cursor.execute('UPDATE logs SET ts_epoch = apache_epoch(timestamp)')
+    
+    # Every file referenced by a log row needs a files record to point at
+    cursor.execute('''
+    INSERT OR IGNORE INTO files (file_name, upload_date, record_count)
+    SELECT file_name, MIN(upload_date), COUNT(*) FROM logs GROUP BY file_name
+    ''')
+    
+    cursor.execute('''
+    INSERT OR IGNORE INTO strings (value)
+    SELECT COALESCE(api, '-') FROM logs
+    UNION SELECT COALESCE(protocol, '-') FROM logs
+    UNION SELECT COALESCE(referrer, '-') FROM logs
+    UNION SELECT COALESCE(user_agent, '-') FROM logs
+    UNION SELECT COALESCE(upload_date, '-') FROM logs
+    ''')
+    
+    cursor.execute('''
+    INSERT INTO log_entries (
+        id, file_id, ip, remote_log_name, user_id, timestamp, request_type,
+        api_id, protocol_id, status_code, bytes, referrer_id, user_agent_id,
+        response_time, upload_date_id, ts_epoch
+    )
+    SELECT
+        l.id, f.id, l.ip, l.remote_log_name, l.user_id, l.timestamp, l.request_type,
+        a.id, p.id, CAST(l.status_code AS INTEGER),
+        CASE WHEN CAST(l.bytes AS TEXT) GLOB '[0-9]*' THEN CAST(l.bytes AS INTEGER) ELSE 0 END,
+        r.id, u.id, l.response_time, d.id, l.ts_epoch
+    FROM logs l
+    JOIN files f ON f.file_name = l.file_name
+    JOIN strings a ON a.value = COALESCE(l.api, '-')
+    JOIN strings p ON p.value = COALESCE(l.protocol, '-')
+    JOIN strings r ON r.value = COALESCE(l.referrer, '-')
+    JOIN strings u ON u.value = COALESCE(l.user_agent, '-')
+    JOIN strings d ON d.value = COALESCE(l.upload_date, '-')
+    ''')
+    
+    cursor.execute('DROP TABLE logs')
+    return True
+
+def create_log_indexes(conn, indexes=LOG_INDEXES):
+    """Create any missing index from LOG_INDEXES (or a {name: target} dict) and refresh planner statistics"""
+    for name, target in indexes.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {target}')
+    # Statistics from a sample of each index, as PRAGMA optimize gathers them
+    conn.execute('PRAGMA analysis_limit = 1000')
+    conn.execute('ANALYZE log_entries')
+
+def drop_log_indexes(conn):
+    """Drop the managed indexes so a bulk load does not maintain them row by row"""
+    for name in LOG_INDEXES:
+        conn.execute(f'DROP INDEX IF EXISTS {name}')
+
+def create_initial_log_indexes(conn):
+    """Create the indexes of schema version 2; later steps add the indexes of their own columns"""
+    create_log_indexes(conn, {
+        'idx_log_entries_file_status': 'log_entries (file_id, status_code)',
+        'idx_log_entries_file_ts_epoch': 'log_entries (file_id, ts_epoch)',
+        'idx_log_entries_ts_epoch': 'log_entries (ts_epoch)',
+        'idx_log_entries_status': 'log_entries (status_code)',
+        'idx_log_entries_request_type': 'log_entries (request_type)',
+    })
+
+def add_column(conn, table, column, declaration):
+    """Add a column to a table unless it is already there"""
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+
+def create_dedup_index(conn):
+    """Enforce one row per (ts_epoch, ip, api, request_type, status_code) across all files
+    
+    Rows ingested before this index existed were only deduplicated within their
+    own file, so later copies of a row already stored by another file are
+    removed first (the earliest row is kept) and counted as duplicates.
+    """
+    add_column(conn, 'files', 'duplicate_count', 'INTEGER DEFAULT 0')
+    delete_duplicate_rows(conn, 'ts_epoch, ip, api_id, request_type, status_code', 'ts_epoch IS NOT NULL')
+    conn.execute(DEDUP_INDEX_SQL)
+    conn.execute('DROP INDEX IF EXISTS idx_log_entries_ts_epoch')
+
+def delete_duplicate_rows(conn, key, where):
+    """Delete all but the earliest of the log_entries rows matching where that share the key columns
+    
+    The deleted rows are moved from their files' record_count to duplicate_count.
+    Returns the number of rows deleted.
+    """
+    conn.execute(f'''
+    CREATE TEMP TABLE duplicate_rows AS
+    SELECT id, file_id FROM (
+        SELECT id, file_id, ROW_NUMBER() OVER (PARTITION BY {key} ORDER BY id) AS occurrence
+        FROM log_entries
+        WHERE {where}
+    )
+    WHERE occurrence > 1
+    ''')
+    conn.execute('''
+    UPDATE files SET
+        record_count = record_count - (SELECT COUNT(*) FROM duplicate_rows d WHERE d.file_id = files.id),
+        duplicate_count = COALESCE(duplicate_count, 0) + (SELECT COUNT(*) FROM duplicate_rows d WHERE d.file_id = files.id)
+    ''')
+    deleted = conn.execute('DELETE FROM log_entries WHERE id IN (SELECT id FROM duplicate_rows)').rowcount
+    conn.execute('DROP TABLE duplicate_rows')
+    if deleted:
+        bump_generation(conn, 'deletes')
+    return deleted
+
+def create_unparsed_dedup_index(conn):
+    """Deduplicate rows without a parsed timestamp on their raw one, as before ts_epoch
+    
+    Duplicates stored while these rows were not checked are removed first, and
+    the rollups and sketches rebuilt without them.
+    """
+    key = 'timestamp, ip, api_id, request_type, status_code'
+    not_null = ' AND '.join(f'{column} IS NOT NULL' for column in key.split(', '))
+    if delete_duplicate_rows(conn, key, f'{UNPARSED_DEDUP_WHERE} AND {not_null}'):
+        backfill_log_rollups(conn)
+        backfill_log_sketches(conn)
+        backfill_latency_rollups(conn)
+    conn.execute(UNPARSED_DEDUP_INDEX_SQL)
+
+def recreate_unparsed_dedup_index(conn):
+    """Rebuild the index of create_unparsed_dedup_index without the rows of formats that log no timestamp"""
+    conn.execute('DROP INDEX IF EXISTS idx_log_entries_dedup_unparsed')
+    conn.execute(UNPARSED_DEDUP_INDEX_SQL)
+
+def add_upload_hash_columns(conn):
+    """Track the SHA-256 and size of each fully ingested upload"""
+    add_column(conn, 'files', 'content_hash', 'TEXT')
+    add_column(conn, 'files', 'size', 'INTEGER')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files (content_hash)')
+
+def migrate_ingest_checkpoints(conn):
+    """Queue the unfinished ingestions of the former ingest_checkpoints table as jobs"""
+    legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ingest_checkpoints'").fetchone()
+    if legacy is None:
+        return
+    conn.execute('''
+    INSERT OR IGNORE INTO ingest_jobs (file_id, content_hash, byte_offset, lines_read,
+                                       record_count, duplicate_count, created_at, updated_at)
+    SELECT file_id, content_hash, byte_offset, lines_read, record_count, duplicate_count, updated_at, updated_at
+    FROM ingest_checkpoints
+    ''')
+    conn.execute('DROP TABLE ingest_checkpoints')
+
+def add_log_format_column(conn):
+    """Record the log format each file was parsed with"""
+    add_column(conn, 'files', 'log_format', 'TEXT')
+
+def add_ip_key_column(conn):
+    """Store each IP in the sortable ip_key form and index it for CIDR and range filters"""
+    add_column(conn, 'log_entries', 'ip_key', 'BLOB')
+    conn.create_function('ip_key', 1, ip_key, deterministic=True)
+    conn.execute('UPDATE log_entries SET ip_key = ip_key(ip)')
+    create_log_indexes(conn, {'idx_log_entries_ip_key': 'log_entries (ip_key)'})
+
+def add_search_index(conn):
+    """Index the strings stored before strings_fts existed, and the columns searches select logs by"""
+    conn.execute("INSERT INTO strings_fts (strings_fts) VALUES ('rebuild')")
+    create_log_indexes(conn, {
+        'idx_log_entries_api': 'log_entries (api_id)',
+        'idx_log_entries_referrer': 'log_entries (referrer_id)',
+        'idx_log_entries_user_agent': 'log_entries (user_agent_id)',
+    })
+
+def backfill_log_rollups(conn):
+    """Build log_rollups for the rows ingested before it existed"""
+    conn.execute('DELETE FROM log_rollups')
+    conn.execute(ROLLUP_BACKFILL_SQL)
+
+def select_log_entry_columns(columns):
+    """SELECT list of LOG_ENTRY_COLUMNS tuples that reads only some columns (NULL for the others)
+    
+    Backfills run as migration steps, before the columns of later steps exist.
+    """
+    return ', '.join(column if column in columns else 'NULL' for column in LOG_ENTRY_COLUMNS)
+
+def backfill_log_sketches(conn):
+    """Build log_sketches for the rows ingested before it existed"""
+    conn.execute('DELETE FROM log_sketches')
+    cursor = conn.cursor()
+    cursor.execute('SELECT COALESCE(MAX(id), 0) FROM log_entries')
+    last_id = cursor.fetchone()[0]
+    # In slices, so memory use does not grow with the table
+    for after_id in range(0, last_id, 500000):
+        columns = {'file_id', 'ts_epoch'} | {column for _, column, _ in SKETCH_KINDS.values()}
+        cursor.execute(f'SELECT {select_log_entry_columns(columns)} FROM log_entries WHERE id > ? AND id <= ?',
+                       (after_id, after_id + 500000))
+        write_log_sketches(cursor, count_log_sketches(cursor.fetchall()))
+
+def backfill_latency_rollups(conn):
+    """Build latency_rollups for the rows ingested before it existed"""
+    conn.execute('DELETE FROM latency_rollups')
+    cursor = conn.cursor()
+    cursor.execute('SELECT COALESCE(MAX(id), 0) FROM log_entries')
+    last_id = cursor.fetchone()[0]
+    for after_id in range(0, last_id, 500000):
+        columns = {'file_id', 'ts_epoch', 'api_id', 'response_time'}
+        cursor.execute(f'SELECT {select_log_entry_columns(columns)} FROM log_entries WHERE id > ? AND id <= ?',
+                       (after_id, after_id + 500000))
+        write_latency_rollups(cursor, count_latency_rollups(cursor.fetchall()))
+
+# Ordered (version, step) pairs applied by migrate_schema
+SCHEMA_MIGRATIONS = [
+    (1, migrate_legacy_logs),
+    (2, create_initial_log_indexes),
+    (3, create_dedup_index),
+    (4, add_upload_hash_columns),
+    (5, migrate_ingest_checkpoints),
+    (6, add_log_format_column),
+    (7, backfill_log_rollups),
+    (8, backfill_log_sketches),
+    # Rebuilt with the distinct-count kinds added to SKETCH_KINDS
+    (9, backfill_log_sketches),
+    (10, backfill_latency_rollups),
+    (11, add_ip_key_column),
+    (12, add_search_index),
+    (13, create_unparsed_dedup_index),
+    (14, recreate_unparsed_dedup_index),
+]
+
+def use_bulk_load(total_bytes):
+    """Decide whether an upload is big enough to load in bulk mode
+    
+    Bulk mode rebuilds the indexes over the whole table at the end, so it only
+    pays off when the upload is large relative to what is already stored.
+    """
+    if not total_bytes or total_bytes < app.config['BULK_LOAD_MIN_SIZE']:
+        return False
+    try:
+        database_size = os.path.getsize(app.config['DATABASE'])
+    except OSError:
+        database_size = 0
+    return database_size <= total_bytes * app.config['BULK_LOAD_MAX_DB_RATIO']
+
+def begin_bulk_load(conn):
+    """Start a bulk load: large transactions, relaxed durability and no index maintenance
+    
+    The managed indexes are dropped (and that committed) up front, and the load
+    then commits every BULK_LOAD_COMMIT_ROWS rows with its checkpoint, so other
+    writers (uploads, the follower, the receiver) get the lock in between.
+    Queries that need the dropped indexes are slower until end_bulk_load. With
+    synchronous NORMAL a crash can lose the last commits, which the job then
+    redoes from its checkpoint, but in WAL mode never corrupts the database.
+    """
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute('PRAGMA cache_size = -262144')  # 256MB page cache
+    conn.execute('PRAGMA temp_store = MEMORY')
+    drop_log_indexes(conn)
+    conn.commit()
+
+def end_bulk_load(conn):
+    """Rebuild the managed indexes and commit a bulk load"""
+    create_log_indexes(conn)
+    conn.commit()
+    conn.execute('PRAGMA synchronous = FULL')
+
+def abort_bulk_load(conn):
+    """Roll back the uncommitted part of a failed bulk load and restore its indexes"""
+    conn.rollback()
+    end_bulk_load(conn)
+
+def yield_write_lock(last_pause):
+    """Pause for a moment after a commit if the last pause (a time.monotonic()) was WRITE_LOCK_YIELD_INTERVAL ago
+    
+    SQLite has no queue for the write lock: a writer kept waiting retries at
+    intervals of up to 100 ms, so it rarely catches the short gap between two
+    commits of a long ingestion. A 100 ms pause lets it in. Returns the time of
+    the last pause.
+    """
+    if time.monotonic() - last_pause < app.config['WRITE_LOCK_YIELD_INTERVAL']:
+        return last_pause
+    time.sleep(0.1)
+    return time.monotonic()
+
+def create_missing_log_indexes(conn):
+    """Create the managed indexes if any is missing, e.g. after a bulk load was interrupted"""
+    cursor = conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    if set(LOG_INDEXES) - {row[0] for row in cursor.fetchall()}:
+        create_log_indexes(conn)
+
 def parse_apache_log(log_line):
     """Parse a single Apache log line into its components"""
-    match = re.match(APACHE_LOG_PATTERN, log_line)
+    match = APACHE_LOG_REGEX.match(log_line)
     if match:
         return {
             'ip': match.group(1),
@@ -91,199 +687,1279 @@ def parse_apache_log(log_line):
         }
     return None
 
-def process_log_file_async(file_path, file_name):
-    """Process the log file asynchronously and store data in the database"""
-    global processing_status
+def parse_log_row(log_line, file_name, upload_date, _match=APACHE_LOG_REGEX.match):
+    """Parse a single Apache log line straight into a row for insert_log_batch
+    
+    It skips the intermediate dict built by parse_apache_log and returns a tuple
+    in logs column order, or None if the line does not match. Ingestion uses the
+    parser of each file's log format instead (see file_log_format); for the
+    default format that parser returns the same rows.
+    """
+    match = _match(log_line)
+    if match:
+        g = match.groups()
+        # Apache logs '-' for a response without a body
+        return (file_name, g[0], g[1], g[2], g[3], g[4], g[5], g[6],
+                int(g[7]), int(g[8]) if g[8].isdigit() else 0, g[9], g[10],
+                float(g[11]), upload_date, parse_apache_timestamp(g[3]))
+    return None
+
+def log_format_by_name(name):
+    """Return a registered log format, compiling it from the LOG_FORMATS setting if needed"""
+    log_format = get_log_format(name)
+    if log_format is None and name in app.config['LOG_FORMATS']:
+        log_format = register_log_format(name, app.config['LOG_FORMATS'][name])
+    return log_format
+
+def file_log_format(file_name, sample_lines, conn=None):
+    """Return the log format of a file, detecting it from sample lines on first use
+    
+    The format is chosen once per file and kept in files.log_format, so every
+    line (and every resumed or parallel part of the file) uses the same parser.
+    Given a connection with an open transaction, the format is saved in that
+    transaction instead of one of its own.
+    """
+    for name in app.config['LOG_FORMATS']:
+        log_format_by_name(name)
+    
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT log_format FROM files WHERE file_name = ?', (file_name,)).fetchone()
+        log_format = log_format_by_name(row['log_format']) if row and row['log_format'] else None
+        if log_format is None:
+            log_format = (detect_log_format([line.strip() for line in sample_lines],
+                                            app.config['DEFAULT_LOG_FORMAT'])
+                          or log_format_by_name(app.config['DEFAULT_LOG_FORMAT']))
+            conn.execute('UPDATE files SET log_format = ? WHERE file_name = ?', (log_format.name, file_name))
+            if own_conn:
+                conn.commit()
+        return log_format
+    finally:
+        if own_conn:
+            conn.close()
+
+def set_file_log_format(file_name, name):
+    """Parse a file with the named log format instead of detecting it"""
+    conn = get_db_connection()
+    try:
+        conn.execute('UPDATE files SET log_format = ? WHERE file_name = ?', (name, file_name))
+        conn.commit()
+    finally:
+        conn.close()
+
+def bump_generation(cursor, name):
+    """Increment a counter of the generations table"""
+    cursor.execute('''
+    INSERT INTO generations (name, value) VALUES (?, 1)
+    ON CONFLICT (name) DO UPDATE SET value = value + 1
+    ''', (name,))
+
+def read_generation(cursor, name):
+    """Current value of a counter of the generations table (0 until it is first bumped)"""
+    cursor.execute('SELECT value FROM generations WHERE name = ?', (name,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+class StringInterner:
+    """In-memory cache of strings and files ids used while inserting log rows
+    
+    Repeated values (user agents, APIs, referrers, ...) are resolved to their
+    strings id from memory, so the database is only consulted the first time a
+    value is seen by this ingestion job. New values are added to strings_fts.
+    
+    Deleting a file or resetting the data makes cached ids stale (strings ids
+    are reused after a reset), so writers call begin() before each batch.
+    """
+    
+    # Start over rather than grow without bound on very high-cardinality values
+    max_size = 200000
+    
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.ids = {}
+        self.file_ids = {}
+        self.generation = None
+    
+    def begin(self):
+        """Open the write transaction for a batch, if none is open; returns True if the cache was cleared
+        
+        The 'deletes' generation is read once the write lock is held, so files
+        and strings cannot be deleted between the check and the insert.
+        """
+        if self.cursor.connection.in_transaction:
+            return False
+        self.cursor.execute('BEGIN IMMEDIATE')
+        generation = read_generation(self.cursor, 'deletes')
+        if generation == self.generation:
+            return False
+        self.ids.clear()
+        self.file_ids.clear()
+        self.generation = generation
+        return True
+    
+    def intern(self, value):
+        """Return the strings id for a value, inserting it if it is new"""
+        string_id = self.ids.get(value)
+        if string_id is None:
+            if len(self.ids) >= self.max_size:
+                self.ids.clear()
+            self.cursor.execute('INSERT OR IGNORE INTO strings (value) VALUES (?)', (value,))
+            if self.cursor.rowcount:
+                string_id = self.cursor.lastrowid
+                self.cursor.execute('INSERT INTO strings_fts (rowid, value) VALUES (?, ?)', (string_id, value))
+            else:
+                self.cursor.execute('SELECT id FROM strings WHERE value = ?', (value,))
+                string_id = self.cursor.fetchone()[0]
+            self.ids[value] = string_id
+        return string_id
+    
+    def file_id(self, file_name):
+        """Return the files id for a file name"""
+        file_id = self.file_ids.get(file_name)
+        if file_id is None:
+            self.cursor.execute('SELECT id FROM files WHERE file_name = ?', (file_name,))
+            row = self.cursor.fetchone()
+            if row is None:
+                raise LookupError(f"File {file_name} has been deleted")
+            file_id = self.file_ids[file_name] = row[0]
+        return file_id
+
+@lru_cache(maxsize=65536)
+def ip_key(value):
+    """Key of an IPv4 or IPv6 address that sorts in address order, or None if value is not one
+    
+    The packed address behind its version byte (4 or 6): 5 bytes for IPv4, so
+    the index stays small, and any CIDR block is a single range of keys.
+    IPv4-mapped IPv6 addresses are keyed as the IPv4 address.
+    """
+    try:
+        # Dotted IPv4, by far the most common, without building an ipaddress object
+        return b'\x04' + socket.inet_pton(socket.AF_INET, value)
+    except (OSError, TypeError, ValueError):
+        pass
+    try:
+        address = ipaddress.ip_address(value)
+    except ValueError:
+        return None
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return bytes([address.version]) + address.packed
+
+def ip_key_range(value):
+    """(first, last) ip_key of a CIDR block such as '10.20.0.0/16', or of a single address
+    
+    Raises ValueError if value is neither.
+    """
+    network = ipaddress.ip_network(value.strip(), strict=False)
+    if network.version == 6 and network.network_address.ipv4_mapped and network.prefixlen >= 96:
+        network = ipaddress.ip_network(f'{network.network_address.ipv4_mapped}/{network.prefixlen - 96}')
+    version = bytes([network.version])
+    return version + network.network_address.packed, version + network.broadcast_address.packed
+
+def insert_log_batch(cursor, file_id, batch, interner, aggregates):
+    """Insert a batch of parsed log rows (parse_row / parse_log_row tuples) into log_entries
+    
+    The rows are stored under file_id, looked up by the caller after
+    interner.begin(). Rows that duplicate an already stored entry (see DEDUP_INDEX_SQL) are skipped
+    by SQLite. The rows that were stored are added to aggregates (a LogAggregates),
+    which the caller writes before committing. Returns the number of rows
+    actually inserted.
+    """
+    # Values already interned are looked up without a method call
+    intern = interner.intern
+    known = interner.ids.get
+    rows = [
+        (file_id, row[1], row[2], row[3], row[4],
+         row[5], known(row[6]) or intern(row[6]), known(row[7]) or intern(row[7]), row[8], row[9],
+         known(row[10]) or intern(row[10]), known(row[11]) or intern(row[11]), row[12],
+         known(row[13]) or intern(row[13]), row[14], ip_key(row[1]))
+        for row in batch
+    ]
+    cursor.executemany(f'''
+    INSERT OR IGNORE INTO log_entries ({', '.join(LOG_ENTRY_COLUMNS)})
+    VALUES ({', '.join('?' * len(LOG_ENTRY_COLUMNS))})
+    ''', rows)
+    inserted = cursor.rowcount
+    if inserted:
+        if inserted < len(rows):
+            # The insert holds the write lock until commit, so the rows it stored
+            # are the newest ones, whatever other connections committed before it
+            cursor.execute(f'SELECT {", ".join(LOG_ENTRY_COLUMNS)} FROM log_entries ORDER BY id DESC LIMIT ?',
+                           (inserted,))
+            rows = cursor.fetchall()
+        aggregates.add(rows)
+    return inserted
+
+class LogAggregates:
+    """Rollup, sketch and latency counts of stored rows that are not written yet
+    
+    insert_log_batch adds the rows of every batch, and write() adds the counts
+    to log_rollups, log_sketches and latency_rollups. It must run in the
+    transaction that stored the rows, before it commits. Sketches are decoded,
+    merged and encoded once per write rather than once per batch.
+    """
+    
+    def __init__(self):
+        self.clear()
+    
+    def clear(self):
+        """Forget the counts, e.g. when the rows they came from were rolled back"""
+        self.rows = 0
+        self.rollups = {}
+        self.sketches = {}
+        self.latency = Counter()
+    
+    def add(self, rows):
+        self.rows += len(rows)
+        count_log_rollups(rows, self.rollups)
+        count_log_sketches(rows, self.sketches)
+        count_latency_rollups(rows, self.latency)
     
+    def write(self, cursor):
+        write_log_rollups(cursor, self.rollups)
+        write_log_sketches(cursor, self.sketches)
+        write_latency_rollups(cursor, self.latency)
+        self.clear()
+
+def count_log_rollups(rows, counts=None):
+    """Add stored rows (LOG_ENTRY_COLUMNS tuples) to a {rollup key: [requests, bytes, response time sum, count]} dict"""
+    if counts is None:
+        counts = {}
+    for row in rows:
+        ts_epoch = row[14]
+        key = (row[0], ts_epoch - ts_epoch % ROLLUP_BUCKET_SECONDS if ts_epoch is not None else -1,
+               row[8] if row[8] is not None else 0, row[5] if row[5] is not None else '-')
+        totals = counts.get(key)
+        if totals is None:
+            totals = counts[key] = [0, 0, 0.0, 0]
+        totals[0] += 1
+        totals[1] += row[9] or 0
+        if row[12] is not None:
+            totals[2] += row[12]
+            totals[3] += 1
+    return counts
+
+def write_log_rollups(cursor, counts):
+    """Add count_log_rollups counts to log_rollups"""
+    cursor.executemany(ROLLUP_UPSERT_SQL, [key + tuple(totals) for key, totals in counts.items()])
+
+def sync_analytics_store(conn):
+    """Bring the ANALYTICS_STORE copy of the logs up to date; returns the store, or None if there is none"""
+    if not app.config['ANALYTICS_STORE']:
+        return None
+    return synced_analytics_store(app.config['ANALYTICS_STORE'], conn, log_data_version(conn.cursor()))
+
+def count_log_sketches(rows, counts=None):
+    """Add stored rows (LOG_ENTRY_COLUMNS tuples) to a {(file_id, column, bucket): Counter} dict of SKETCH_KINDS column values
+    
+    Kinds kept for the same column (top and distinct IPs) share its counts.
+    """
+    if counts is None:
+        counts = {}
+    # Group rows per (file, bucket) first: a batch rarely spans more than a bucket
+    groups = {}
+    for row in rows:
+        ts_epoch = row[14]
+        groups.setdefault((row[0], ts_epoch - ts_epoch % SKETCH_BUCKET_SECONDS if ts_epoch is not None else -1),
+                          []).append(row)
+    for column in {column for _, column, _ in SKETCH_KINDS.values()}:
+        position = LOG_ENTRY_COLUMNS.index(column)
+        for (file_id, bucket), group in groups.items():
+            values = [row[position] for row in group]
+            for key in ((file_id, column, bucket), (file_id, column, SKETCH_TOTAL_BUCKET)):
+                counter = counts.get(key)
+                if counter is None:
+                    counter = counts[key] = Counter()
+                counter.update(values)
+    return counts
+
+def write_log_sketches(cursor, counts):
+    """Merge count_log_sketches counts into the stored sketches of every kind"""
+    for (file_id, column, bucket), values in counts.items():
+        for kind, (sketch_class, kind_column, size_key) in SKETCH_KINDS.items():
+            if kind_column != column:
+                continue
+            cursor.execute('SELECT data FROM log_sketches WHERE file_id = ? AND kind = ? AND bucket = ?',
+                           (file_id, kind, bucket))
+            row = cursor.fetchone()
+            sketch = sketch_class.from_bytes(row[0]) if row else sketch_class(app.config[size_key])
+            sketch.update(values)
+            cursor.execute('INSERT OR REPLACE INTO log_sketches (file_id, kind, bucket, data) VALUES (?, ?, ?, ?)',
+                           (file_id, kind, bucket, sketch.to_bytes()))
+
+def lookup_file_ids(cursor, file_names):
+    """Return (ids, missing) for a list of file names: their files.id and the names not found"""
+    ids = {}
+    for file_name in file_names:
+        cursor.execute('SELECT id FROM files WHERE file_name = ?', (file_name,))
+        row = cursor.fetchone()
+        if row:
+            ids[file_name] = row[0]
+    return list(ids.values()), [name for name in file_names if name not in ids]
+
+def count_latency_rollups(rows, counts=None):
+    """Add the response times of stored rows (LOG_ENTRY_COLUMNS tuples) to a Counter of latency_rollups keys"""
+    if counts is None:
+        counts = Counter()
+    counts.update(
+        (row[0], row[14] - row[14] % SKETCH_BUCKET_SECONDS if row[14] is not None else -1,
+         row[6], latency_bin(row[12] * 1000))
+        for row in rows if row[12] is not None
+    )
+    return counts
+
+def write_latency_rollups(cursor, counts):
+    """Add count_latency_rollups counts to latency_rollups"""
+    cursor.executemany(LATENCY_UPSERT_SQL, [key + (count,) for key, count in counts.items()])
+
+def latency_histograms(cursor, file_ids=None, start=None, end=None, api_ids=None):
+    """Merge latency_rollups into a LatencyHistogram per api_id for some files (or all) and a [start, end) window
+    
+    Windows are widened to whole SKETCH_BUCKET_SECONDS buckets.
+    """
+    where = '1=1'
+    params = []
+    if file_ids is not None:
+        where += f' AND file_id IN ({",".join("?" * len(file_ids))})'
+        params.extend(file_ids)
+    if api_ids is not None:
+        where += f' AND api_id IN ({",".join("?" * len(api_ids))})'
+        params.extend(api_ids)
+    if start is not None:
+        where += ' AND bucket >= ?'
+        params.append(start - start % SKETCH_BUCKET_SECONDS)
+    if end is not None:
+        where += ' AND bucket >= 0 AND bucket < ?'
+        params.append(end)
+    cursor.execute(f'''
+    SELECT api_id, bin, SUM(requests)
+    FROM latency_rollups
+    WHERE {where}
+    GROUP BY api_id, bin
+    ''', params)
+    histograms = {}
+    for api_id, index, count in cursor.fetchall():
+        histograms.setdefault(api_id, LatencyHistogram()).add_bin(index, count)
+    return histograms
+
+def top_values(cursor, kind, k, file_ids=None, start=None, end=None):
+    """Approximate top k (value, count, error) of a SKETCH_KINDS kind, from log_sketches
+    
+    Returns (top, guaranteed): count may overestimate by at most error, and
+    guaranteed tells whether these are certainly the top k values (see
+    sketches.SpaceSaving). Interned columns (api_id) are resolved to strings.
+    """
+    sketch = load_sketch(cursor, SKETCH_KINDS[kind][0], kind, file_ids, start, end)
+    if sketch is None:
+        return [], True
+    top = sketch.top(k)
+    if SKETCH_KINDS[kind][1].endswith('_id') and top:
+        ids = [item for item, _, _ in top]
+        cursor.execute(f'SELECT id, value FROM strings WHERE id IN ({",".join("?" * len(ids))})', ids)
+        names = dict(cursor.fetchall())
+        top = [(names.get(item), count, error) for item, count, error in top]
+    return top, sketch.guaranteed(k)
+
+def distinct_count(cursor, kind, file_ids=None, start=None, end=None):
+    """Estimated number of distinct values of a SKETCH_KINDS kind, from log_sketches
+    
+    Any set of files and time window can be asked for; see sketches.HyperLogLog
+    for the error. Windows are widened to whole SKETCH_BUCKET_SECONDS buckets.
+    """
+    sketch = load_sketch(cursor, SKETCH_KINDS[kind][0], kind, file_ids, start, end)
+    return sketch.count() if sketch else 0
+
+def worker_id():
+    """Identify this app process in ingest_jobs.worker"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def create_ingest_job(file_name, content_hash=None, byte_offset=0, priority=0,
+                      status='queued', source='upload'):
+    """Add an ingestion job for an upload, starting at byte_offset of its log stream
+    
+    Queued jobs are picked up by the worker pool, highest priority first and in
+    FIFO order within a priority. Jobs run by the caller itself (source 'stream')
+    are created as 'processing' and owned by this process.
+    """
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    worker = worker_id() if status == 'processing' else None
+    conn = get_db_connection()
     try:
-        # Count total lines for progress tracking
-        total_lines = 0
-        with open(file_path, 'r') as f:
-            for _ in f:
-                total_lines += 1
+        conn.execute('''
+        INSERT OR REPLACE INTO ingest_jobs (file_id, status, priority, source, content_hash, byte_offset,
+                                            worker, created_at, started_at, updated_at)
+        SELECT id, ?, ?, ?, ?, ?, ?, ?, ?, ? FROM files WHERE file_name = ?
+        ''', (status, priority, source, content_hash, byte_offset, worker,
+              now, now if worker else None, now, file_name))
+        conn.commit()
+    finally:
+        conn.close()
+
+def load_ingest_job(file_name):
+    """Return the ingestion job of a file as a dict, or None"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT j.*, f.file_name FROM ingest_jobs j
+        JOIN files f ON f.id = j.file_id
+        WHERE f.file_name = ?
+        ''', (file_name,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+def save_ingest_checkpoint(cursor, file_id, byte_offset, lines_read, record_count, duplicate_count, progress):
+    """Record ingestion progress; must run in the transaction that inserted the rows"""
+    cursor.execute('''
+    UPDATE ingest_jobs
+    SET byte_offset = ?, lines_read = ?, record_count = ?, duplicate_count = ?, progress = ?, updated_at = ?
+    WHERE file_id = ?
+    ''', (byte_offset, lines_read, record_count, duplicate_count, progress,
+          datetime.now().strftime('%Y-%m-%d %H:%M:%S'), file_id))
+
+def finish_ingest_job(cursor, file_id, lines_read, record_count, duplicate_count):
+    """Mark a job completed; runs in the transaction that commits its last rows"""
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    cursor.execute('''
+    UPDATE ingest_jobs
+    SET status = 'completed', progress = 100, lines_read = ?, record_count = ?, duplicate_count = ?,
+        error = NULL, updated_at = ?, finished_at = ?
+    WHERE file_id = ?
+    ''', (lines_read, record_count, duplicate_count, now, now, file_id))
+
+def fail_ingest_job(file_name, error):
+    """Mark a job failed, keeping its checkpoint"""
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    conn = get_db_connection()
+    try:
+        conn.execute('''
+        UPDATE ingest_jobs SET status = 'error', error = ?, updated_at = ?, finished_at = ?
+        WHERE file_id = (SELECT id FROM files WHERE file_name = ?)
+        ''', (error, now, now, file_name))
+        conn.commit()
+    finally:
+        conn.close()
+
+def split_file_ranges(file_path, chunk_size, start=0):
+    """Split a file into (start, end) byte ranges that begin and end on line boundaries"""
+    file_size = os.path.getsize(file_path)
+    ranges = []
+    with open(file_path, 'rb') as f:
+        while start < file_size:
+            # Jump ahead by chunk_size and finish the line we land in
+            f.seek(min(start + chunk_size, file_size))
+            f.readline()
+            end = min(f.tell(), file_size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+def parse_log_range(file_path, start, end, file_name, upload_date, log_format):
+    """Parse the lines in a byte range of a log file with the named format (runs in a worker process)"""
+    parse_row = log_format_by_name(log_format).parse_row
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    
+    rows = []
+    lines = data.decode('utf-8', errors='replace').split('\n')
+    # A trailing newline leaves an empty string that is not a line
+    if lines and lines[-1] == '':
+        lines.pop()
+    
+    for line in lines:
+        row = parse_row(line.strip(), file_name, upload_date)
+        if row:
+            rows.append(row)
+    return rows, len(lines), end
+
+class ProgressReporter:
+    """Publish an ingestion's progress, rate and estimated time left to processing_status
+    
+    Reports are throttled to one per interval seconds, so the ingestion loops can
+    call report() as often as they like.
+    """
+    interval = 0.25
+    
+    def __init__(self, file_name, lines_at_start=0):
+        self.file_name = file_name
+        self.lines_at_start = lines_at_start
+        self.started = time.monotonic()
+        # The first report waits one interval, so the rate is measured over a useful span
+        self.last_report = self.started
+    
+    def report(self, fraction, lines_read, record_count, duplicate_count):
+        now = time.monotonic()
+        if now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        
+        elapsed = now - self.started
+        rows_per_sec = (lines_read - self.lines_at_start) / elapsed if elapsed > 0 else 0
+        eta_seconds = elapsed * (1 - fraction) / fraction if fraction > 0 else None
+        update_processing_status(self.file_name, {
+            'progress': min(int(fraction * 100), 99),
+            'total': lines_read,
+            'processed': record_count,
+            'duplicates': duplicate_count,
+            'rows_per_sec': round(rows_per_sec),
+            'eta_seconds': round(eta_seconds) if eta_seconds is not None else None
+        })
+
+def process_log_file_parallel(file_path, file_name, job=None):
+    """Parse a log file on a process pool and insert the rows from the calling thread
+    
+    The file is split into newline-aligned byte ranges. Ranges are parsed in
+    parallel but inserted in file order, so deduplication keeps the same first
+    occurrence as the single-threaded path and progress moves forward monotonically.
+    With a job (see create_ingest_job), ingestion continues from its checkpoint and
+    each range is committed together with the updated checkpoint (in bulk loads,
+    the range that reaches BULK_LOAD_COMMIT_ROWS rows since the last commit).
+    """
+    start_offset = job['byte_offset'] if job else 0
+    total_bytes = os.path.getsize(file_path) - start_offset
+    ranges = split_file_ranges(file_path, app.config['INGEST_CHUNK_SIZE'], start_offset)
+    workers = max(1, app.config['INGEST_PROCESSES'])
+    with open(file_path, 'rb') as f:
+        sample = list(islice(f, app.config['LOG_FORMAT_SAMPLE_LINES']))
+    log_format = file_log_format(file_name, [line.decode('utf-8', errors='replace') for line in sample]).name
+    
+    conn = get_db_connection()
+    bulk = False
+    try:
+        cursor = conn.cursor()
+        interner = StringInterner(cursor)
+        aggregates = LogAggregates()
         
-        processing_status[file_name]['total'] = total_lines
+        record_count = job['record_count'] if job else 0
+        duplicate_count = job['duplicate_count'] if job else 0
+        total_lines = job['lines_read'] if job else 0
+        current_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        batch_size = 500
         
-        conn = get_db_connection()
+        reporter = ProgressReporter(file_name, total_lines)
+        uncommitted_rows = 0
+        last_pause = time.monotonic()
+        
+        bulk = use_bulk_load(total_bytes)
+        if bulk:
+            begin_bulk_load(conn)
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Keep a bounded window of ranges in flight so parsed rows never
+            # pile up in memory faster than SQLite can absorb them
+            pending_ranges = iter(ranges)
+            in_flight = deque()
+            for start, end in pending_ranges:
+                in_flight.append(executor.submit(parse_log_range, file_path, start, end, file_name, current_date, log_format))
+                if len(in_flight) >= workers * 2:
+                    break
+            
+            while in_flight:
+                rows, line_count, end = in_flight.popleft().result()
+                next_range = next(pending_ranges, None)
+                if next_range:
+                    in_flight.append(executor.submit(parse_log_range, file_path, next_range[0], next_range[1],
+                                                     file_name, current_date, log_format))
+                
+                total_lines += line_count
+                uncommitted_rows += len(rows)
+                for offset in range(0, len(rows), batch_size):
+                    current_batch = rows[offset:offset + batch_size]
+                    interner.begin()
+                    inserted = insert_log_batch(cursor, interner.file_id(file_name), current_batch,
+                                                interner, aggregates)
+                    record_count += inserted
+                    duplicate_count += len(current_batch) - inserted
+                aggregates.write(cursor)
+                
+                fraction = (end - start_offset) / total_bytes if total_bytes else 1
+                progress = int(fraction * 100)
+                reporter.report(fraction, total_lines, record_count, duplicate_count)
+                
+                # Commit at the end of a range, which is the next resume point
+                if not bulk or uncommitted_rows >= app.config['BULK_LOAD_COMMIT_ROWS']:
+                    if job:
+                        save_ingest_checkpoint(cursor, interner.file_id(file_name), end,
+                                               total_lines, record_count, duplicate_count, progress)
+                    conn.commit()
+                    uncommitted_rows = 0
+                    last_pause = yield_write_lock(last_pause)
+        
+        cursor.execute('''
+        UPDATE files SET record_count = ?, duplicate_count = ? WHERE file_name = ?
+        ''', (record_count, duplicate_count, file_name))
+        if job:
+            finish_ingest_job(cursor, interner.file_id(file_name), total_lines, record_count, duplicate_count)
+        if bulk:
+            end_bulk_load(conn)
+        else:
+            conn.commit()
+        
+        return total_lines, record_count, duplicate_count
+    except Exception:
+        if bulk:
+            # Keep what was committed, with its indexes; the job resumes from its checkpoint
+            abort_bulk_load(conn)
+        raise
+    finally:
+        conn.close()
+
+def use_parallel_ingest(file_path):
+    """Decide whether a file is large enough to be worth parsing on a process pool"""
+    # Compressed streams cannot be split into byte ranges
+    return (app.config['PARALLEL_INGEST']
+            and app.config['INGEST_PROCESSES'] > 1
+            and os.path.getsize(file_path) >= app.config['PARALLEL_INGEST_MIN_SIZE']
+            and not is_compressed_file(file_path))
+
+def ingest_log_stream(stream, file_name, total_bytes, counter=None, job=None):
+    """Parse a binary log stream line by line and insert it into the logs table
+    
+    The stream is read exactly once. Progress is reported from the bytes consumed
+    against total_bytes (the file size or the request Content-Length), so there is
+    no need to count lines up front. When the stream is decompressed, pass the
+    CountingReader over the raw input as counter so progress tracks compressed bytes.
+    
+    With a job, the stream must already be positioned at its checkpoint's byte
+    offset; the counts continue from it and every commit (each INGEST_COMMIT_ROWS
+    rows, or BULK_LOAD_COMMIT_ROWS in bulk loads) also updates it.
+    """
+    conn = get_db_connection()
+    bulk = False
+    try:
         cursor = conn.cursor()
+        interner = StringInterner(cursor)
+        aggregates = LogAggregates()
         
-        record_count = 0
+        record_count = job['record_count'] if job else 0
+        duplicate_count = job['duplicate_count'] if job else 0
         current_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        # Create a set to track unique log entries
-        processed_logs = set()
-        processed_line_count = 0
+        processed_line_count = job['lines_read'] if job else 0
+        stream_offset = job['byte_offset'] if job else 0
+        bytes_read = 0
+        progress_percent = 0
+        reporter = ProgressReporter(file_name, processed_line_count)
         
         # Process in smaller batches for better performance
         batch_size = 500
         current_batch = []
-        
-        with open(file_path, 'r') as f:
-            for line in f:
-                processed_line_count += 1
-                
-                # Update progress every 100 lines
-                if processed_line_count % 100 == 0:
-                    progress_percent = int((processed_line_count / total_lines) * 100)
-                    processing_status[file_name]['progress'] = progress_percent
+        uncommitted_rows = 0
+        last_pause = time.monotonic()
+        
+        # The parser is chosen once for the whole file from its first lines
+        sample = list(islice(stream, app.config['LOG_FORMAT_SAMPLE_LINES']))
+        parse_row = file_log_format(
+            file_name, [line.decode('utf-8', errors='replace') for line in sample]).parse_row
+        
+        # Large uploads go in without index maintenance, in larger transactions
+        bulk = use_bulk_load(total_bytes)
+        if bulk:
+            begin_bulk_load(conn)
+        commit_rows = app.config['BULK_LOAD_COMMIT_ROWS' if bulk else 'INGEST_COMMIT_ROWS']
+        
+        for raw_line in chain(sample, stream):
+            processed_line_count += 1
+            stream_offset += len(raw_line)
+            bytes_read += len(raw_line)
+            
+            # Update progress every 100 lines
+            if processed_line_count % 100 == 0 and total_bytes:
+                if counter is not None:
+                    bytes_read = counter.bytes_read
+                progress_percent = min(int((bytes_read / total_bytes) * 100), 99)
+                reporter.report(bytes_read / total_bytes, processed_line_count, record_count, duplicate_count)
+            
+            row = parse_row(raw_line.decode('utf-8', errors='replace').strip(), file_name, current_date)
+            if row:
+                # Add to current batch; duplicates are dropped by SQLite on insert
+                current_batch.append(row)
                 
-                log_data = parse_apache_log(line.strip())
-                if log_data:
-                    # Create a unique identifier for this log entry
-                    log_key = (
-                        log_data['ip'],
-                        log_data['timestamp'],
-                        log_data['request_type'],
-                        log_data['api'],
-                        log_data['status_code']
-                    )
-                    
-                    # Skip if we've already processed this exact log entry
-                    if log_key in processed_logs:
-                        continue
-                    
-                    # Add to our set of processed logs
-                    processed_logs.add(log_key)
+                # Process batch if it reaches the batch size
+                if len(current_batch) >= batch_size:
+                    interner.begin()
+                    inserted = insert_log_batch(cursor, interner.file_id(file_name), current_batch,
+                                                interner, aggregates)
                     
-                    # Add to current batch
-                    current_batch.append((
-                        file_name, log_data['ip'], log_data['remote_log_name'], 
-                        log_data['user_id'], log_data['timestamp'], log_data['request_type'], 
-                        log_data['api'], log_data['protocol'], log_data['status_code'], 
-                        log_data['bytes'], log_data['referrer'], log_data['user_agent'], 
-                        log_data['response_time'], current_date
-                    ))
+                    record_count += inserted
+                    duplicate_count += len(current_batch) - inserted
+                    uncommitted_rows += len(current_batch)
+                    current_batch = []
                     
-                    # Process batch if it reaches the batch size
-                    if len(current_batch) >= batch_size:
-                        cursor.executemany('''
-                        INSERT INTO logs (
-                            file_name, ip, remote_log_name, user_id, timestamp, 
-                            request_type, api, protocol, status_code, bytes, 
-                            referrer, user_agent, response_time, upload_date
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', current_batch)
-                        
-                        record_count += len(current_batch)
-                        current_batch = []
+                    # Commit (with the checkpoint) every commit_rows rows rather than every batch
+                    if uncommitted_rows >= commit_rows:
+                        aggregates.write(cursor)
+                        if job:
+                            save_ingest_checkpoint(cursor, interner.file_id(file_name), stream_offset,
+                                                   processed_line_count, record_count, duplicate_count,
+                                                   progress_percent)
                         conn.commit()
+                        uncommitted_rows = 0
+                        last_pause = yield_write_lock(last_pause)
         
         # Process any remaining entries in the last batch
         if current_batch:
-            cursor.executemany('''
-            INSERT INTO logs (
-                file_name, ip, remote_log_name, user_id, timestamp, 
-                request_type, api, protocol, status_code, bytes, 
-                referrer, user_agent, response_time, upload_date
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', current_batch)
+            interner.begin()
+            inserted = insert_log_batch(cursor, interner.file_id(file_name), current_batch,
+                                        interner, aggregates)
             
-            record_count += len(current_batch)
-            conn.commit()
+            record_count += inserted
+            duplicate_count += len(current_batch) - inserted
+        aggregates.write(cursor)
         
-        # Update the file record with the correct record count
+        # Update the file record with the correct record and duplicate counts
         cursor.execute('''
-        UPDATE files SET record_count = ? WHERE file_name = ?
-        ''', (record_count, file_name))
-        
-        conn.commit()
+        UPDATE files SET record_count = ?, duplicate_count = ? WHERE file_name = ?
+        ''', (record_count, duplicate_count, file_name))
+        if job:
+            finish_ingest_job(cursor, interner.file_id(file_name), processed_line_count, record_count, duplicate_count)
+        
+        if bulk:
+            end_bulk_load(conn)
+        else:
+            conn.commit()
+        return processed_line_count, record_count, duplicate_count
+    except Exception:
+        if bulk:
+            # Keep what was committed, with its indexes; the job resumes from its checkpoint
+            abort_bulk_load(conn)
+        raise
+    finally:
+        conn.close()
+
+def process_log_file_async(file_path, file_name):
+    """Process the log file asynchronously and store data in the database
+    
+    Runs the file's ingestion job (see create_ingest_job) from its checkpoint, so
+    the same call resumes an ingestion interrupted by a restart. The job's
+    content_hash is recorded once ingestion succeeds, so an identical upload can
+    be recognised later.
+    """
+    try:
+        job = load_ingest_job(file_name)
+        start_offset = job['byte_offset'] if job else 0
+        update_processing_status(file_name, {
+            'status': 'processing',
+            'progress': job['progress'] if job else 0,
+            'total': job['lines_read'] if job else 0,
+            'processed': job['record_count'] if job else 0,
+            'duplicates': job['duplicate_count'] if job else 0
+        }, replace=True)
+        
+        if use_parallel_ingest(file_path):
+            total_lines, record_count, duplicate_count = process_log_file_parallel(file_path, file_name, job)
+        else:
+            # Single pass over the saved file, decompressing on the fly if needed;
+            # progress comes from the (compressed) file size
+            with open(file_path, 'rb') as f:
+                total_bytes = os.stat(file_path).st_size
+                compressed = is_compressed_file(file_path)
+                if not compressed:
+                    f.seek(start_offset)
+                    total_bytes -= start_offset
+                counter = CountingReader(f)
+                stream = open_log_stream(counter)
+                if compressed:
+                    # Offsets in compressed logs count decompressed bytes
+                    skip_bytes(stream, start_offset)
+                total_lines, record_count, duplicate_count = ingest_log_stream(
+                    stream, file_name, total_bytes, counter, job)
+        
+        if job and job['content_hash']:
+            record_upload_hash(file_name, job['content_hash'], os.path.getsize(file_path))
+        
+        # Copy the new rows to the analytics store, if one is configured
+        conn = get_db_connection()
+        try:
+            sync_analytics_store(conn)
+        finally:
+            conn.close()
         
         # Update status to completed
-        processing_status[file_name] = {
+        update_processing_status(file_name, {
             'status': 'completed', 
             'progress': 100, 
             'total': total_lines,
-            'processed': record_count
-        }
+            'processed': record_count,
+            'duplicates': duplicate_count
+        }, replace=True)
         
-        # Keep the completed status for at least 5 minutes to ensure the frontend can detect it
-        print(f"Processing completed for {file_name}. Processed {record_count} records.")
+        print(f"Processing completed for {file_name}. Processed {record_count} records, skipped {duplicate_count} duplicates.")
         
     except Exception as e:
         print(f"Error processing file: {e}")
-        processing_status[file_name] = {
+        fail_ingest_job(file_name, str(e))
+        update_processing_status(file_name, {
             'status': 'error', 
             'error': str(e)
-        }
+        }, replace=True)
+
+
+def process_log_file(file_path, file_name):
+    """Process the log file synchronously (legacy function)"""
+    if file_name not in processing_status:
+        update_processing_status(file_name, {'status': 'processing', 'progress': 0, 'total': 0})
+    with open(file_path, 'rb') as f:
+        counter = CountingReader(f)
+        total_lines, record_count, duplicate_count = ingest_log_stream(
+            open_log_stream(counter), file_name, os.stat(file_path).st_size, counter)
+    update_processing_status(file_name, {
+        'status': 'completed',
+        'progress': 100,
+        'total': total_lines,
+        'processed': record_count,
+        'duplicates': duplicate_count
+    }, replace=True)
+    return record_count
+
+@app.route('/')
+def index():
+    """Home page with file upload form"""
+    return render_template('index.html', log_formats=list(LOG_FORMATS) + [
+        name for name in app.config['LOG_FORMATS'] if name not in LOG_FORMATS])
+
+# Live status of the jobs run by this process, newer than the last commit to
+# ingest_jobs (e.g. during bulk loads). Other jobs are read from ingest_jobs.
+processing_status = {}
+# When each finished (completed or error) entry of processing_status finished,
+# in time.monotonic(); entries are dropped PROCESSING_STATUS_TTL seconds later
+processing_finished = {}
+# Notified on every processing_status change, to wake up progress event streams
+processing_status_changed = threading.Condition()
+
+def update_processing_status(file_name, fields, replace=False):
+    """Update the live status of a file and wake up its progress event streams"""
+    with processing_status_changed:
+        if replace or file_name not in processing_status:
+            processing_status[file_name] = {}
+        processing_status[file_name].update(fields)
+        now = time.monotonic()
+        if processing_status[file_name].get('status') in ('completed', 'error'):
+            processing_finished[file_name] = now
+        else:
+            processing_finished.pop(file_name, None)
+        
+        # Event streams have long since sent the final status of expired entries
+        for expired in [name for name, finished in processing_finished.items()
+                        if now - finished > app.config['PROCESSING_STATUS_TTL']]:
+            del processing_status[expired], processing_finished[expired]
+        processing_status_changed.notify_all()
+
+def forget_processing_status(file_name=None):
+    """Drop stale live status for a file (or all files) that is re-queued or deleted"""
+    with processing_status_changed:
+        if file_name is None:
+            processing_status.clear()
+            processing_finished.clear()
+        else:
+            processing_status.pop(file_name, None)
+            processing_finished.pop(file_name, None)
+
+# Worker pool state: the workers wait on ingest_wakeup between queue checks
+ingest_workers = []
+ingest_workers_lock = threading.Lock()
+ingest_wakeup = threading.Event()
+
+def record_upload_hash(file_name, content_hash, size):
+    """Mark an upload as fully ingested by storing its content hash and size"""
+    conn = get_db_connection()
+    try:
+        conn.execute('UPDATE files SET content_hash = ?, size = ? WHERE file_name = ?',
+                     (content_hash, size, file_name))
+        conn.commit()
+    finally:
+        conn.close()
+
+def ingested_upload_sizes():
+    """Sizes of the fully ingested uploads, i.e. the prefixes an appended log could extend"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT DISTINCT size FROM files WHERE content_hash IS NOT NULL AND size > 0')
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+def find_ingested_upload(content_hash, size):
+    """Return the name of an ingested upload with this exact content, or None"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT file_name FROM files WHERE content_hash = ? AND size = ? LIMIT 1',
+                       (content_hash, size))
+        row = cursor.fetchone()
+        return row['file_name'] if row else None
+    finally:
+        conn.close()
+
+def find_append_base(file_path, prefix_digests):
+    """Find the largest ingested upload that this file starts with, as (file_name, size)
+    
+    Only plain text logs whose shared prefix ends on a line boundary qualify;
+    the bytes after that prefix are the appended tail. Returns (None, 0) otherwise.
+    """
+    if not prefix_digests or is_compressed_file(file_path):
+        return None, 0
+    
+    with open(file_path, 'rb') as f:
+        for size in sorted(prefix_digests, reverse=True):
+            file_name = find_ingested_upload(prefix_digests[size], size)
+            if file_name is None:
+                continue
+            f.seek(size - 1)
+            if f.read(1) == b'\n':
+                return file_name, size
+    return None, 0
+
+def save_upload(file):
+    """Save an uploaded file to a temporary path in the upload folder while hashing it
+    
+    Returns (temp_path, content_hash, size, prefix_digests), where prefix_digests
+    maps each ingested upload size to the hash of that many leading bytes.
+    """
+    with tempfile.NamedTemporaryFile('wb', dir=app.config['UPLOAD_FOLDER'], suffix='.part', delete=False) as f:
+        counter = CountingReader(file.stream, copy_to=f, hasher=hashlib.sha256(),
+                                 prefix_sizes=ingested_upload_sizes())
+        counter.drain()
+    return f.name, counter.hasher.hexdigest(), counter.bytes_read, counter.prefix_digests
+
+def worker_alive(worker, startup=False):
+    """Check whether the app process that claimed a job is still running
+    
+    At startup, jobs under this process's own id were left by an earlier process
+    that had the same pid (e.g. in a restarted container).
+    """
+    host, _, pid = worker.rpartition(':')
+    if worker == worker_id():
+        return not startup
+    if host != socket.gethostname():
+        # Processes on other hosts cannot be checked
+        return True
+    if os.name == 'nt':
+        # os.kill would terminate the process on Windows
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return True
+
+def requeue_orphaned_jobs(startup=False):
+    """Requeue jobs whose worker process died so they resume from their checkpoint
+    
+    Stream uploads cannot be replayed, so those jobs are marked failed instead.
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT j.id, j.worker, j.source, j.lines_read, f.file_name
+        FROM ingest_jobs j
+        JOIN files f ON f.id = j.file_id
+        WHERE j.status = 'processing'
+        ''')
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for job in cursor.fetchall():
+            if job['worker'] and worker_alive(job['worker'], startup):
+                continue
+            # Only touch the job if nobody requeued or claimed it in the meantime
+            if job['source'] == 'stream':
+                updated = conn.execute('''
+                UPDATE ingest_jobs SET status = 'error', error = 'Interrupted', updated_at = ?, finished_at = ?
+                WHERE id = ? AND status = 'processing' AND worker IS ?
+                ''', (now, now, job['id'], job['worker'])).rowcount
+                message = f"Processing of {job['file_name']} was interrupted and cannot be resumed"
+            else:
+                updated = conn.execute('''
+                UPDATE ingest_jobs SET status = 'queued', worker = NULL, updated_at = ?
+                WHERE id = ? AND status = 'processing' AND worker IS ?
+                ''', (now, job['id'], job['worker'])).rowcount
+                message = f"Resuming processing of {job['file_name']} after {job['lines_read']} lines"
+            conn.commit()
+            if updated:
+                print(message)
     finally:
-        if 'conn' in locals():
-            conn.close()
-
+        conn.close()
 
-def process_log_file(file_path, file_name):
-    """Process the log file synchronously (legacy function)"""
+def claim_ingest_job():
+    """Take the next queued job for this process, or return None if the queue is empty"""
     conn = get_db_connection()
     try:
+        # BEGIN IMMEDIATE takes the write lock first, so two workers (in any
+        # process) can never claim the same job
+        conn.execute('BEGIN IMMEDIATE')
         cursor = conn.cursor()
-        
-        record_count = 0
-        current_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Create a set to track unique log entries
-        processed_logs = set()
-        
-        with open(file_path, 'r') as f:
-            for line in f:
-                log_data = parse_apache_log(line.strip())
-                if log_data:
-                    # Create a unique identifier for this log entry
-                    log_key = (
-                        log_data['ip'],
-                        log_data['timestamp'],
-                        log_data['request_type'],
-                        log_data['api'],
-                        log_data['status_code']
-                    )
-                    
-                    # Skip if we've already processed this exact log entry
-                    if log_key in processed_logs:
-                        continue
-                    
-                    # Add to our set of processed logs
-                    processed_logs.add(log_key)
-                    
-                    cursor.execute('''
-                    INSERT INTO logs (
-                        file_name, ip, remote_log_name, user_id, timestamp, 
-                        request_type, api, protocol, status_code, bytes, 
-                        referrer, user_agent, response_time, upload_date
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        file_name, log_data['ip'], log_data['remote_log_name'], 
-                        log_data['user_id'], log_data['timestamp'], log_data['request_type'], 
-                        log_data['api'], log_data['protocol'], log_data['status_code'], 
-                        log_data['bytes'], log_data['referrer'], log_data['user_agent'], 
-                        log_data['response_time'], current_date
-                    ))
-                    record_count += 1
-                    
-                    # Commit in batches to avoid long transactions
-                    if record_count % 1000 == 0:
-                        conn.commit()
-        
-        # Update the file record with the correct record count
         cursor.execute('''
-        UPDATE files SET record_count = ? WHERE file_name = ?
-        ''', (record_count, file_name))
+        SELECT j.id, f.file_name FROM ingest_jobs j
+        JOIN files f ON f.id = j.file_id
+        WHERE j.status = 'queued'
+        ORDER BY j.priority DESC, j.id
+        LIMIT 1
+        ''')
+        job = cursor.fetchone()
+        if job:
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            cursor.execute('''
+            UPDATE ingest_jobs
+            SET status = 'processing', worker = ?, started_at = COALESCE(started_at, ?), updated_at = ?
+            WHERE id = ?
+            ''', (worker_id(), now, now, job['id']))
+        conn.commit()
+        return job['file_name'] if job else None
+    finally:
+        conn.close()
+
+def ingest_worker():
+    """Run queued ingestion jobs one at a time, forever"""
+    while True:
+        try:
+            file_name = claim_ingest_job()
+            if file_name is None:
+                # Idle: pick up jobs left behind by app processes that have died
+                requeue_orphaned_jobs()
+        except sqlite3.Error as e:
+            print(f"Error claiming ingestion job: {e}")
+            file_name = None
+        
+        if file_name is None:
+            ingest_wakeup.wait(app.config['INGEST_POLL_INTERVAL'])
+            ingest_wakeup.clear()
+            continue
         
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_name)
+        if not os.path.exists(file_path):
+            print(f"Cannot process {file_name}: the uploaded file is missing")
+            fail_ingest_job(file_name, 'Uploaded file is missing')
+            continue
+        process_log_file_async(file_path, file_name)
+
+def start_ingest_workers():
+    """Start this process's ingestion worker pool (once), after requeueing orphaned jobs"""
+    with ingest_workers_lock:
+        if ingest_workers:
+            return
+        requeue_orphaned_jobs(startup=True)
+        for _ in range(max(1, app.config['INGEST_POOL_SIZE'])):
+            worker = threading.Thread(target=ingest_worker, daemon=True)
+            worker.start()
+            ingest_workers.append(worker)
+
+def enqueue_ingest_job(file_name, content_hash=None, byte_offset=0, priority=0):
+    """Queue an upload for ingestion and wake up the worker pool"""
+    forget_processing_status(file_name)
+    create_ingest_job(file_name, content_hash, byte_offset, priority)
+    start_ingest_workers()
+    ingest_wakeup.set()
+
+def insert_file_record(cursor, filename):
+    """Insert the files record for a new file, renaming it if the name is already taken; returns the name"""
+    cursor.execute('SELECT id FROM files WHERE file_name = ?', (filename,))
+    existing_file = cursor.fetchone()
+    
+    if existing_file:
+        # Generate a unique filename by adding timestamp
+        base_name, extension = os.path.splitext(filename)
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        filename = f"{base_name}_{timestamp}{extension}"
+    
+    # Create initial file record with 0 records
+    current_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    cursor.execute('''
+    INSERT INTO files (file_name, upload_date, record_count)
+    VALUES (?, ?, ?)
+    ''', (filename, current_date, 0))
+    return filename
+
+def register_upload(filename):
+    """Create the files record for a new upload, renaming it if the name is already taken"""
+    conn = get_db_connection()
+    try:
+        filename = insert_file_record(conn.cursor(), filename)
         conn.commit()
-        return record_count
-    except sqlite3.Error as e:
-        conn.rollback()
-        print(f"Database error: {e}")
-        raise
+    except Exception as e:
+        print(f"Error checking file: {e}")
     finally:
         conn.close()
+    return filename
 
-@app.route('/')
-def index():
-    """Home page with file upload form"""
-    return render_template('index.html')
+class LineIngestor:
+    """Store batches of raw log lines that arrive outside of ingestion jobs
+    
+    Used by the live sources (the log follower and the network receiver), which
+    call it from a single background thread of their own. Rows go through the
+    same per-file log format parser and insert_log_batch as uploads.
+    """
+    
+    def __init__(self):
+        # Opened lazily: the connection belongs to the calling thread
+        self.conn = None
+        self.interner = None
+        self.parsers = {}
+    
+    def connect(self):
+        if self.conn is None:
+            self.conn = get_db_connection()
+            self.interner = StringInterner(self.conn.cursor())
+        return self.conn
+    
+    def begin(self):
+        """Open the write transaction for a batch, dropping cached ids if files or strings were deleted"""
+        if self.interner.begin():
+            self.parsers.clear()
+    
+    def file_id(self, file_name):
+        """Return the files id for a live source, creating its record if needed (call after begin)"""
+        cursor = self.connect().cursor()
+        cursor.execute('SELECT id FROM files WHERE file_name = ?', (file_name,))
+        row = cursor.fetchone()
+        if row is None:
+            insert_file_record(cursor, file_name)
+            return cursor.lastrowid
+        return row['id']
+    
+    def insert_lines(self, cursor, file_id, file_name, lines):
+        """Parse and insert raw lines (bytes) for a files record; returns the rows inserted"""
+        current_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        lines = [line.decode('utf-8', errors='replace').strip() for line in lines]
+        parse_row = self.parsers.get(file_id)
+        if parse_row is None:
+            # Detected from the first batch the source delivers
+            parse_row = self.parsers[file_id] = file_log_format(file_name, lines, self.conn).parse_row
+        batch = []
+        for line in lines:
+            row = parse_row(line, file_name, current_date)
+            if row:
+                batch.append(row)
+        if not batch:
+            return 0
+        aggregates = LogAggregates()
+        inserted = insert_log_batch(cursor, file_id, batch, self.interner, aggregates)
+        aggregates.write(cursor)
+        cursor.execute('''
+        UPDATE files SET record_count = record_count + ?,
+                         duplicate_count = COALESCE(duplicate_count, 0) + ?
+        WHERE id = ?
+        ''', (inserted, len(batch) - inserted, file_id))
+        return inserted
+    
+    def rollback(self):
+        self.conn.rollback()
+        # The interner may have cached ids of strings that were rolled back
+        self.interner = StringInterner(self.conn.cursor())
 
-import threading
+class TailIngestor(LineIngestor):
+    """Store the lines delivered by the LogFollower, one transaction per batch
+    
+    Each followed path gets its own files record, named after the file. The
+    follower's state is written to tail_state together with the rows, so after
+    a restart it resumes right after the last stored line.
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.file_ids = {}
+    
+    def load_state(self, path):
+        """Return the saved follower state for a path, or None"""
+        row = self.connect().execute(
+            'SELECT file_id, device, inode, byte_offset FROM tail_state WHERE path = ?', (path,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row['file_id'] is not None:
+            self.file_ids[path] = row['file_id']
+        return {'device': row['device'], 'inode': row['inode'], 'offset': row['byte_offset']}
+    
+    def file_name(self, path):
+        """Return the files record name for a path, creating the record if needed (call after begin)"""
+        cursor = self.connect().cursor()
+        file_id = self.file_ids.get(path)
+        if file_id is not None:
+            cursor.execute('SELECT file_name FROM files WHERE id = ?', (file_id,))
+            row = cursor.fetchone()
+            if row:
+                return row['file_name']
+        # New path, or its data was deleted from the dashboard: start a new record
+        file_name = insert_file_record(cursor, os.path.basename(path))
+        self.file_ids[path] = cursor.lastrowid
+        return file_name
+    
+    def __call__(self, path, lines, state):
+        cursor = self.connect().cursor()
+        try:
+            self.begin()
+            if lines:
+                file_name = self.file_name(path)
+                self.insert_lines(cursor, self.file_ids[path], file_name, lines)
+            cursor.execute('''
+            INSERT OR REPLACE INTO tail_state (path, file_id, device, inode, byte_offset, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', (path, self.file_ids.get(path), state['device'], state['inode'], state['offset'],
+                  datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            self.conn.commit()
+        except Exception:
+            self.rollback()
+            raise
 
-# Global variable to track processing status
-processing_status = {}
+class ReceiverIngestor(LineIngestor):
+    """Store the lines delivered by the LogReceiver under one files record"""
+    
+    def __init__(self, file_name):
+        super().__init__()
+        self.file_name = file_name
+    
+    def __call__(self, lines):
+        cursor = self.connect().cursor()
+        try:
+            # Looked up per batch, under the write lock, so the record is recreated if it is deleted
+            self.begin()
+            inserted = self.insert_lines(cursor, self.file_id(self.file_name), self.file_name, lines)
+            self.conn.commit()
+            return inserted
+        except Exception:
+            self.rollback()
+            raise
+
+def start_log_follower():
+    """Follow the TAIL_PATHS log files in a background thread, if any are configured"""
+    if not app.config['TAIL_PATHS']:
+        return None
+    ingestor = TailIngestor()
+    follower = LogFollower(app.config['TAIL_PATHS'], ingestor, ingestor.load_state,
+                           poll_interval=app.config['TAIL_POLL_INTERVAL'],
+                           batch_lines=app.config['TAIL_BATCH_LINES'])
+    follower.start()
+    return follower
+
+# Network log receiver of this process, if one is configured
+log_receiver = None
+
+def start_log_receiver():
+    """Listen for log lines on RECEIVER_TCP_PORT / RECEIVER_UDP_PORT, if either is configured"""
+    global log_receiver
+    if app.config['RECEIVER_TCP_PORT'] is None and app.config['RECEIVER_UDP_PORT'] is None:
+        return None
+    receiver = LogReceiver(ReceiverIngestor(app.config['RECEIVER_FILE_NAME']),
+                           host=app.config['RECEIVER_HOST'],
+                           tcp_port=app.config['RECEIVER_TCP_PORT'],
+                           udp_port=app.config['RECEIVER_UDP_PORT'],
+                           queue_size=app.config['RECEIVER_QUEUE_SIZE'],
+                           batch_lines=app.config['RECEIVER_BATCH_LINES'],
+                           flush_interval=app.config['RECEIVER_FLUSH_INTERVAL'])
+    try:
+        receiver.start()
+    except OSError as e:
+        print(f"Cannot start the log receiver: {e}")
+        return None
+    log_receiver = receiver
+    return receiver
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -298,79 +1974,203 @@ def upload_file():
         flash('No selected file', 'danger')
         return redirect(request.url)
     
+    # Optional: the log format to parse with instead of detecting it
+    log_format = request.form.get('log_format') or None
+    if log_format and log_format_by_name(log_format) is None:
+        flash(f'Unknown log format {log_format}', 'danger')
+        return redirect(url_for('index'))
+    
     if file:
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+        temp_path, content_hash, size, prefix_digests = save_upload(file)
         
-        # Check if file with this name already exists and generate unique name if needed
-        conn = get_db_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('SELECT id FROM files WHERE file_name = ?', (filename,))
-            existing_file = cursor.fetchone()
-            
-            if existing_file:
-                # Generate a unique filename by adding timestamp
-                base_name, extension = os.path.splitext(filename)
-                timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-                filename = f"{base_name}_{timestamp}{extension}"
-                # Rename the file
-                new_file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                os.rename(file_path, new_file_path)
-                file_path = new_file_path
-            
-            # Create initial file record with 0 records
-            current_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            cursor.execute('''
-            INSERT INTO files (file_name, upload_date, record_count)
-            VALUES (?, ?, ?)
-            ''', (filename, current_date, 0))
-            conn.commit()
-        except Exception as e:
-            print(f"Error checking file: {e}")
-        finally:
-            conn.close()
+        # Identical content was already ingested: nothing to parse or insert
+        existing_file = find_ingested_upload(content_hash, size)
+        if existing_file:
+            os.remove(temp_path)
+            flash(f'This file was already processed as {existing_file}; showing the existing results.', 'info')
+            return redirect(url_for('dashboard'))
+        
+        # An earlier upload plus new lines: only the tail needs to be ingested
+        base_file, start_offset = find_append_base(temp_path, prefix_digests)
         
-        # Start processing in background thread
-        processing_status[filename] = {'status': 'processing', 'progress': 0, 'total': 0}
-        thread = threading.Thread(target=process_log_file_async, args=(file_path, filename))
-        thread.daemon = True
-        thread.start()
+        filename = register_upload(secure_filename(file.filename))
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        os.replace(temp_path, file_path)
+        if log_format:
+            set_file_log_format(filename, log_format)
+        if base_file:
+            flash(f'This file extends {base_file}; only the {size - start_offset} new bytes are processed.', 'info')
+        
+        # Queue for processing by the worker pool; higher priorities go first
+        enqueue_ingest_job(filename, content_hash, start_offset, request.form.get('priority', 0, type=int))
         
         # Redirect to index page with processing status
         return redirect(url_for('index', processing=filename))
 
 
+@app.route('/upload/stream', methods=['POST', 'PUT'])
+def upload_stream():
+    """Ingest a raw log body while it is still being uploaded
+    
+    The request body is the log file itself (not multipart, optionally gzip,
+    bzip2, xz or zstd compressed), e.g.
+    ``curl -T access.log 'http://host:5000/upload/stream?filename=access.log'``.
+    Rows are parsed and inserted as the body arrives and a copy is kept in the
+    upload folder so the file can be managed like any other upload. The body is
+    hashed on the way in, so a later identical upload to /upload is skipped.
+    The log format is detected unless a log_format query parameter names one.
+    """
+    filename = secure_filename(request.args.get('filename') or request.headers.get('X-File-Name', ''))
+    if not filename:
+        return jsonify({'status': 'error', 'error': 'Missing filename'}), 400
+    log_format = request.args.get('log_format')
+    if log_format and log_format_by_name(log_format) is None:
+        return jsonify({'status': 'error', 'error': f'Unknown log format {log_format}'}), 400
+    
+    filename = register_upload(filename)
+    if log_format:
+        set_file_log_format(filename, log_format)
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    update_processing_status(filename, {'status': 'processing', 'progress': 0, 'total': 0}, replace=True)
+    # Requeue orphaned jobs before this process owns a running job of its own
+    start_ingest_workers()
+    create_ingest_job(filename, status='processing', source='stream')
+    
+    try:
+        with open(file_path, 'wb') as copy_to:
+            # Keep the upload exactly as sent (compressed or not) while parsing it
+            counter = CountingReader(request.stream, copy_to=copy_to, hasher=hashlib.sha256())
+            total_lines, record_count, duplicate_count = ingest_log_stream(
+                open_log_stream(counter), filename, request.content_length, counter,
+                load_ingest_job(filename))
+            counter.drain()
+        record_upload_hash(filename, counter.hasher.hexdigest(), counter.bytes_read)
+    except Exception as e:
+        print(f"Error processing file: {e}")
+        fail_ingest_job(filename, str(e))
+        update_processing_status(filename, {'status': 'error', 'error': str(e)}, replace=True)
+        return jsonify(processing_status[filename]), 500
+    
+    update_processing_status(filename, {
+        'status': 'completed',
+        'progress': 100,
+        'total': total_lines,
+        'processed': record_count,
+        'duplicates': duplicate_count
+    }, replace=True)
+    return jsonify(dict(processing_status[filename], file_name=filename))
+
+
+def ingest_status(file_name):
+    """Current processing status of a file as a dict
+    
+    Jobs run by this process are answered from processing_status without touching
+    the database; anything else comes from its ingest_jobs row.
+    """
+    with processing_status_changed:
+        if file_name in processing_status:
+            return dict(processing_status[file_name])
+    
+    job = load_ingest_job(file_name)
+    if job:
+        status = {
+            'status': job['status'],
+            'progress': job['progress'],
+            'total': job['lines_read'],
+            'processed': job['record_count'],
+            'duplicates': job['duplicate_count']
+        }
+        if job['status'] == 'queued':
+            status['queue_position'] = ingest_queue_position(job)
+        elif job['status'] == 'error':
+            status['error'] = job['error']
+        return status
+    
+    # Files ingested before the job queue existed: check if the file has records
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT record_count, content_hash FROM files WHERE file_name = ?', (file_name,))
+        file_data = cursor.fetchone()
+        
+        if file_data and (file_data['record_count'] > 0 or file_data['content_hash']):
+            # File exists and has been processed
+            return {
+                'status': 'completed',
+                'progress': 100,
+                'processed': file_data['record_count']
+            }
+        return {'status': 'unknown'}
+    finally:
+        conn.close()
+
 @app.route('/processing_status/<file_name>')
 def get_processing_status(file_name):
     """Get the processing status of a file"""
-    if file_name in processing_status:
-        status = processing_status[file_name]
-        print(f"Status for {file_name}: {status['status']}")
-        return jsonify(status)
-    else:
-        # Check if the file exists and has records
-        conn = get_db_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('SELECT record_count FROM files WHERE file_name = ?', (file_name,))
-            file_data = cursor.fetchone()
+    try:
+        return jsonify(ingest_status(file_name))
+    except sqlite3.Error as e:
+        print(f"Error checking file status: {e}")
+        return jsonify({'status': 'unknown'})
+
+@app.route('/processing_status/<file_name>/events')
+def processing_status_events(file_name):
+    """Stream the processing status of a file as Server-Sent Events until it finishes
+    
+    Each event is named after the status (queued, processing, completed, unknown,
+    or failed for status error, since EventSource reserves the error event for
+    connection errors) and carries the same JSON as /processing_status, plus
+    rows_per_sec and eta_seconds while processing. Jobs run by this process push every update as
+    the ingestion loop reports it; other jobs are re-read from the database once
+    per INGEST_POLL_INTERVAL.
+    """
+    def changed_locally(status):
+        live = processing_status.get(file_name)
+        return live is not None and live != status
+    
+    def generate():
+        yield 'retry: 2000\n\n'
+        last_status = None
+        last_sent = time.monotonic()
+        while True:
+            try:
+                status = ingest_status(file_name)
+            except sqlite3.Error as e:
+                print(f"Error checking file status: {e}")
+                status = {'status': 'unknown'}
             
-            if file_data and file_data['record_count'] > 0:
-                # File exists and has been processed
-                return jsonify({
-                    'status': 'completed',
-                    'progress': 100,
-                    'processed': file_data['record_count']
-                })
-            else:
-                return jsonify({'status': 'unknown'})
-        except Exception as e:
-            print(f"Error checking file status: {e}")
-            return jsonify({'status': 'unknown'})
-        finally:
-            conn.close()
+            if status != last_status:
+                event = 'failed' if status['status'] == 'error' else status['status']
+                yield f"event: {event}\ndata: {json.dumps(status)}\n\n"
+                last_status = status
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent > 15:
+                # Comment line so proxies do not drop an idle connection
+                yield ': keep-alive\n\n'
+                last_sent = time.monotonic()
+            
+            if status['status'] in ('completed', 'error', 'unknown'):
+                return
+            
+            with processing_status_changed:
+                processing_status_changed.wait_for(lambda: changed_locally(status),
+                                                   timeout=app.config['INGEST_POLL_INTERVAL'])
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def ingest_queue_position(job):
+    """Number of queued jobs that will run before this one"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT COUNT(*) FROM ingest_jobs
+        WHERE status = 'queued' AND (priority > ? OR (priority = ? AND id < ?))
+        ''', (job['priority'], job['priority'], job['id']))
+        return cursor.fetchone()[0]
+    finally:
+        conn.close()
 
 @app.route('/dashboard')
 def dashboard():
@@ -379,40 +2179,79 @@ def dashboard():
     try:
         cursor = conn.cursor()
         
-        # Get total log count
-        cursor.execute('SELECT COUNT(*) FROM logs')
-        total_logs = cursor.fetchone()[0]
-        
-        # Get unique IP count
-        cursor.execute('SELECT COUNT(DISTINCT ip) FROM logs')
-        unique_ips = cursor.fetchone()[0]
-        
-        # Get error response count (status >= 400)
-        cursor.execute('SELECT COUNT(*) FROM logs WHERE status_code >= 400')
-        error_count = cursor.fetchone()[0]
+        # Get total log count and error response count (status >= 400) from the rollups
+        cursor.execute('''
+        SELECT 
+            COALESCE(SUM(requests), 0) as total_logs,
+            COALESCE(SUM(CASE WHEN status_code >= 400 THEN requests ELSE 0 END), 0) as error_count
+        FROM log_rollups
+        ''')
+        totals = cursor.fetchone()
+        total_logs = totals['total_logs']
+        error_count = totals['error_count']
+        
+        # Unique IPs, overall and per file: estimated from the distinct-count sketches
+        # unless exact counts are configured or asked for (?exact=1)
+        exact = app.config['EXACT_DISTINCT_COUNTS'] or request.args.get('exact') == '1'
+        store = sync_analytics_store(conn) if exact else None
+        if store is not None:
+            unique_ips = store.query('SELECT COUNT(DISTINCT ip) FROM logs')[0][0]
+        elif exact:
+            cursor.execute('SELECT COUNT(DISTINCT ip) FROM log_entries')
+            unique_ips = cursor.fetchone()[0]
+        else:
+            cursor.execute('''
+            SELECT f.file_name, s.data
+            FROM log_sketches s
+            JOIN files f ON f.id = s.file_id
+            WHERE s.kind = 'distinct_ip' AND s.bucket = ?
+            ''', (SKETCH_TOTAL_BUCKET,))
+            ip_sketches = {row['file_name']: HyperLogLog.from_bytes(row['data']) for row in cursor.fetchall()}
+            file_unique_ips = {file_name: sketch.count() for file_name, sketch in ip_sketches.items()}
+            merged = None
+            for sketch in ip_sketches.values():
+                merged = sketch if merged is None else merged.merge(sketch)
+            unique_ips = merged.count() if merged else 0
         
         # Get all files first (including those with 0 records that are still processing)
         cursor.execute('''
         SELECT 
+            id,
             file_name, 
             upload_date, 
-            record_count
+            record_count,
+            duplicate_count
         FROM files
         ORDER BY upload_date DESC
         ''')
         files_basic = cursor.fetchall()
         
         # Get detailed stats for files that have logs
+        if store is not None:
+            file_names = {row['id']: row['file_name'] for row in files_basic}
+            file_stats = {file_names[file_id]: {'unique_ips': count} for file_id, count in
+                          store.query('SELECT file_id, COUNT(DISTINCT ip) FROM logs GROUP BY file_id')
+                          if file_id in file_names}
+        elif exact:
+            cursor.execute('''
+            SELECT 
+                f.file_name, 
+                COUNT(DISTINCT l.ip) as unique_ips
+            FROM files f 
+            JOIN log_entries l ON l.file_id = f.id 
+            GROUP BY f.file_name
+            ''')
+            file_stats = {row['file_name']: dict(row) for row in cursor.fetchall()}
+        else:
+            file_stats = {file_name: {'unique_ips': count} for file_name, count in file_unique_ips.items()}
         cursor.execute('''
-        SELECT 
-            f.file_name, 
-            COUNT(DISTINCT l.ip) as unique_ips,
-            SUM(CASE WHEN l.status_code >= 400 THEN 1 ELSE 0 END) as error_count
-        FROM files f 
-        JOIN logs l ON f.file_name = l.file_name 
+        SELECT f.file_name, SUM(r.requests) as error_count
+        FROM log_rollups r
+        JOIN files f ON f.id = r.file_id
+        WHERE r.status_code >= 400
         GROUP BY f.file_name
         ''')
-        file_stats = {row['file_name']: row for row in cursor.fetchall()}
+        error_counts = {row['file_name']: row['error_count'] for row in cursor.fetchall()}
         
         # Combine the data
         files = []
@@ -424,7 +2263,7 @@ def dashboard():
             if file['file_name'] in file_stats:
                 stats = file_stats[file['file_name']]
                 file_info['unique_ips'] = stats['unique_ips']
-                file_info['error_count'] = stats['error_count']
+                file_info['error_count'] = error_counts.get(file['file_name'], 0)
             else:
                 file_info['unique_ips'] = 0
                 file_info['error_count'] = 0
@@ -434,8 +2273,8 @@ def dashboard():
         # Get data for analytics charts
         # Status code distribution
         cursor.execute('''
-        SELECT status_code, COUNT(*) as count 
-        FROM logs 
+        SELECT status_code, SUM(requests) as count 
+        FROM log_rollups 
         GROUP BY status_code 
         ORDER BY count DESC
         ''')
@@ -443,32 +2282,16 @@ def dashboard():
         
         # Request type distribution
         cursor.execute('''
-        SELECT request_type, COUNT(*) as count 
-        FROM logs 
+        SELECT request_type, SUM(requests) as count 
+        FROM log_rollups 
         GROUP BY request_type 
         ORDER BY count DESC
         ''')
         request_data = cursor.fetchall()
         
-        # Top 10 IPs
-        cursor.execute('''
-        SELECT ip, COUNT(*) as count 
-        FROM logs 
-        GROUP BY ip 
-        ORDER BY count DESC 
-        LIMIT 10
-        ''')
-        ip_data = cursor.fetchall()
-        
-        # Top 5 APIs
-        cursor.execute('''
-        SELECT api, COUNT(*) as count 
-        FROM logs 
-        GROUP BY api 
-        ORDER BY count DESC 
-        LIMIT 5
-        ''')
-        api_data = cursor.fetchall()
+        # Top 10 IPs and Top 5 APIs, merged from the per-file sketches
+        ip_data, ip_guaranteed = top_values(cursor, 'top_ip', 10)
+        api_data, api_guaranteed = top_values(cursor, 'top_api', 5)
         
         # Create charts using Plotly
         status_labels = [str(row['status_code']) for row in status_data]
@@ -483,16 +2306,16 @@ def dashboard():
         request_fig.update_layout(title='Request Type Distribution')
         request_chart = json.dumps(request_fig, cls=plotly.utils.PlotlyJSONEncoder)
         
-        ip_addresses = [row['ip'] for row in ip_data]
-        ip_counts = [row['count'] for row in ip_data]
+        ip_addresses = [ip for ip, _, _ in ip_data]
+        ip_counts = [count for _, count, _ in ip_data]
         ip_fig = go.Figure(data=[go.Bar(x=ip_addresses, y=ip_counts)])
-        ip_fig.update_layout(title='Top 10 IPs')
+        ip_fig.update_layout(title='Top 10 IPs' if ip_guaranteed else 'Top 10 IPs (approximate)')
         ip_chart = json.dumps(ip_fig, cls=plotly.utils.PlotlyJSONEncoder)
         
-        apis = [row['api'] for row in api_data]
-        api_counts = [row['count'] for row in api_data]
+        apis = [api for api, _, _ in api_data]
+        api_counts = [count for _, count, _ in api_data]
         api_fig = go.Figure(data=[go.Bar(x=apis, y=api_counts)])
-        api_fig.update_layout(title='Top 5 APIs')
+        api_fig.update_layout(title='Top 5 APIs' if api_guaranteed else 'Top 5 APIs (approximate)')
         api_chart = json.dumps(api_fig, cls=plotly.utils.PlotlyJSONEncoder)
         
         return render_template('dashboard.html', 
@@ -511,66 +2334,286 @@ def dashboard():
     finally:
         conn.close()
 
+def parse_time_param(value, end=False):
+    """Convert a 'YYYY-MM-DD' or 'YYYY-MM-DDTHH:MM[:SS]' query value to epoch seconds
+    
+    Values without an offset are taken as UTC. A bare date used as an end bound
+    covers that whole day.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return int(parsed.timestamp())
+
+# Request arguments that filter on the client IP: ip is a substring match, the
+# others use the indexed ip_key
+IP_FILTERS = ('ip', 'ip_cidr', 'ip_from', 'ip_to', 'ip_exact')
+
+# Request arguments searched with strings_fts -> the log_entries columns they
+# match: search any of api, referrer and user agent, the others just one
+SEARCH_FILTERS = {
+    'search': ('api_id', 'referrer_id', 'user_agent_id'),
+    'api_search': ('api_id',),
+    'referrer_search': ('referrer_id',),
+    'user_agent_search': ('user_agent_id',),
+}
+
+def search_terms(text):
+    """FTS5 terms for the words of a search filter value; a word ending in * matches as a prefix
+    
+    Words are quoted, so FTS5 syntax in them is taken literally and a word like
+    /api/users matches those tokens next to each other. Matching ignores case.
+    Raises ValueError if there is nothing to search for.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*')
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ('*' if prefix else ''))
+    if not terms:
+        raise ValueError(f'Nothing to search for in: {text}')
+    return terms
+
+def build_log_filters(args):
+    """Build the WHERE clause shared by the log views from request arguments
+    
+    Returns (where_sql, params, filters) where filters echoes the raw values
+    back for templates and API responses. Time bounds (start/end) become
+    range predicates on the indexed ts_epoch column; end is exclusive.
+    
+    ip matches any part of the address. ip_cidr takes one or more comma
+    separated CIDR blocks (or addresses), ip_from/ip_to an inclusive range and
+    ip_exact one address, IPv4 or IPv6; these seek on the ip_key index. Raises
+    ValueError for values that are not addresses or blocks.
+    
+    search, api_search, referrer_search and user_agent_search are word
+    searches (see search_terms) through strings_fts, so they look at each
+    distinct value once rather than at every row. Every word must occur: in
+    the one column, or for search in any of the three.
+    """
+    filters = {name: args.get(name, '') for name in
+               ('file_name', 'status_code', 'request_type', 'start', 'end') + IP_FILTERS + tuple(SEARCH_FILTERS)}
+    where = '1=1'
+    params = []
+    
+    if filters['file_name']:
+        where += ' AND file_name = ?'
+        params.append(filters['file_name'])
+    
+    if filters['status_code']:
+        status_code = filters['status_code']
+        where += ' AND status_code = ?'
+        params.append(int(status_code) if status_code.isdigit() else status_code)
+    
+    if filters['ip']:
+        where += ' AND ip LIKE ?'
+        params.append(f"%{filters['ip']}%")
+    
+    ip_where = []
+    if filters['ip_cidr']:
+        try:
+            ranges = [ip_key_range(block) for block in filters['ip_cidr'].split(',') if block.strip()]
+        except ValueError:
+            raise ValueError(f"Invalid CIDR block in ip_cidr: {filters['ip_cidr']}")
+        if ranges:
+            ip_where.append('(' + ' OR '.join(['ip_key BETWEEN ? AND ?'] * len(ranges)) + ')')
+            for first, last in ranges:
+                params.extend((first, last))
+    for name, condition in (('ip_from', 'ip_key >= ?'), ('ip_to', 'ip_key <= ?'), ('ip_exact', 'ip_key = ?')):
+        if filters[name]:
+            key = ip_key(filters[name].strip())
+            if key is None:
+                raise ValueError(f'Invalid IP address in {name}: {filters[name]}')
+            ip_where.append(condition)
+            params.append(key)
+    if ip_where:
+        # ip_key is not part of the logs view, so match on the ids it selects
+        where += f" AND id IN (SELECT id FROM log_entries WHERE {' AND '.join(ip_where)})"
+    
+    for name, columns in SEARCH_FILTERS.items():
+        if not filters[name].strip():
+            continue
+        terms = search_terms(filters[name])
+        # Words may match different columns of a row, so each is looked up on its own
+        for query in terms if len(columns) > 1 else [' '.join(terms)]:
+            # One indexed lookup per column (an OR of them would scan log_entries)
+            matches = ' UNION ALL '.join(
+                f'SELECT id FROM log_entries WHERE {column} IN (SELECT rowid FROM strings_fts WHERE strings_fts MATCH ?)'
+                for column in columns)
+            where += f' AND id IN ({matches})'
+            params.extend([query] * len(columns))
+    
+    if filters['request_type']:
+        where += ' AND request_type = ?'
+        params.append(filters['request_type'])
+    
+    start = parse_time_param(filters['start'])
+    if start is not None:
+        where += ' AND ts_epoch >= ?'
+        params.append(start)
+    
+    end = parse_time_param(filters['end'], end=True)
+    if end is not None:
+        where += ' AND ts_epoch < ?'
+        params.append(end)
+    
+    return where, params, filters
+
+# Filtered row counts for /logs and /api/logs that log_rollups cannot answer:
+# (where, params) -> (log_data_version when counted, count), oldest first
+log_count_cache = {}
+log_count_cache_lock = threading.Lock()
+LOG_COUNT_CACHE_SIZE = 256
+
+def log_data_version(cursor):
+    """(highest log id, 'deletes' generation): any insert raises the first, any delete bumps the second
+    
+    Ids are never reused (AUTOINCREMENT), and both are single index lookups.
+    """
+    cursor.execute('''
+    SELECT (SELECT COALESCE(MAX(id), 0) FROM log_entries),
+           (SELECT COALESCE(MAX(value), 0) FROM generations WHERE name = 'deletes')
+    ''')
+    return tuple(cursor.fetchone())
+
+def count_log_rows(cursor, where, params, filters):
+    """Number of logs matching build_log_filters output, without scanning them where possible
+    
+    Filters on file, status code, request type and minute-aligned time bounds
+    are summed from log_rollups. Others (IP and search filters) are counted once per filter
+    and cached; when rows have only been added since, just the new ones are counted.
+    """
+    start = parse_time_param(filters['start'])
+    end = parse_time_param(filters['end'], end=True)
+    if (not any(filters[name] for name in IP_FILTERS + tuple(SEARCH_FILTERS))
+            and all(bound is None or bound % ROLLUP_BUCKET_SECONDS == 0 for bound in (start, end))):
+        rollup_where = '1=1'
+        rollup_params = []
+        if filters['file_name']:
+            rollup_where += ' AND file_id = (SELECT id FROM files WHERE file_name = ?)'
+            rollup_params.append(filters['file_name'])
+        if filters['status_code']:
+            status_code = filters['status_code']
+            rollup_where += ' AND status_code = ?'
+            rollup_params.append(int(status_code) if status_code.isdigit() else status_code)
+        if filters['request_type']:
+            rollup_where += ' AND request_type = ?'
+            rollup_params.append(filters['request_type'])
+        if start is not None:
+            rollup_where += ' AND bucket >= ?'
+            rollup_params.append(start)
+        if end is not None:
+            rollup_where += ' AND bucket >= 0 AND bucket < ?'
+            rollup_params.append(end)
+        cursor.execute(f'SELECT COALESCE(SUM(requests), 0) FROM log_rollups WHERE {rollup_where}', rollup_params)
+        return cursor.fetchone()[0]
+    
+    key = (where, tuple(params))
+    version = log_data_version(cursor)
+    with log_count_cache_lock:
+        cached = log_count_cache.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+    
+    if cached and cached[0][1] == version[1]:
+        # Nothing was deleted since, so the rows added are exactly those above the old highest id
+        cursor.execute(f'SELECT COUNT(*) FROM logs WHERE {where} AND id > ?', params + [cached[0][0]])
+        count = cached[1] + cursor.fetchone()[0]
+    else:
+        cursor.execute(f'SELECT COUNT(*) FROM logs WHERE {where}', params)
+        count = cursor.fetchone()[0]
+    
+    with log_count_cache_lock:
+        log_count_cache.pop(key, None)
+        log_count_cache[key] = (version, count)
+        while len(log_count_cache) > LOG_COUNT_CACHE_SIZE:
+            log_count_cache.pop(next(iter(log_count_cache)))
+    return count
+
+def fetch_log_page(cursor, where, params, per_page, before=None, after=None, columns='*'):
+    """One page of logs matching where, newest (highest id) first, by keyset on id
+    
+    before gives the page of rows below that id, after the page just above it;
+    neither gives the newest page. Seeking on the primary key costs the same
+    at any depth. columns is the select list. Returns (rows, has_older, has_newer).
+    """
+    if after is not None:
+        cursor.execute(f'SELECT {columns} FROM logs WHERE {where} AND id > ? ORDER BY id ASC LIMIT ?',
+                       params + [after, per_page + 1])
+        rows = cursor.fetchall()
+        return rows[:per_page][::-1], after > 0, len(rows) > per_page
+    
+    if before is not None:
+        where += ' AND id < ?'
+        params = params + [before]
+    cursor.execute(f'SELECT {columns} FROM logs WHERE {where} ORDER BY id DESC LIMIT ?', params + [per_page + 1])
+    rows = cursor.fetchall()
+    return rows[:per_page], len(rows) > per_page, before is not None
+
 @app.route('/logs')
 def view_logs():
-    """View parsed logs with filtering options"""
+    """View parsed logs with filtering options
+    
+    Pages are addressed by keyset cursors (before/after a log id, see
+    fetch_log_page); page only numbers them for display.
+    """
     # Get filter parameters
-    file_name = request.args.get('file_name', '')
-    status_code = request.args.get('status_code', '')
-    ip = request.args.get('ip', '')
-    request_type = request.args.get('request_type', '')
+    try:
+        where, params, filters = build_log_filters(request.args)
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(url_for('view_logs'))
     page = request.args.get('page', 1, type=int)
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
     
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
         
-        # Build query with filters
-        query = 'SELECT * FROM logs WHERE 1=1'
-        params = []
-        
-        if file_name:
-            query += ' AND file_name = ?'
-            params.append(file_name)
-        
-        if status_code:
-            query += ' AND status_code = ?'
-            params.append(int(status_code))
-        
-        if ip:
-            query += ' AND ip LIKE ?'
-            params.append(f'%{ip}%')
-        
-        if request_type:
-            query += ' AND request_type = ?'
-            params.append(request_type)
-        
         # Get total count for pagination
-        count_query = query.replace('SELECT *', 'SELECT COUNT(*)')
-        cursor.execute(count_query, params)
-        total_count = cursor.fetchone()[0]
+        total_count = count_log_rows(cursor, where, params, filters)
         
         # Pagination
         per_page = 100
-        offset = (page - 1) * per_page
-        query += ' ORDER BY id DESC LIMIT ? OFFSET ?'
-        params.extend([per_page, offset])
+        if before is None and after is None and page > 1:
+            # Numbered link without a cursor (old bookmarks): fall back to OFFSET
+            cursor.execute(f'SELECT * FROM logs WHERE {where} ORDER BY id DESC LIMIT ? OFFSET ?',
+                           params + [per_page, (page - 1) * per_page])
+            logs = cursor.fetchall()
+            has_older = page * per_page < total_count
+            has_newer = True
+        else:
+            logs, has_older, has_newer = fetch_log_page(cursor, where, params, per_page, before, after)
         
-        cursor.execute(query, params)
-        logs = cursor.fetchall()
+        total_pages = (total_count + per_page - 1) // per_page
+        # Keep the page number in step with the ends, e.g. after jumping to the last page
+        if not has_newer:
+            page = 1
+        elif not has_older:
+            page = max(total_pages, 1)
         
-        # Get filter options
-        cursor.execute('SELECT DISTINCT file_name FROM logs')
+        # Get filter options from the rollups rather than scanning the logs
+        cursor.execute('''
+        SELECT file_name FROM files f 
+        WHERE EXISTS (SELECT 1 FROM log_rollups WHERE file_id = f.id)
+        ''')
         file_names = [row[0] for row in cursor.fetchall()]
         
-        cursor.execute('SELECT DISTINCT status_code FROM logs')
+        cursor.execute('SELECT DISTINCT status_code FROM log_rollups ORDER BY status_code')
         status_codes = [row[0] for row in cursor.fetchall()]
         
-        cursor.execute('SELECT DISTINCT request_type FROM logs')
+        cursor.execute('SELECT DISTINCT request_type FROM log_rollups ORDER BY request_type')
         request_types = [row[0] for row in cursor.fetchall()]
         
-        total_pages = (total_count + per_page - 1) // per_page
-        
         return render_template('logs.html',
                               logs=logs,
                               file_names=file_names,
@@ -579,12 +2622,9 @@ def view_logs():
                               current_page=page,
                               total_pages=total_pages,
                               total_count=total_count,
-                              filters={
-                                  'file_name': file_name,
-                                  'status_code': status_code,
-                                  'ip': ip,
-                                  'request_type': request_type
-                              })
+                              has_older=has_older,
+                              has_newer=has_newer,
+                              filters=filters)
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         flash(f"Database error: {str(e)}", "danger")
@@ -596,12 +2636,9 @@ def view_logs():
                               current_page=1,
                               total_pages=0,
                               total_count=0,
-                              filters={
-                                  'file_name': file_name,
-                                  'status_code': status_code,
-                                  'ip': ip,
-                                  'request_type': request_type
-                              })
+                              has_older=False,
+                              has_newer=False,
+                              filters=filters)
     finally:
         conn.close()
 
@@ -619,14 +2656,33 @@ def delete_file(file_name):
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Delete logs for this file
-        cursor.execute('DELETE FROM logs WHERE file_name = ?', (file_name,))
+        # Delete logs for this file and their rollups
+        cursor.execute('''
+        DELETE FROM log_entries WHERE file_id = (SELECT id FROM files WHERE file_name = ?)
+        ''', (file_name,))
+        cursor.execute('''
+        DELETE FROM log_rollups WHERE file_id = (SELECT id FROM files WHERE file_name = ?)
+        ''', (file_name,))
+        cursor.execute('''
+        DELETE FROM log_sketches WHERE file_id = (SELECT id FROM files WHERE file_name = ?)
+        ''', (file_name,))
+        cursor.execute('''
+        DELETE FROM latency_rollups WHERE file_id = (SELECT id FROM files WHERE file_name = ?)
+        ''', (file_name,))
         
-        # Delete file record
+        # Delete any unfinished ingestion and the file record
+        cursor.execute('''
+        DELETE FROM ingest_jobs WHERE file_id = (SELECT id FROM files WHERE file_name = ?)
+        ''', (file_name,))
         cursor.execute('DELETE FROM files WHERE file_name = ?', (file_name,))
         
+        # Ingestors drop the files id they cached
+        bump_generation(cursor, 'deletes')
+        
         conn.commit()
+        sync_analytics_store(conn)
         conn.close()
+        forget_processing_status(file_name)
         
         # Try to delete the actual file if it exists
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_name)
@@ -639,70 +2695,298 @@ def delete_file(file_name):
     
     return redirect(url_for('dashboard'))
 
+# Columns of the logs view, which /api/logs fields= picks from
+LOG_FIELDS = ('id', 'file_name', 'ip', 'remote_log_name', 'user_id', 'timestamp', 'request_type', 'api',
+              'protocol', 'status_code', 'bytes', 'referrer', 'user_agent', 'response_time', 'upload_date', 'ts_epoch')
+
 @app.route('/api/logs')
 def api_logs():
-    """API endpoint to get logs in JSON format"""
-    file_name = request.args.get('file_name', '')
-    status_code = request.args.get('status_code', '')
-    ip = request.args.get('ip', '')
-    request_type = request.args.get('request_type', '')
+    """API endpoint to get logs in JSON format
+    
+    Returns up to limit (default 100, at most 1000) logs, newest first. Pass
+    next_before back as before for the next (older) page, or prev_after as
+    after for the previous one; each costs the same at any depth.
+    
+    fields (comma-separated LOG_FIELDS; id is always included) limits the
+    columns returned, and count=0 skips total_count (returned as null). The
+    response is gzip or br compressed when the client accepts it, and carries
+    an ETag for the data version and query: a poll with If-None-Match gets a
+    304 without running the query until logs are added or deleted.
+    """
+    try:
+        where, params, filters = build_log_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
+    with_count = request.args.get('count') != '0'
+    fields = ['id']
+    for field in request.args.get('fields', '').split(','):
+        field = field.strip()
+        if field and field not in fields:
+            if field not in LOG_FIELDS:
+                return jsonify({'error': f'Unknown field: {field}'}), 400
+            fields.append(field)
+    if len(fields) == 1:
+        fields = list(LOG_FIELDS)
     
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
-        
-        # Build query with filters
-        query = 'SELECT * FROM logs WHERE 1=1'
-        count_query = 'SELECT COUNT(*) FROM logs WHERE 1=1'
-        params = []
-        
-        if file_name:
-            query += ' AND file_name = ?'
-            count_query += ' AND file_name = ?'
-            params.append(file_name)
-        
-        if status_code:
-            query += ' AND status_code = ?'
-            count_query += ' AND status_code = ?'
-            params.append(int(status_code) if status_code.isdigit() else status_code)
-        
-        if ip:
-            query += ' AND ip LIKE ?'
-            count_query += ' AND ip LIKE ?'
-            params.append(f'%{ip}%')
-        
-        if request_type:
-            query += ' AND request_type = ?'
-            count_query += ' AND request_type = ?'
-            params.append(request_type)
-        
-        # Get total count
-        cursor.execute(count_query, params)
-        total_count = cursor.fetchone()[0]
-        
-        # Get logs with limit
-        query += ' ORDER BY timestamp DESC LIMIT 100'
-        
-        cursor.execute(query, params)
-        logs = cursor.fetchall()
-        
-        # Convert to list of dicts
-        result = []
-        for log in logs:
-            log_dict = {}
-            for key in log.keys():
-                log_dict[key] = log[key]
-            result.append(log_dict)
-        
+        cursor.row_factory = None
+        
+        # The data version changes with every insert and delete, so it and the query identify the response
+        version = log_data_version(cursor)
+        etag = hashlib.blake2b(repr((version, request.query_string)).encode(), digest_size=12).hexdigest()
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            total_count = count_log_rows(cursor, where, params, filters) if with_count else None
+            
+            # Get the page of logs by keyset on id, as tuples zipped with the field names
+            logs, has_older, has_newer = fetch_log_page(cursor, where, params, limit, before, after,
+                                                        ', '.join(fields))
+            
+            body = dumps_json({
+                'logs': [dict(zip(fields, log)) for log in logs],
+                'total_count': total_count,
+                'next_before': logs[-1][0] if logs and has_older else None,
+                'prev_after': logs[0][0] if logs and has_newer else None,
+                'filters': filters
+            })
+            response = Response(body, mimetype='application/json')
+            encoding = choose_encoding(request.accept_encodings)
+            if encoding and len(body) >= app.config['API_COMPRESS_MIN_BYTES']:
+                response.set_data(compress_body(body, encoding))
+                response.headers['Content-Encoding'] = encoding
+        
+        # Weak, as the compressed and plain bodies are the same data
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
+        return response
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/logs/export')
+def export_logs():
+    """Stream every log matching the /logs filters as a CSV, NDJSON or Parquet download
+    
+    format is csv (the default), ndjson or parquet (needs pyarrow), and gzip=1
+    compresses the file. Rows are read oldest first from a single cursor,
+    EXPORT_BATCH_ROWS at a time, and each batch is sent as soon as it is
+    encoded: memory use does not grow with the export, and the download
+    starts right away.
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unknown export format: {export_format}'}), 400
+    if not export_available(export_format):
+        return jsonify({'error': 'Parquet export requires the pyarrow package'}), 501
+    try:
+        where, params, filters = build_log_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    compress = request.args.get('gzip') == '1'
+    batch_rows = app.config['EXPORT_BATCH_ROWS']
+    
+    def generate():
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(f'SELECT * FROM logs WHERE {where} ORDER BY id', params)
+            columns = [description[0] for description in cursor.description]
+            batches = iter(lambda: cursor.fetchmany(batch_rows), [])
+            yield from export_chunks(columns, batches, export_format, compress)
+        except sqlite3.Error as e:
+            print(f"Database error during export: {e}")
+        finally:
+            conn.close()
+    
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    file_name = f'logs{extension}.gz' if compress else f'logs{extension}'
+    return Response(generate(), mimetype='application/gzip' if compress else mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{file_name}"',
+                             'X-Accel-Buffering': 'no'})
+
+@app.route('/api/top/<dimension>')
+def api_top(dimension):
+    """Most frequent IPs or APIs, from the sketches or, with exact=1, from the logs
+
+    Accepts the /api/logs filters and k (default 10). Sketch counts are upper
+    bounds off by at most error; guaranteed says whether the set is certainly
+    the top k. Sketches only cover whole files and hourly buckets, so filters
+    on status code, IP, request type or text always use the exact query.
+    """
+    kinds = {'ip': ('top_ip', 'ip'), 'api': ('top_api', 'api')}
+    if dimension not in kinds:
+        return jsonify({'error': f'Unknown dimension: {dimension}'}), 404
+    kind, column = kinds[dimension]
+    k = min(request.args.get('k', 10, type=int), app.config['TOP_K_CAPACITY'])
+    try:
+        where, params, filters = build_log_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    exact = (request.args.get('exact') == '1'
+             or any(filters[name] for name in ('status_code', 'request_type') + IP_FILTERS + tuple(SEARCH_FILTERS)))
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        if exact:
+            cursor.execute(f'''
+            SELECT {column}, COUNT(*)
+            FROM logs
+            WHERE {where}
+            GROUP BY {column}
+            ORDER BY 2 DESC
+            LIMIT ?
+            ''', params + [k])
+            items = [(value, count, 0) for value, count in cursor.fetchall()]
+            guaranteed = True
+        else:
+            file_ids = None
+            if filters['file_name']:
+                file_ids, missing = lookup_file_ids(cursor, [filters['file_name']])
+                if missing:
+                    return jsonify({'error': f"Unknown file: {filters['file_name']}"}), 404
+            items, guaranteed = top_values(cursor, kind, k, file_ids, parse_time_param(filters['start']),
+                                           parse_time_param(filters['end'], end=True))
+
         return jsonify({
-            'logs': result,
-            'total_count': total_count,
-            'filters': {
-                'file_name': file_name,
-                'ip': ip,
-                'status_code': status_code,
-                'request_type': request_type
-            }
+            'dimension': dimension,
+            'items': [{'value': value, 'count': count, 'error': error} for value, count, error in items],
+            'approximate': not exact,
+            'guaranteed': guaranteed,
+            'filters': filters
+        })
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/distinct/<dimension>')
+def api_distinct(dimension):
+    """Number of distinct IPs or APIs over any set of files and time window
+
+    file_name may be repeated to count over the union of several files; start
+    and end are as for /api/logs. Estimated from the sketches unless exact=1
+    or EXACT_DISTINCT_COUNTS is set; estimated windows are widened to whole hours.
+    """
+    kinds = {'ip': ('distinct_ip', 'ip'), 'api': ('distinct_api', 'api_id')}
+    if dimension not in kinds:
+        return jsonify({'error': f'Unknown dimension: {dimension}'}), 404
+    kind, column = kinds[dimension]
+    file_names = request.args.getlist('file_name')
+    start = parse_time_param(request.args.get('start'))
+    end = parse_time_param(request.args.get('end'), end=True)
+    exact = app.config['EXACT_DISTINCT_COUNTS'] or request.args.get('exact') == '1'
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        file_ids = None
+        if file_names:
+            file_ids, missing = lookup_file_ids(cursor, file_names)
+            if missing:
+                return jsonify({'error': f"Unknown file: {', '.join(missing)}"}), 404
+
+        if exact:
+            where = '1=1'
+            params = []
+            if file_ids is not None:
+                where += f' AND file_id IN ({",".join("?" * len(file_ids))})'
+                params.extend(file_ids)
+            if start is not None:
+                where += ' AND ts_epoch >= ?'
+                params.append(start)
+            if end is not None:
+                where += ' AND ts_epoch < ?'
+                params.append(end)
+            # The same columns are in the analytics store, if one is configured
+            store = sync_analytics_store(conn)
+            if store is not None:
+                count = store.query(f'SELECT COUNT(DISTINCT {column}) FROM logs WHERE {where}', params)[0][0]
+            else:
+                cursor.execute(f'SELECT COUNT(DISTINCT {column}) FROM log_entries WHERE {where}', params)
+                count = cursor.fetchone()[0]
+        else:
+            count = distinct_count(cursor, kind, file_ids, start, end)
+
+        return jsonify({
+            'dimension': dimension,
+            'count': count,
+            'approximate': not exact,
+            'file_names': file_names,
+            'start': request.args.get('start', ''),
+            'end': request.args.get('end', '')
+        })
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/latency')
+def api_latency():
+    """Response time percentiles (p50/p90/p99, in milliseconds), overall and per API
+
+    Computed from the latency histograms, within 2% of the exact values.
+    file_name and api may be repeated; start and end are as for /api/logs and
+    widened to whole hours. APIs are listed by sort (requests, p50, p90 or
+    p99; default requests), at most limit of them (default 10).
+    """
+    file_names = request.args.getlist('file_name')
+    apis = request.args.getlist('api')
+    start = parse_time_param(request.args.get('start'))
+    end = parse_time_param(request.args.get('end'), end=True)
+    sort = request.args.get('sort', 'requests')
+    limit = request.args.get('limit', 10, type=int)
+    if sort not in ('requests', 'p50', 'p90', 'p99'):
+        return jsonify({'error': f'Unknown sort: {sort}'}), 400
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        file_ids = None
+        if file_names:
+            file_ids, missing = lookup_file_ids(cursor, file_names)
+            if missing:
+                return jsonify({'error': f"Unknown file: {', '.join(missing)}"}), 404
+        api_ids = None
+        if apis:
+            cursor.execute(f'SELECT id FROM strings WHERE value IN ({",".join("?" * len(apis))})', apis)
+            api_ids = [row[0] for row in cursor.fetchall()]
+
+        histograms = latency_histograms(cursor, file_ids, start, end, api_ids)
+        overall = LatencyHistogram()
+        for histogram in histograms.values():
+            overall.merge(histogram)
+
+        rows = [dict(api_id=api_id, requests=histogram.total, **histogram.percentiles())
+                for api_id, histogram in histograms.items()]
+        rows.sort(key=lambda row: row[sort], reverse=True)
+        rows = rows[:limit]
+        if rows:
+            ids = [row['api_id'] for row in rows]
+            cursor.execute(f'SELECT id, value FROM strings WHERE id IN ({",".join("?" * len(ids))})', ids)
+            names = dict(cursor.fetchall())
+            for row in rows:
+                row['api'] = names.get(row.pop('api_id'))
+
+        return jsonify({
+            'unit': 'ms',
+            'overall': dict(requests=overall.total, **overall.percentiles()),
+            'apis': rows,
+            'file_names': file_names,
+            'start': request.args.get('start', ''),
+            'end': request.args.get('end', '')
         })
     except sqlite3.Error as e:
         print(f"Database error: {e}")
@@ -710,6 +2994,13 @@ def api_logs():
     finally:
         conn.close()
 
+@app.route('/api/receiver/stats')
+def receiver_stats():
+    """Throughput counters of the network log receiver"""
+    if log_receiver is None:
+        return jsonify({'running': False})
+    return jsonify(dict(log_receiver.stats(), running=True))
+
 @app.route('/reset_data')
 def reset_data():
     """Reset all log data in the system"""
@@ -717,20 +3008,37 @@ def reset_data():
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Delete all logs
-        cursor.execute('DELETE FROM logs')
+        # Delete all logs and the values they referenced
+        cursor.execute('DELETE FROM log_entries')
+        cursor.execute('DELETE FROM log_rollups')
+        cursor.execute('DELETE FROM log_sketches')
+        cursor.execute('DELETE FROM latency_rollups')
+        cursor.execute('DELETE FROM strings')
+        cursor.execute("INSERT INTO strings_fts (strings_fts) VALUES ('delete-all')")
+        cursor.execute('DELETE FROM ingest_jobs')
         
-        # Delete all file records
+        # Delete all file records, and the followed paths' offsets into them
         cursor.execute('DELETE FROM files')
+        cursor.execute('DELETE FROM tail_state')
+        
+        # Ingestors drop the files and strings ids they cached
+        bump_generation(cursor, 'deletes')
         
         conn.commit()
+        sync_analytics_store(conn)
         conn.close()
+        forget_processing_status()
         
-        # Delete all actual files in the uploads folder
+        # Delete all actual files in the uploads folder, except the .part files
+        # of uploads that are still being saved (save_upload renames them when done)
         for file_name in os.listdir(app.config['UPLOAD_FOLDER']):
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_name)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
+            if not os.path.isfile(file_path):
+                continue
+            if (file_name.endswith('.part')
+                    and time.time() - os.path.getmtime(file_path) < app.config['UPLOAD_PART_TIMEOUT']):
+                continue
+            os.remove(file_path)
         
         flash('All log data has been successfully reset', 'success')
     except Exception as e:
@@ -742,10 +3050,19 @@ def reset_data():
 if __name__ == '__main__':
     # Import and initialize Dash app
     from dash_app import create_dash_app
-    create_dash_app(app)
+    create_dash_app(app, sync_analytics_store)
     
     # Initialize database
     init_db()
     
+    # Start the ingestion workers, which also pick up jobs interrupted by the
+    # last shutdown, and the live log sources. With the debug reloader, only
+    # the child process that serves requests does this.
+    debug = True
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_ingest_workers()
+        start_log_follower()
+        start_log_receiver()
+    
     # Run the app
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    app.run(host="0.0.0.0", port=5000, debug=debug)
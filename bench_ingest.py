@@ -0,0 +1,61 @@
+"""Benchmark end-to-end ingestion of a synthetic log into a fresh database
+
+Usage:
+    python bench_ingest.py [--lines 200000] [--ips 50000] [--max-seconds N]
+
+Runs the single-pass upload path (parsing, interning, dedup, rollups,
+sketches and latency histograms) and prints lines/sec. The default file is
+over BULK_LOAD_MIN_SIZE, so it is loaded in bulk mode. With --max-seconds it
+exits with status 1 when ingestion takes longer, so it can guard against
+regressions. It also checks that the rollups add up to the rows stored.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import app as log_app
+from bench_parser import generate_lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lines', type=int, default=200_000)
+    parser.add_argument('--ips', type=int, default=50_000, help='distinct client addresses')
+    parser.add_argument('--max-seconds', type=float, help='fail when ingestion takes longer than this')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = os.path.join(directory, 'bench.log')
+        print(f'Generating {args.lines:,} synthetic log lines...')
+        with open(log_path, 'w') as f:
+            f.write('\n'.join(generate_lines(args.lines, ip_count=args.ips)) + '\n')
+
+        log_app.app.config.update(DATABASE=os.path.join(directory, 'bench.db'), UPLOAD_FOLDER=directory)
+        log_app.init_db()
+        file_name = log_app.register_upload('bench.log')
+
+        start = time.perf_counter()
+        stored = log_app.process_log_file(log_path, file_name)
+        elapsed = time.perf_counter() - start
+        print(f'ingest {stored:>10,} stored  {elapsed:8.3f}s  {args.lines / elapsed:>12,.0f} lines/sec')
+
+        conn = log_app.get_db_connection()
+        try:
+            rows = conn.execute('SELECT COUNT(*) FROM log_entries').fetchone()[0]
+            rollups = conn.execute('SELECT COALESCE(SUM(requests), 0) FROM log_rollups').fetchone()[0]
+            latency = conn.execute('SELECT COALESCE(SUM(requests), 0) FROM latency_rollups').fetchone()[0]
+        finally:
+            conn.close()
+
+    if not rows == rollups == latency == stored:
+        print(f'Mismatch: {rows:,} rows, {rollups:,} in log_rollups, {latency:,} in latency_rollups')
+        sys.exit(1)
+    if args.max_seconds is not None and elapsed > args.max_seconds:
+        print(f'Too slow: {elapsed:.3f}s is over the {args.max_seconds}s limit')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark the Apache log parsers on a synthetic log
+
+Usage:
+    python bench_parser.py [--lines 1000000] [--repeat 3]
+
+Prints lines/sec for the dict-based parse_apache_log, the parse_log_row
+fast path and the compiled LogFormat parser that ingestion uses for this format.
+"""
+import argparse
+import random
+import time
+
+from app import parse_apache_log, parse_log_row
+from log_formats import get_log_format
+
+METHODS = ['GET', 'GET', 'GET', 'POST', 'PUT', 'DELETE']
+STATUSES = [200, 200, 200, 201, 301, 304, 404, 500]
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0 Safari/537.36',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/119.0',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148 Safari/604.1',
+    'curl/8.1.2',
+    'Googlebot/2.1 (+http://www.google.com/bot.html)',
+]
+
+
+def generate_lines(count, seed=42, ip_count=5000):
+    """Build a list of synthetic combined-format log lines with a response time"""
+    rng = random.Random(seed)
+    ips = [f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}' for _ in range(ip_count)]
+    apis = [f'/api/v1/items/{i}' for i in range(500)] + ['/', '/login', '/static/app.js']
+    lines = []
+    for i in range(count):
+        second = i // 20
+        timestamp = f'{10 + second // 86400 % 18:02d}/Oct/2023:{second // 3600 % 24:02d}:{second // 60 % 60:02d}:{second % 60:02d} +0000'
+        size = '-' if i % 17 == 0 else str(rng.randint(100, 50000))
+        lines.append(
+            f'{rng.choice(ips)} - - [{timestamp}] "{rng.choice(METHODS)} {rng.choice(apis)} HTTP/1.1" '
+            f'{rng.choice(STATUSES)} {size} "http://example.com/" "{rng.choice(USER_AGENTS)}" {rng.random():.3f}'
+        )
+    return lines
+
+
+def bench(name, parse, lines, repeat):
+    """Run a parser over all lines and report the best lines/sec over several runs"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parsed = 0
+        for line in lines:
+            if parse(line) is not None:
+                parsed += 1
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    rate = len(lines) / best
+    print(f'{name:<20} {parsed:>10,} parsed  {best:8.3f}s  {rate:>12,.0f} lines/sec')
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lines', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'Generating {args.lines:,} synthetic log lines...')
+    lines = generate_lines(args.lines)
+
+    baseline = bench('parse_apache_log', parse_apache_log, lines, args.repeat)
+    fast = bench('parse_log_row', lambda line: parse_log_row(line, 'bench.log', ''), lines, args.repeat)
+    parse_row = get_log_format('apache_combined_time').parse_row
+    compiled = bench('LogFormat.parse_row', lambda line: parse_row(line, 'bench.log', ''), lines, args.repeat)
+    print(f'Speedup: {fast / baseline:.2f}x (parse_log_row), {compiled / baseline:.2f}x (LogFormat.parse_row)')
+
+
+if __name__ == '__main__':
+    main()
@@ -5,9 +5,30 @@ import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 import sqlite3
+import calendar
+from datetime import datetime
 
-# Function to create Dash app
-def create_dash_app(flask_app):
+from sketches import HyperLogLog, LatencyHistogram, SpaceSaving, latency_bin, latency_bin_sql, load_sketch
+
+# Browser family of a user agent, as a SQL CASE over column; like is the
+# case-insensitive LIKE of the engine (LIKE in SQLite, ILIKE in DuckDB)
+def user_agent_case(column, like='LIKE'):
+    return f'''
+    CASE
+        WHEN {column} {like} '%Chrome%' THEN 'Chrome'
+        WHEN {column} {like} '%Firefox%' THEN 'Firefox'
+        WHEN {column} {like} '%Safari%' THEN 'Safari'
+        WHEN {column} {like} '%Edge%' THEN 'Edge'
+        WHEN {column} {like} '%MSIE%' OR {column} {like} '%Trident%' THEN 'Internet Explorer'
+        WHEN {column} {like} '%bot%' OR {column} {like} '%spider%' THEN 'Bot'
+        WHEN {column} {like} '%curl%' OR {column} {like} '%Wget%' THEN 'API Tool'
+        WHEN {column} {like} '%Mobile%' OR {column} {like} '%Android%' OR {column} {like} '%iPhone%' THEN 'Mobile'
+        ELSE 'Other'
+    END'''
+
+# Function to create Dash app; sync_analytics_store(conn) returns the app's analytics
+# store brought up to date with conn's database, or None when there is none
+def create_dash_app(flask_app, sync_analytics_store=lambda conn: None):
     # Create a Dash app
     dash_app = dash.Dash(
         __name__,
@@ -121,6 +142,28 @@ def create_dash_app(flask_app):
                         ], width=6)
                     ]),
 
+                    dbc.Row([
+                        dbc.Col([
+                            dbc.Card([
+                                dbc.CardHeader("Traffic Over Time"),
+                                dbc.CardBody([
+                                    dcc.Graph(id="time-series-chart", style={"height": "300px"})
+                                ])
+                            ], className="mb-4 shadow-sm h-100")
+                        ], width=12)
+                    ]),
+
+                    dbc.Row([
+                        dbc.Col([
+                            dbc.Card([
+                                dbc.CardHeader("Response Time Percentiles (slowest p99)"),
+                                dbc.CardBody([
+                                    dcc.Graph(id="response-time-chart", style={"height": "300px"})
+                                ])
+                            ], className="mb-4 shadow-sm h-100")
+                        ], width=12)
+                    ]),
+
                     dbc.Row([
                         dbc.Col([
                             dbc.Card([
@@ -143,6 +186,72 @@ def create_dash_app(flask_app):
         conn.execute('PRAGMA journal_mode=WAL;')
         return conn
 
+    # Helper to convert a DatePickerRange value to epoch seconds (UTC midnight)
+    def date_to_epoch(value):
+        day = datetime.strptime(value[:10], '%Y-%m-%d')
+        return calendar.timegm(day.timetuple())
+
+    # Helper to build the WHERE clause shared by the chart callbacks, over log_entries
+    # or (with time_column='bucket') over log_rollups, whose buckets never straddle a day.
+    # Given the file's id, it also applies to the analytics store, which has no files table
+    def build_filter(file_name, status_range, start_date, end_date, time_column='ts_epoch', file_id=None):
+        if file_id is None:
+            where = 'file_id = (SELECT id FROM files WHERE file_name = ?) AND status_code BETWEEN ? AND ?'
+            params = [file_name, status_range[0], status_range[1]]
+        else:
+            where = 'file_id = ? AND status_code BETWEEN ? AND ?'
+            params = [file_id, status_range[0], status_range[1]]
+        # Time window predicates use the indexed time column; the end date is inclusive
+        if start_date:
+            where += f' AND {time_column} >= ?'
+            params.append(date_to_epoch(start_date))
+        if end_date:
+            where += f' AND {time_column} < ?'
+            params.append(date_to_epoch(end_date) + 86400)
+        return where, params
+
+    # Helper to get the analytics store (see analytics_store.py), brought up to date, with
+    # the build_filter clause for it; None when no store is configured (or it is unusable)
+    def store_filter(conn, file_name, status_range, start_date, end_date):
+        store = sync_analytics_store(conn)
+        if store is None:
+            return None
+        row = conn.execute('SELECT id FROM files WHERE file_name = ?', (file_name,)).fetchone()
+        file_id = row[0] if row else -1
+        return (store,) + build_filter(file_name, status_range, start_date, end_date, file_id=file_id)
+
+    # Helper to read the top k values of a sketch kind (see sketches.py) for a file and
+    # date range, with whether they are certainly the top k. Sketches have no status code
+    # dimension, so this returns None unless the slider covers every status; date ranges
+    # are whole days, so the hourly buckets match them exactly
+    def sketch_top(cursor, kind, k, file_name, status_range, start_date, end_date):
+        if list(status_range) != [100, 599]:
+            return None
+        cursor.execute('SELECT id FROM files WHERE file_name = ?', (file_name,))
+        row = cursor.fetchone()
+        if row is None:
+            return [], True
+        start = date_to_epoch(start_date) if start_date else None
+        end = date_to_epoch(end_date) + 86400 if end_date else None
+        sketch = load_sketch(cursor, SpaceSaving, kind, [row[0]], start, end)
+        if sketch is None:
+            return [], True
+        return sketch.top(k), sketch.guaranteed(k)
+
+    # Helper to estimate the distinct values of a sketch kind for a file and date range;
+    # None when the sketches cannot answer (see sketch_top) or exact counts are configured
+    def sketch_distinct(cursor, kind, file_name, status_range, start_date, end_date):
+        if list(status_range) != [100, 599] or flask_app.config.get('EXACT_DISTINCT_COUNTS'):
+            return None
+        cursor.execute('SELECT id FROM files WHERE file_name = ?', (file_name,))
+        row = cursor.fetchone()
+        if row is None:
+            return 0
+        start = date_to_epoch(start_date) if start_date else None
+        end = date_to_epoch(end_date) + 86400 if end_date else None
+        sketch = load_sketch(cursor, HyperLogLog, kind, [row[0]], start, end)
+        return sketch.count() if sketch else 0
+
     # Callback to populate file dropdown
     @dash_app.callback(
         Output('file-dropdown', 'options'),
@@ -165,9 +274,11 @@ def create_dash_app(flask_app):
     @dash_app.callback(
         Output('status-pie-chart', 'figure'),
         Input('file-dropdown', 'value'),
-        Input('status-slider', 'value')
+        Input('status-slider', 'value'),
+        Input('date-range', 'start_date'),
+        Input('date-range', 'end_date')
     )
-    def update_status_chart(file_name, status_range):
+    def update_status_chart(file_name, status_range, start_date, end_date):
         if not file_name:
             return go.Figure().update_layout(title="No data available")
         
@@ -175,15 +286,16 @@ def create_dash_app(flask_app):
         try:
             cursor = conn.cursor()
             
-            # Query for status code distribution
-            query = '''
-            SELECT status_code, COUNT(*) as count 
-            FROM logs 
-            WHERE file_name = ? AND status_code BETWEEN ? AND ?
+            # Query for status code distribution (from the per-minute rollups)
+            where, params = build_filter(file_name, status_range, start_date, end_date, 'bucket')
+            query = f'''
+            SELECT status_code, SUM(requests) as count 
+            FROM log_rollups 
+            WHERE {where}
             GROUP BY status_code 
             ORDER BY count DESC
             '''
-            cursor.execute(query, (file_name, status_range[0], status_range[1]))
+            cursor.execute(query, params)
             data = cursor.fetchall()
             
             if not data:
@@ -215,9 +327,11 @@ def create_dash_app(flask_app):
     @dash_app.callback(
         Output('request-bar-chart', 'figure'),
         Input('file-dropdown', 'value'),
-        Input('status-slider', 'value')
+        Input('status-slider', 'value'),
+        Input('date-range', 'start_date'),
+        Input('date-range', 'end_date')
     )
-    def update_request_chart(file_name, status_range):
+    def update_request_chart(file_name, status_range, start_date, end_date):
         if not file_name:
             return go.Figure().update_layout(title="No data available")
         
@@ -225,15 +339,16 @@ def create_dash_app(flask_app):
         try:
             cursor = conn.cursor()
             
-            # Query for request type distribution
-            query = '''
-            SELECT request_type, COUNT(*) as count 
-            FROM logs 
-            WHERE file_name = ? AND status_code BETWEEN ? AND ?
+            # Query for request type distribution (from the per-minute rollups)
+            where, params = build_filter(file_name, status_range, start_date, end_date, 'bucket')
+            query = f'''
+            SELECT request_type, SUM(requests) as count 
+            FROM log_rollups 
+            WHERE {where}
             GROUP BY request_type 
             ORDER BY count DESC
             '''
-            cursor.execute(query, (file_name, status_range[0], status_range[1]))
+            cursor.execute(query, params)
             data = cursor.fetchall()
             
             if not data:
@@ -267,9 +382,11 @@ def create_dash_app(flask_app):
     @dash_app.callback(
         Output('ip-bar-chart', 'figure'),
         Input('file-dropdown', 'value'),
-        Input('status-slider', 'value')
+        Input('status-slider', 'value'),
+        Input('date-range', 'start_date'),
+        Input('date-range', 'end_date')
     )
-    def update_ip_chart(file_name, status_range):
+    def update_ip_chart(file_name, status_range, start_date, end_date):
         if not file_name:
             return go.Figure().update_layout(title="No data available")
         
@@ -277,17 +394,36 @@ def create_dash_app(flask_app):
         try:
             cursor = conn.cursor()
             
-            # Query for top 10 IPs
-            query = '''
-            SELECT ip, COUNT(*) as count 
-            FROM logs 
-            WHERE file_name = ? AND status_code BETWEEN ? AND ?
-            GROUP BY ip 
-            ORDER BY count DESC 
-            LIMIT 10
-            '''
-            cursor.execute(query, (file_name, status_range[0], status_range[1]))
-            data = cursor.fetchall()
+            # Top 10 IPs from the sketches, or counted (in the analytics store, if there
+            # is one) when filtering on status codes
+            top = sketch_top(cursor, 'top_ip', 10, file_name, status_range, start_date, end_date)
+            stored = store_filter(conn, file_name, status_range, start_date, end_date) if top is None else None
+            guaranteed = True
+            if top is not None:
+                top, guaranteed = top
+                data = [(ip, count) for ip, count, _ in top]
+            elif stored is not None:
+                store, where, params = stored
+                data = store.query(f'''
+                SELECT ip, COUNT(*) as count 
+                FROM logs 
+                WHERE {where}
+                GROUP BY ip 
+                ORDER BY count DESC 
+                LIMIT 10
+                ''', params)
+            else:
+                where, params = build_filter(file_name, status_range, start_date, end_date)
+                query = f'''
+                SELECT ip, COUNT(*) as count 
+                FROM log_entries 
+                WHERE {where}
+                GROUP BY ip 
+                ORDER BY count DESC 
+                LIMIT 10
+                '''
+                cursor.execute(query, params)
+                data = cursor.fetchall()
             
             if not data:
                 return go.Figure().update_layout(title="No data available")
@@ -308,7 +444,7 @@ def create_dash_app(flask_app):
             
             fig.update_layout(
                 margin=dict(l=20, r=20, t=30, b=20),
-                xaxis_title="Count",
+                xaxis_title="Count" if guaranteed else "Count (approximate)",
                 yaxis_title="",
                 yaxis={'categoryorder':'total ascending'}
             )
@@ -321,9 +457,11 @@ def create_dash_app(flask_app):
     @dash_app.callback(
         Output('api-bar-chart', 'figure'),
         Input('file-dropdown', 'value'),
-        Input('status-slider', 'value')
+        Input('status-slider', 'value'),
+        Input('date-range', 'start_date'),
+        Input('date-range', 'end_date')
     )
-    def update_api_chart(file_name, status_range):
+    def update_api_chart(file_name, status_range, start_date, end_date):
         if not file_name:
             return go.Figure().update_layout(title="No data available")
         
@@ -331,17 +469,46 @@ def create_dash_app(flask_app):
         try:
             cursor = conn.cursor()
             
-            # Query for top 5 APIs
-            query = '''
-            SELECT api, COUNT(*) as count 
-            FROM logs 
-            WHERE file_name = ? AND status_code BETWEEN ? AND ?
-            GROUP BY api 
-            ORDER BY count DESC 
-            LIMIT 5
-            '''
-            cursor.execute(query, (file_name, status_range[0], status_range[1]))
-            data = cursor.fetchall()
+            # Top 5 APIs from the sketches (interned ids), or counted (in the analytics store,
+            # if there is one) when filtering on status codes
+            top = sketch_top(cursor, 'top_api', 5, file_name, status_range, start_date, end_date)
+            stored = store_filter(conn, file_name, status_range, start_date, end_date) if top is None else None
+            guaranteed = True
+            if top is not None:
+                top, guaranteed = top
+                names = {}
+                if top:
+                    ids = [api_id for api_id, _, _ in top]
+                    cursor.execute(f'SELECT id, value FROM strings WHERE id IN ({",".join("?" * len(ids))})', ids)
+                    names = dict(cursor.fetchall())
+                data = [(names.get(api_id), count) for api_id, count, _ in top]
+            elif stored is not None:
+                store, where, params = stored
+                data = store.query(f'''
+                SELECT api, COUNT(*) as count 
+                FROM logs 
+                WHERE {where}
+                GROUP BY api 
+                ORDER BY count DESC 
+                LIMIT 5
+                ''', params)
+            else:
+                where, params = build_filter(file_name, status_range, start_date, end_date)
+                query = f'''
+                SELECT s.value as api, t.count 
+                FROM (
+                    SELECT api_id, COUNT(*) as count 
+                    FROM log_entries 
+                    WHERE {where}
+                    GROUP BY api_id 
+                    ORDER BY count DESC 
+                    LIMIT 5
+                ) t 
+                JOIN strings s ON s.id = t.api_id 
+                ORDER BY t.count DESC
+                '''
+                cursor.execute(query, params)
+                data = cursor.fetchall()
             
             if not data:
                 return go.Figure().update_layout(title="No data available")
@@ -362,7 +529,7 @@ def create_dash_app(flask_app):
             
             fig.update_layout(
                 margin=dict(l=20, r=20, t=30, b=20),
-                xaxis_title="Count",
+                xaxis_title="Count" if guaranteed else "Count (approximate)",
                 yaxis_title="",
                 yaxis={'categoryorder':'total ascending'}
             )
@@ -375,9 +542,11 @@ def create_dash_app(flask_app):
     @dash_app.callback(
         Output('time-series-chart', 'figure'),
         Input('file-dropdown', 'value'),
-        Input('status-slider', 'value')
+        Input('status-slider', 'value'),
+        Input('date-range', 'start_date'),
+        Input('date-range', 'end_date')
     )
-    def update_time_series(file_name, status_range):
+    def update_time_series(file_name, status_range, start_date, end_date):
         if not file_name:
             return go.Figure().update_layout(title="No data available")
         
@@ -385,17 +554,19 @@ def create_dash_app(flask_app):
         try:
             cursor = conn.cursor()
             
-            # Query for time series data
-            query = '''
+            # Query for time series data (from the per-minute rollups; bucket -1
+            # holds rows without a parsable timestamp)
+            where, params = build_filter(file_name, status_range, start_date, end_date, 'bucket')
+            query = f'''
             SELECT 
-                strftime('%Y-%m-%d %H:00:00', timestamp) as hour,
-                COUNT(*) as count 
-            FROM logs 
-            WHERE file_name = ? AND status_code BETWEEN ? AND ?
+                strftime('%Y-%m-%d %H:00:00', NULLIF(bucket, -1), 'unixepoch') as hour,
+                SUM(requests) as count 
+            FROM log_rollups 
+            WHERE {where}
             GROUP BY hour 
             ORDER BY hour
             '''
-            cursor.execute(query, (file_name, status_range[0], status_range[1]))
+            cursor.execute(query, params)
             data = cursor.fetchall()
             
             if not data:
@@ -427,9 +598,11 @@ def create_dash_app(flask_app):
     @dash_app.callback(
         Output('response-time-chart', 'figure'),
         Input('file-dropdown', 'value'),
-        Input('status-slider', 'value')
+        Input('status-slider', 'value'),
+        Input('date-range', 'start_date'),
+        Input('date-range', 'end_date')
     )
-    def update_response_time(file_name, status_range):
+    def update_response_time(file_name, status_range, start_date, end_date):
         if not file_name:
             return go.Figure().update_layout(title="No data available")
         
@@ -437,55 +610,77 @@ def create_dash_app(flask_app):
         try:
             cursor = conn.cursor()
             
-            # Query for response time data
-            query = '''
-            SELECT 
-                api,
-                AVG(response_time) as avg_time,
-                MIN(response_time) as min_time,
-                MAX(response_time) as max_time
-            FROM logs 
-            WHERE file_name = ? AND status_code BETWEEN ? AND ?
-            GROUP BY api 
-            ORDER BY avg_time DESC
-            LIMIT 10
-            '''
-            cursor.execute(query, (file_name, status_range[0], status_range[1]))
-            data = cursor.fetchall()
-            
-            if not data:
+            # Latency histograms per API: from latency_rollups, or binned from the rows
+            # when filtering on status codes (the rollups have no status dimension),
+            # by the analytics store if there is one
+            histograms = {}
+            rollups = list(status_range) == [100, 599]
+            stored = store_filter(conn, file_name, status_range, start_date, end_date) if not rollups else None
+            if rollups:
+                where = 'file_id = (SELECT id FROM files WHERE file_name = ?)'
+                params = [file_name]
+                if start_date:
+                    where += ' AND bucket >= ?'
+                    params.append(date_to_epoch(start_date))
+                if end_date:
+                    where += ' AND bucket >= 0 AND bucket < ?'
+                    params.append(date_to_epoch(end_date) + 86400)
+                cursor.execute(f'''
+                SELECT api_id, bin, SUM(requests) 
+                FROM latency_rollups 
+                WHERE {where}
+                GROUP BY api_id, bin
+                ''', params)
+                for api_id, index, count in cursor.fetchall():
+                    histograms.setdefault(api_id, LatencyHistogram()).add_bin(index, count)
+            elif stored is not None:
+                store, where, params = stored
+                for api_id, index, count in store.query(f'''
+                SELECT api_id, {latency_bin_sql('response_time * 1000')} as bin, COUNT(*) 
+                FROM logs 
+                WHERE {where} AND response_time IS NOT NULL
+                GROUP BY api_id, bin
+                ''', params):
+                    histograms.setdefault(api_id, LatencyHistogram()).add_bin(index, count)
+            else:
+                where, params = build_filter(file_name, status_range, start_date, end_date)
+                cursor.execute(f'''
+                SELECT api_id, response_time 
+                FROM log_entries 
+                WHERE {where} AND response_time IS NOT NULL
+                ''', params)
+                for api_id, response_time in cursor.fetchall():
+                    histograms.setdefault(api_id, LatencyHistogram()).add_bin(latency_bin(response_time * 1000), 1)
+            
+            if not histograms:
                 return go.Figure().update_layout(title="No data available")
             
+            # The 10 APIs with the slowest p99, names looked up afterwards
+            data = sorted(((api_id, histogram.percentiles()) for api_id, histogram in histograms.items()),
+                          key=lambda item: item[1]['p99'], reverse=True)[:10]
+            ids = [api_id for api_id, _ in data]
+            cursor.execute(f'SELECT id, value FROM strings WHERE id IN ({",".join("?" * len(ids))})', ids)
+            names = dict(cursor.fetchall())
+            
             # Create DataFrame
-            df = pd.DataFrame(data, columns=['api', 'avg_time', 'min_time', 'max_time'])
+            df = pd.DataFrame([dict(api=names.get(api_id), **percentiles) for api_id, percentiles in data])
             
-            # Create response time chart
+            # Create response time percentile chart
             fig = go.Figure()
             
-            fig.add_trace(go.Bar(
-                x=df['api'],
-                y=df['avg_time'],
-                name='Average Response Time',
-                marker_color='rgb(55, 83, 109)'
-                # title='Response Time Analysis (Top 5 APIs by Avg Time)',
-            ))
-            
-            fig.add_trace(go.Scatter(
-                x=df['api'],
-                y=df['max_time'],
-                mode='markers',
-                name='Max Response Time',
-                marker=dict(
-                    color='red',
-                    size=10,
-                    symbol='triangle-up'
-                )
-            ))
+            for percentile, color in (('p50', 'rgb(55, 83, 109)'), ('p90', 'rgb(26, 118, 255)'), ('p99', 'crimson')):
+                fig.add_trace(go.Bar(
+                    x=df['api'],
+                    y=df[percentile],
+                    name=percentile,
+                    marker_color=color
+                ))
             
             fig.update_layout(
-                # title='Response Time Analysis (Top 5 APIs by Avg Time)',
+                # title='Response Time Percentiles (10 APIs with the slowest p99)',
+                barmode='group',
                 xaxis_title='API',
-                yaxis_title='Response Time (seconds)',
+                yaxis_title='Response Time (ms)',
                 margin=dict(l=20, r=20, t=30, b=20),
                 legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
             )
@@ -498,9 +693,11 @@ def create_dash_app(flask_app):
     @dash_app.callback(
         Output('user-agent-chart', 'figure'),
         Input('file-dropdown', 'value'),
-        Input('status-slider', 'value')
+        Input('status-slider', 'value'),
+        Input('date-range', 'start_date'),
+        Input('date-range', 'end_date')
     )
-    def update_user_agent(file_name, status_range):
+    def update_user_agent(file_name, status_range, start_date, end_date):
         if not file_name:
             return go.Figure().update_layout(title="No data available")
         
@@ -508,28 +705,37 @@ def create_dash_app(flask_app):
         try:
             cursor = conn.cursor()
             
-            # Query for user agent data
-            query = '''
-            SELECT 
-                CASE
-                    WHEN user_agent LIKE '%Chrome%' THEN 'Chrome'
-                    WHEN user_agent LIKE '%Firefox%' THEN 'Firefox'
-                    WHEN user_agent LIKE '%Safari%' THEN 'Safari'
-                    WHEN user_agent LIKE '%Edge%' THEN 'Edge'
-                    WHEN user_agent LIKE '%MSIE%' OR user_agent LIKE '%Trident%' THEN 'Internet Explorer'
-                    WHEN user_agent LIKE '%bot%' OR user_agent LIKE '%Bot%' OR user_agent LIKE '%spider%' THEN 'Bot'
-                    WHEN user_agent LIKE '%curl%' OR user_agent LIKE '%Wget%' THEN 'API Tool'
-                    WHEN user_agent LIKE '%Mobile%' OR user_agent LIKE '%Android%' OR user_agent LIKE '%iPhone%' THEN 'Mobile'
-                    ELSE 'Other'
-                END as browser,
-                COUNT(*) as count
-            FROM logs 
-            WHERE file_name = ? AND status_code BETWEEN ? AND ?
-            GROUP BY browser 
-            ORDER BY count DESC
-            '''
-            cursor.execute(query, (file_name, status_range[0], status_range[1]))
-            data = cursor.fetchall()
+            # Query for user agent data, in the analytics store if there is one: count
+            # per user agent first, so the classification runs once per distinct string
+            stored = store_filter(conn, file_name, status_range, start_date, end_date)
+            if stored is not None:
+                store, where, params = stored
+                data = store.query(f'''
+                SELECT {user_agent_case('user_agent', 'ILIKE')} as browser, SUM(t.count) as count
+                FROM (
+                    SELECT user_agent, COUNT(*) as count 
+                    FROM logs 
+                    WHERE {where}
+                    GROUP BY user_agent
+                ) t 
+                GROUP BY browser 
+                ORDER BY count DESC
+                ''', params)
+            else:
+                where, params = build_filter(file_name, status_range, start_date, end_date)
+                cursor.execute(f'''
+                SELECT {user_agent_case('s.value')} as browser, SUM(t.count) as count
+                FROM (
+                    SELECT user_agent_id, COUNT(*) as count 
+                    FROM log_entries 
+                    WHERE {where}
+                    GROUP BY user_agent_id
+                ) t 
+                JOIN strings s ON s.id = t.user_agent_id 
+                GROUP BY browser 
+                ORDER BY count DESC
+                ''', params)
+                data = cursor.fetchall()
             
             if not data:
                 return go.Figure().update_layout(title="No data available")
@@ -561,9 +767,11 @@ def create_dash_app(flask_app):
     @dash_app.callback(
         Output('data-summary', 'children'),
         Input('file-dropdown', 'value'),
-        Input('status-slider', 'value')
+        Input('status-slider', 'value'),
+        Input('date-range', 'start_date'),
+        Input('date-range', 'end_date')
     )
-    def update_data_summary(file_name, status_range):
+    def update_data_summary(file_name, status_range, start_date, end_date):
         if not file_name:
             return html.P("No data available")
         
@@ -571,23 +779,51 @@ def create_dash_app(flask_app):
         try:
             cursor = conn.cursor()
             
-            # Query for summary data
-            query = '''
+            # Query for summary data: counts and response times from the rollups
+            where, params = build_filter(file_name, status_range, start_date, end_date, 'bucket')
+            query = f'''
             SELECT 
-                COUNT(*) as total_logs,
-                COUNT(DISTINCT ip) as unique_ips,
-                COUNT(DISTINCT api) as unique_apis,
-                SUM(CASE WHEN status_code >= 400 THEN 1 ELSE 0 END) as error_count,
-                AVG(response_time) as avg_response_time
-            FROM logs 
-            WHERE file_name = ? AND status_code BETWEEN ? AND ?
+                SUM(requests) as total_logs,
+                SUM(CASE WHEN status_code >= 400 THEN requests ELSE 0 END) as error_count,
+                SUM(response_time_sum) / SUM(response_time_count) as avg_response_time
+            FROM log_rollups 
+            WHERE {where}
             '''
-            cursor.execute(query, (file_name, status_range[0], status_range[1]))
-            data = cursor.fetchone()
+            cursor.execute(query, params)
+            totals = cursor.fetchone()
             
-            if not data:
+            if not totals or not totals['total_logs']:
                 return html.P("No data available")
             
+            # ...distinct values from the sketches, or from the rows themselves (in the analytics
+            # store, if there is one) when filtering on status codes or when exact counts are configured
+            data = dict(totals)
+            unique_ips = sketch_distinct(cursor, 'distinct_ip', file_name, status_range, start_date, end_date)
+            stored = store_filter(conn, file_name, status_range, start_date, end_date) if unique_ips is None else None
+            if unique_ips is not None:
+                data['unique_ips'] = unique_ips
+                data['unique_apis'] = sketch_distinct(cursor, 'distinct_api', file_name, status_range,
+                                                      start_date, end_date)
+            elif stored is not None:
+                store, where, params = stored
+                data['unique_ips'], data['unique_apis'] = store.query(f'''
+                SELECT 
+                    COUNT(DISTINCT ip) as unique_ips,
+                    COUNT(DISTINCT api_id) as unique_apis
+                FROM logs 
+                WHERE {where}
+                ''', params)[0]
+            else:
+                where, params = build_filter(file_name, status_range, start_date, end_date)
+                cursor.execute(f'''
+                SELECT 
+                    COUNT(DISTINCT ip) as unique_ips,
+                    COUNT(DISTINCT api_id) as unique_apis
+                FROM log_entries 
+                WHERE {where}
+                ''', params)
+                data.update(dict(cursor.fetchone()))
+            
             # Create summary cards
             return dbc.Row([
                 dbc.Col([
@@ -631,7 +867,8 @@ def create_dash_app(flask_app):
                     dbc.Card([
                         dbc.CardBody([
                             html.H5("Avg Response Time", className="card-title text-muted"),
-                            html.H3(f"{data['avg_response_time']:.3f}s", className="card-text text-warning")
+                            html.H3(f"{data['avg_response_time']:.3f}s" if data['avg_response_time'] is not None else "-",
+                                    className="card-text text-warning")
                         ])
                     ], className="text-center shadow-sm")
                 ], width=2),
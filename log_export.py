@@ -0,0 +1,123 @@
+"""Streaming encoders for exporting log rows as CSV, NDJSON or Parquet, optionally gzipped"""
+import csv
+import io
+import json
+import zlib
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet export is optional
+    pyarrow = None
+
+# Format -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', '.csv'),
+    'ndjson': ('application/x-ndjson', '.ndjson'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+}
+
+# Columns of the logs view that are not text, for the Parquet schema
+PARQUET_COLUMN_TYPES = {
+    'id': 'int64',
+    'status_code': 'int64',
+    'bytes': 'int64',
+    'response_time': 'float64',
+    'ts_epoch': 'int64',
+}
+
+# Rows per Parquet row group. Row groups are written (and sent) whole, so this
+# bounds the rows held in memory.
+PARQUET_ROW_GROUP_ROWS = 100000
+
+
+def export_available(export_format):
+    """Whether export_format can be produced here (Parquet needs pyarrow)"""
+    return export_format in EXPORT_FORMATS and (export_format != 'parquet' or pyarrow is not None)
+
+
+def export_chunks(columns, batches, export_format, compress=False):
+    """Encode batches of row tuples as export_format, yielding bytes as each batch is done
+
+    batches is any iterable of row lists, e.g. successive fetchmany() calls, so
+    only one batch (a row group for Parquet) is held at a time. CSV starts with
+    the header row before the first batch is read. With compress, the output is
+    a gzip stream, flushed after every batch so the client gets it right away.
+    """
+    if export_format == 'csv':
+        chunks = _csv_chunks(columns, batches)
+    elif export_format == 'ndjson':
+        chunks = _ndjson_chunks(columns, batches)
+    else:
+        chunks = _parquet_chunks(columns, batches)
+    if not compress:
+        yield from chunks
+        return
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: gzip header and trailer
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def _csv_chunks(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode()
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+
+
+def _ndjson_chunks(columns, batches):
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(columns, row)), separators=(',', ':')) + '\n' for row in rows).encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written so far, keeping the position for the Parquet footer"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _parquet_chunks(columns, batches):
+    schema = pyarrow.schema([(column, PARQUET_COLUMN_TYPES.get(column, 'string')) for column in columns])
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+    yield sink.take()
+    group = []
+    for rows in batches:
+        group.extend(rows)
+        if len(group) >= PARQUET_ROW_GROUP_ROWS:
+            writer.write_table(_parquet_table(schema, group))
+            group = []
+            yield sink.take()
+    if group:
+        writer.write_table(_parquet_table(schema, group))
+    writer.close()
+    yield sink.take()
+
+
+def _parquet_table(schema, rows):
+    return pyarrow.Table.from_arrays(
+        [pyarrow.array(values, type=field.type) for values, field in zip(zip(*rows), schema)], schema=schema)
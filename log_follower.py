@@ -0,0 +1,186 @@
+"""Follow growing log files and hand over newly appended lines (like tail -F)"""
+import glob
+import os
+import threading
+
+
+def find_by_inode(directory, device, inode):
+    """Return the path of the file in directory with the given device and inode, or None"""
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return None
+    for entry in entries:
+        try:
+            stat = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        if stat.st_ino == inode and stat.st_dev == device:
+            return entry.path
+    return None
+
+
+class FollowedFile:
+    """An open log file and the byte offset just after its last delivered line"""
+
+    def __init__(self, path, handle, offset=0):
+        self.path = path
+        self.handle = handle
+        stat = os.fstat(handle.fileno())
+        self.device = stat.st_dev
+        self.inode = stat.st_ino
+        self.offset = offset
+
+    def state(self):
+        return {'device': self.device, 'inode': self.inode, 'offset': self.offset}
+
+    def read(self, max_bytes, final=False):
+        """Read up to max_bytes of complete lines starting at the current offset
+
+        A trailing partial line is left for the next read unless final is set
+        (the file has been rotated away and will not grow any more).
+        """
+        self.handle.seek(self.offset)
+        data = self.handle.read(max_bytes)
+        if final or not data:
+            return data
+        end = data.rfind(b'\n') + 1
+        if end == 0 and len(data) == max_bytes:
+            # A single line longer than max_bytes: hand it over in pieces
+            return data
+        return data[:end]
+
+
+class LogFollower:
+    """Poll a set of log files (glob patterns) and deliver appended lines in batches
+
+    on_lines(path, lines, state) is called with at most batch_lines lines (bytes,
+    without the newline) and the state to persist once they are stored: a dict
+    with the file's device, inode and the offset after the last line. It may be
+    called with no lines when only the state changed (rotation or truncation).
+    If it raises, the same lines are delivered again on the next poll.
+
+    load_state(path) returns the state saved for a path, or None. A file whose
+    inode still matches resumes at the saved offset; one that was rotated while
+    the follower was stopped is first drained from the rotated copy, if it can
+    still be found in the same directory.
+
+    Rotation by rename (logrotate's default) is detected by the path pointing to
+    a new inode: the old file is read to the end before switching. copytruncate
+    is detected by the file shrinking below the offset, which restarts at 0.
+    """
+
+    def __init__(self, patterns, on_lines, load_state=None, poll_interval=1.0,
+                 batch_lines=500, read_size=1024 * 1024):
+        self.patterns = list(patterns)
+        self.on_lines = on_lines
+        self.load_state = load_state or (lambda path: None)
+        self.poll_interval = poll_interval
+        self.batch_lines = batch_lines
+        self.read_size = read_size
+        self.files = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='log-follower', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for followed in self.files.values():
+            followed.handle.close()
+        self.files.clear()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error following log files: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def poll(self):
+        """Pick up new files matching the patterns and deliver what was appended to each"""
+        for path in self._matching_paths():
+            if path not in self.files:
+                self._open(path)
+        for path, followed in list(self.files.items()):
+            self._follow(path, followed)
+
+    def _matching_paths(self):
+        paths = []
+        for pattern in self.patterns:
+            paths.extend(p for p in sorted(glob.glob(pattern)) if os.path.isfile(p))
+        return paths
+
+    def _open(self, path):
+        try:
+            handle = open(path, 'rb')
+        except OSError as e:
+            print(f"Cannot follow {path}: {e}")
+            return
+        current = FollowedFile(path, handle)
+        state = self.load_state(path)
+
+        if state and (state['device'], state['inode']) == (current.device, current.inode):
+            # Same file as before; it was truncated if it is now shorter
+            if os.fstat(handle.fileno()).st_size >= state['offset']:
+                current.offset = state['offset']
+        elif state:
+            # Rotated while we were not running: finish the old file first
+            rotated_path = find_by_inode(os.path.dirname(path) or '.', state['device'], state['inode'])
+            if rotated_path:
+                with open(rotated_path, 'rb') as rotated_handle:
+                    rotated = FollowedFile(path, rotated_handle, state['offset'])
+                    self._deliver(rotated, final=True)
+            self.on_lines(path, [], current.state())
+
+        self.files[path] = current
+
+    def _follow(self, path, followed):
+        self._deliver(followed)
+
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            # Renamed away and not recreated yet: keep reading the open file
+            return
+
+        if (stat.st_dev, stat.st_ino) != (followed.device, followed.inode):
+            # Rotated by rename: drain the old file, then follow the new one from the start
+            self._deliver(followed, final=True)
+            followed.handle.close()
+            del self.files[path]
+            try:
+                self.files[path] = FollowedFile(path, open(path, 'rb'))
+            except OSError as e:
+                print(f"Cannot follow {path}: {e}")
+                return
+            self.on_lines(path, [], self.files[path].state())
+            self._deliver(self.files[path])
+        elif stat.st_size < followed.offset:
+            # copytruncate: the file was emptied in place
+            followed.offset = 0
+            self.on_lines(path, [], followed.state())
+            self._deliver(followed)
+
+    def _deliver(self, followed, final=False):
+        """Hand everything readable to on_lines, batch by batch, advancing the offset"""
+        while True:
+            data = followed.read(self.read_size, final)
+            if not data:
+                return
+            lines = data.split(b'\n')
+            if lines[-1] == b'':
+                lines.pop()
+
+            # Only the last piece can lack a newline, hence the clamp to the chunk end
+            chunk_end = followed.offset + len(data)
+            for start in range(0, len(lines), self.batch_lines):
+                batch = lines[start:start + self.batch_lines]
+                end = min(followed.offset + sum(len(line) + 1 for line in batch), chunk_end)
+                self.on_lines(followed.path, batch, dict(followed.state(), offset=end))
+                followed.offset = end
@@ -0,0 +1,262 @@
+"""Apache LogFormat / nginx log_format strings compiled into specialized line parsers"""
+import calendar
+import re
+from datetime import datetime
+from functools import lru_cache
+
+MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+          'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+# Columns of a parsed row, between file_name and upload_date (see insert_log_batch)
+ROW_FIELDS = ('ip', 'remote_log_name', 'user_id', 'timestamp', 'request_type', 'api',
+              'protocol', 'status_code', 'bytes', 'referrer', 'user_agent', 'response_time')
+
+APACHE_TIME_PATTERN = r'\d\d/[A-Z][a-z]{2}/\d{4}:\d\d:\d\d:\d\d [+\-]\d{4}'
+ISO8601_PATTERN = r'\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:[+\-]\d\d:\d\d|Z)'
+
+# Directive -> (row field, value pattern, conversion of the matched text g)
+# A None pattern means "any token": \S+ unquoted, [^"]* between quotes. A
+# pattern with a group of its own captures only that part (%t's brackets).
+APACHE_DIRECTIVES = {
+    'h': ('ip', None, 'g'),
+    'a': ('ip', None, 'g'),
+    'l': ('remote_log_name', None, 'g'),
+    'u': ('user_id', None, 'g'),
+    't': ('timestamp', r'\[(' + APACHE_TIME_PATTERN + r')\]', 'g'),
+    'r': ('request', None, None),
+    'm': ('request_type', None, 'g'),
+    'U': ('api', None, 'g'),
+    'H': ('protocol', None, 'g'),
+    's': ('status_code', r'\d{3}', 'int(g)'),
+    'b': ('bytes', r'\d+|-', "int(g) if g != '-' else 0"),
+    'B': ('bytes', r'\d+', 'int(g)'),
+    'O': ('bytes', r'\d+', 'int(g)'),
+    'T': ('response_time', r'\d+(?:\.\d+)?', 'float(g)'),
+    'D': ('response_time', r'\d+', 'int(g) / 1000000'),
+    'referer i': ('referrer', None, 'g'),
+    'user-agent i': ('user_agent', None, 'g'),
+    's T': ('response_time', r'\d+', 'float(g)'),
+    'ms T': ('response_time', r'\d+', 'int(g) / 1000'),
+    'us T': ('response_time', r'\d+', 'int(g) / 1000000'),
+}
+
+NGINX_VARIABLES = {
+    'remote_addr': ('ip', None, 'g'),
+    'remote_user': ('user_id', None, 'g'),
+    'time_local': ('timestamp', APACHE_TIME_PATTERN, 'g'),
+    'time_iso8601': ('timestamp', ISO8601_PATTERN, '_iso_to_apache(g)'),
+    'request': ('request', None, None),
+    'request_method': ('request_type', None, 'g'),
+    'request_uri': ('api', None, 'g'),
+    'uri': ('api', None, 'g'),
+    'server_protocol': ('protocol', None, 'g'),
+    'status': ('status_code', r'\d{3}', 'int(g)'),
+    'body_bytes_sent': ('bytes', r'\d+', 'int(g)'),
+    'bytes_sent': ('bytes', r'\d+', 'int(g)'),
+    'http_referer': ('referrer', None, 'g'),
+    'http_user_agent': ('user_agent', None, 'g'),
+    'request_time': ('response_time', r'\d+(?:\.\d+)?', 'float(g)'),
+}
+
+# Position of response_time in a parsed row (after file_name)
+RESPONSE_TIME_INDEX = ROW_FIELDS.index('response_time') + 1
+
+# What a row holds for a field its format does not log
+FIELD_DEFAULTS = {'status_code': '0', 'bytes': '0', 'response_time': 'None', 'timestamp': "''"}
+
+APACHE_TOKEN = re.compile(r'%[<>]?(?:!?\d{3}(?:,\d{3})*)?(?:\{([^}]*)\})?([a-zA-Z%])')
+NGINX_TOKEN = re.compile(r'\$(?:\{(\w+)\}|(\w+))')
+
+
+@lru_cache(maxsize=65536)
+def parse_apache_timestamp(timestamp):
+    """Convert an Apache timestamp such as '10/Oct/2023:13:55:36 +0000' to Unix epoch seconds
+
+    Timestamps have one-second resolution and consecutive lines usually share
+    them, so results are cached by the timestamp string.
+    """
+    try:
+        # Fixed-width layout: DD/Mon/YYYY:HH:MM:SS +ZZZZ
+        offset = int(timestamp[22:24]) * 3600 + int(timestamp[24:26]) * 60
+        if timestamp[21] == '-':
+            offset = -offset
+        year, month, day = int(timestamp[7:11]), MONTHS[timestamp[3:6]], int(timestamp[0:2])
+        hour, minute, second = int(timestamp[12:14]), int(timestamp[15:17]), int(timestamp[18:20])
+        # timegm rolls impossible dates over (31/Feb to 2 March) rather than rejecting them
+        if 1 <= day <= calendar.monthrange(year, month)[1] and hour < 24 and minute < 60 and second < 60:
+            return calendar.timegm((year, month, day, hour, minute, second)) - offset
+    except (KeyError, ValueError, IndexError, TypeError):
+        pass
+
+    try:
+        return int(datetime.strptime(timestamp, '%d/%b/%Y:%H:%M:%S %z').timestamp())
+    except (ValueError, TypeError):
+        return None
+
+
+@lru_cache(maxsize=65536)
+def _iso_to_apache(timestamp):
+    """Rewrite an ISO 8601 timestamp (nginx $time_iso8601) in the Apache layout stored in logs
+
+    Returns None for text that only looks like one, such as a 13th month.
+    """
+    try:
+        parsed = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed.strftime('%d/%b/%Y:%H:%M:%S %z')
+
+
+class LogFormat:
+    """A log format directive compiled into a regex and a row-building function
+
+    directive is an Apache LogFormat string ('%h %l %u %t "%r" %>s %b') or, when
+    it contains $variables, an nginx log_format string. parse_row(line, file_name,
+    upload_date) returns a row tuple for insert_log_batch, or None if the line
+    does not match. It is generated per format, so each line costs one regex
+    match and the conversions that format actually needs.
+
+    Fields the format does not log are stored as '-' (or 0 / NULL for numbers);
+    directives the logs table has no column for are matched and skipped.
+    """
+
+    def __init__(self, name, directive):
+        self.name = name
+        self.directive = directive
+        self.fields = []
+        # Whether response times are logged in microseconds (%D)
+        self.microseconds = False
+        pattern, conversions = self._compile(directive)
+        # Anything after the last field must be separated by whitespace
+        self.pattern = pattern + r'(?=\s|$)'
+        self.regex = re.compile(self.pattern)
+        self.parse_row = self._build_parser(conversions)
+
+    def _compile(self, directive):
+        nginx = '$' in directive
+        token_regex = NGINX_TOKEN if nginx else APACHE_TOKEN
+        parts = []
+        conversions = {}
+        group = 0
+        position = 0
+        for token in token_regex.finditer(directive):
+            parts.append(re.escape(directive[position:token.start()]))
+            quoted = directive[token.start() - 1:token.start()] == '"' and directive[token.end():token.end() + 1] == '"'
+            position = token.end()
+
+            if nginx:
+                spec = NGINX_VARIABLES.get(token.group(1) or token.group(2))
+            elif token.group(2) == '%':
+                parts.append('%')
+                continue
+            else:
+                key = f'{token.group(1).lower()} {token.group(2)}' if token.group(1) else token.group(2)
+                spec = APACHE_DIRECTIVES.get(key)
+
+            any_token = r'[^"]*' if quoted else r'\S+'
+            if spec is None or spec[0] in conversions or (spec[0] == 'request' and 'api' in conversions):
+                # No column for it (or already captured): match and skip
+                parts.append(f'(?:{any_token})')
+                continue
+
+            field, value_pattern, conversion = spec
+            if field == 'request':
+                parts.append(r'(\S+) (\S+)(?: (\S+))?')
+                conversions['request_type'] = f'g[{group}]'
+                conversions['api'] = f'g[{group + 1}]'
+                conversions['protocol'] = f"(g[{group + 2}] or '-')"
+                self.fields.extend(['request_type', 'api', 'protocol'])
+                group += 3
+                continue
+
+            value_pattern = value_pattern or any_token
+            parts.append(value_pattern if re.compile(value_pattern).groups else f'({value_pattern})')
+            conversions[field] = re.sub(r'\bg\b', f'g[{group}]', conversion)
+            if field == 'response_time' and conversion.endswith('/ 1000000'):
+                self.microseconds = True
+            self.fields.append(field)
+            group += 1
+
+        parts.append(re.escape(directive[position:]))
+        return ''.join(parts), conversions
+
+    def _build_parser(self, conversions):
+        values = [conversions.get(field, FIELD_DEFAULTS.get(field, "'-'")) for field in ROW_FIELDS]
+        epoch = 'None'
+        prologue = ''
+        timestamp = conversions.get('timestamp')
+        if timestamp:
+            # Convert once, then use it for both the stored text and the epoch;
+            # a timestamp the conversion rejects makes the line unparsable
+            values[ROW_FIELDS.index('timestamp')] = 'ts'
+            epoch = '_epoch(ts)'
+            prologue = f'    ts = {timestamp}\n'
+            if not re.fullmatch(r'g\[\d+\]', timestamp):
+                prologue += '    if ts is None:\n        return None\n'
+        source = (
+            'def parse_row(line, file_name, upload_date):\n'
+            '    m = _match(line)\n'
+            '    if m is None:\n'
+            '        return None\n'
+            '    g = m.groups()\n'
+            f'{prologue}'
+            f'    return (file_name, {", ".join(values)}, upload_date, {epoch})\n'
+        )
+        namespace = {'_match': self.regex.match, '_epoch': parse_apache_timestamp, '_iso_to_apache': _iso_to_apache}
+        exec(compile(source, f'<log format {self.name}>', 'exec'), namespace)
+        return namespace['parse_row']
+
+    def score(self, lines):
+        """Number of sample lines this format parses
+
+        Whole-second response times (%T) parse as microseconds too, so a
+        microsecond format scores 0 unless some line took over 1 ms (1000):
+        that many seconds is not plausible.
+        """
+        rows = [row for row in (self.parse_row(line, '', '') for line in lines) if row is not None]
+        if self.microseconds and not any(row[RESPONSE_TIME_INDEX] > 0.001 for row in rows):
+            return 0
+        return len(rows)
+
+
+# Registered formats by name, in detection preference order
+LOG_FORMATS = {}
+
+
+def register_log_format(name, directive):
+    """Compile a format and add it to the registry under name"""
+    log_format = LOG_FORMATS[name] = LogFormat(name, directive)
+    return log_format
+
+
+def get_log_format(name):
+    """Return the registered format called name, or None"""
+    return LOG_FORMATS.get(name)
+
+
+def detect_log_format(lines, default=None):
+    """Pick the registered format that parses the most sample lines, or None if none does
+
+    Ties go to the format that captures more fields (combined beats common on
+    combined lines), then to a microsecond format (it only scores on values
+    that look like microseconds, see LogFormat.score), then to the format named
+    default, then to registration order.
+    """
+    best = None
+    best_key = (0, 0, False, False)
+    for log_format in LOG_FORMATS.values():
+        key = (log_format.score(lines), len(log_format.fields), log_format.microseconds,
+               log_format.name == default)
+        if key[0] and key > best_key:
+            best, best_key = log_format, key
+    return best
+
+
+register_log_format('apache_combined_usec', '%h %l %u %t "%r" %>s %b "%{Referer}i" "%{User-Agent}i" %D')
+register_log_format('apache_combined_time', '%h %l %u %t "%r" %>s %b "%{Referer}i" "%{User-Agent}i" %T')
+register_log_format('apache_combined', '%h %l %u %t "%r" %>s %b "%{Referer}i" "%{User-Agent}i"')
+register_log_format('apache_common', '%h %l %u %t "%r" %>s %b')
+register_log_format('nginx_combined_time', '$remote_addr - $remote_user [$time_local] "$request" $status '
+                                           '$body_bytes_sent "$http_referer" "$http_user_agent" $request_time')
+register_log_format('nginx_main', '$remote_addr - $remote_user [$time_local] "$request" $status '
+                                  '$body_bytes_sent "$http_referer" "$http_user_agent" "$http_x_forwarded_for"')
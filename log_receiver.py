@@ -0,0 +1,234 @@
+"""Receive newline-delimited log lines over TCP and UDP (piped logging, syslog)"""
+import asyncio
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Header added by syslog daemons in front of the message, RFC 5424 or RFC 3164
+SYSLOG_HEADER = re.compile(
+    rb'<\d{1,3}>(?:1 \S+ \S+ \S+ \S+ \S+ (?:-|\[.*?\]) '
+    rb'|[A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d \S+ [^:\s]*: ?)'
+)
+
+
+def strip_syslog_header(line):
+    """Return the message part of a syslog line, or the line itself if it has no header"""
+    if line.startswith(b'<'):
+        match = SYSLOG_HEADER.match(line)
+        if match:
+            return line[match.end():]
+    return line
+
+
+class LogReceiver:
+    """asyncio TCP/UDP listener that hands received lines to on_lines in batches
+
+    The event loop runs in its own thread. Received lines go through a bounded
+    queue to a single writer thread that calls on_lines(lines) with at most
+    batch_lines lines, or whatever arrived within flush_interval seconds.
+    on_lines returns the number of rows it stored; a batch it keeps failing on
+    is given up after a few attempts and counted in lines_failed.
+
+    When the writer falls behind and the queue is full, TCP connections stop
+    being read, so the senders are throttled by TCP flow control. UDP has no
+    such feedback: datagrams arriving at a full queue are dropped and counted.
+    """
+
+    def __init__(self, on_lines, host='127.0.0.1', tcp_port=None, udp_port=None,
+                 queue_size=10000, batch_lines=500, flush_interval=0.5, max_line_size=64 * 1024):
+        self.on_lines = on_lines
+        self.host = host
+        self.tcp_port = tcp_port
+        self.udp_port = udp_port
+        self.queue_size = queue_size
+        self.batch_lines = batch_lines
+        self.flush_interval = flush_interval
+        self.max_line_size = max_line_size
+        self.counters = {
+            'connections': 0,
+            'open_connections': 0,
+            'bytes_received': 0,
+            'lines_received': 0,
+            'lines_dropped': 0,
+            'lines_written': 0,
+            'rows_stored': 0,
+            'batches': 0,
+            'lines_failed': 0,
+            'write_errors': 0,
+            'write_seconds': 0.0,
+        }
+        self.started = None
+        self._recent = deque()
+        self._loop = None
+        self._queue = None
+        self._servers = []
+        self._connections = set()
+        self._thread = None
+        self._ready = threading.Event()
+        self._startup_error = None
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='log-receiver-writer')
+
+    def start(self):
+        """Start listening in a background thread; raises if a port cannot be bound"""
+        self._thread = threading.Thread(target=self._run, name='log-receiver', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._startup_error is not None:
+            raise self._startup_error
+
+    def stop(self):
+        """Stop listening and write out the lines already received"""
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._stopping.set)
+            self._thread.join()
+        self._writer.shutdown()
+
+    def stats(self):
+        """Return the throughput counters, with overall and recent lines per second"""
+        stats = dict(self.counters)
+        now = time.monotonic()
+        uptime = now - self.started if self.started else 0
+        stats['uptime_seconds'] = round(uptime, 1)
+        stats['queued_lines'] = self._queue.qsize() if self._queue is not None else 0
+        stats['write_seconds'] = round(stats['write_seconds'], 3)
+        stats['lines_per_sec'] = round(stats['lines_written'] / uptime, 1) if uptime else 0
+        recent = list(self._recent)
+        if len(recent) > 1 and recent[-1][0] > recent[0][0]:
+            stats['recent_lines_per_sec'] = round((recent[-1][1] - recent[0][1]) / (recent[-1][0] - recent[0][0]), 1)
+        else:
+            stats['recent_lines_per_sec'] = 0
+        stats['tcp_port'] = self.tcp_port
+        stats['udp_port'] = self.udp_port
+        return stats
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+
+    async def _serve(self):
+        self._queue = asyncio.Queue(self.queue_size)
+        self._stopping = asyncio.Event()
+        try:
+            if self.tcp_port is not None:
+                server = await asyncio.start_server(self._handle_connection, self.host, self.tcp_port,
+                                                    limit=self.max_line_size)
+                self.tcp_port = server.sockets[0].getsockname()[1]
+                self._servers.append(server)
+            if self.udp_port is not None:
+                transport, _ = await self._loop.create_datagram_endpoint(
+                    lambda: _DatagramProtocol(self), local_addr=(self.host, self.udp_port))
+                self.udp_port = transport.get_extra_info('sockname')[1]
+                self._servers.append(transport)
+        except OSError as e:
+            self._startup_error = e
+            for server in self._servers:
+                server.close()
+            self._ready.set()
+            return
+
+        self.started = time.monotonic()
+        self._ready.set()
+        consumer = asyncio.ensure_future(self._consume())
+        await self._stopping.wait()
+
+        for server in self._servers:
+            server.close()
+        for writer in self._connections:
+            writer.close()
+        # Let the consumer write out what is queued, then stop it
+        await self._queue.join()
+        consumer.cancel()
+
+    def _received(self, line):
+        """Account for one received line and return it without any syslog header"""
+        self.counters['bytes_received'] += len(line) + 1
+        self.counters['lines_received'] += 1
+        return strip_syslog_header(line.rstrip(b'\r'))
+
+    async def _handle_connection(self, reader, writer):
+        self.counters['connections'] += 1
+        self.counters['open_connections'] += 1
+        self._connections.add(writer)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than max_line_size: asyncio has discarded it
+                    self.counters['lines_dropped'] += 1
+                    continue
+                if not line:
+                    break
+                line = line.rstrip(b'\n')
+                if line:
+                    # Waits while the queue is full, which stops reading the socket
+                    await self._queue.put(self._received(line))
+        except ConnectionError:
+            pass
+        finally:
+            self.counters['open_connections'] -= 1
+            self._connections.discard(writer)
+            writer.close()
+
+    def _datagram_received(self, data):
+        for line in data.split(b'\n'):
+            if not line:
+                continue
+            line = self._received(line)
+            try:
+                self._queue.put_nowait(line)
+            except asyncio.QueueFull:
+                self.counters['lines_dropped'] += 1
+
+    async def _consume(self):
+        """Collect queued lines into batches and write them on the writer thread"""
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.flush_interval
+            while len(batch) < self.batch_lines:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._loop.run_in_executor(self._writer, self._write, batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, batch, attempts=3):
+        started = time.monotonic()
+        for attempt in range(attempts):
+            try:
+                stored = self.on_lines(batch)
+                break
+            except Exception as e:
+                self.counters['write_errors'] += 1
+                print(f"Error storing received log lines: {e}")
+                if attempt + 1 == attempts:
+                    self.counters['lines_failed'] += len(batch)
+                    self.counters['write_seconds'] += time.monotonic() - started
+                    return
+                time.sleep(1)
+        self.counters['write_seconds'] += time.monotonic() - started
+        self.counters['batches'] += 1
+        self.counters['lines_written'] += len(batch)
+        self.counters['rows_stored'] += stored or 0
+        now = time.monotonic()
+        self._recent.append((now, self.counters['lines_written']))
+        while self._recent and now - self._recent[0][0] > 10:
+            self._recent.popleft()
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, receiver):
+        self.receiver = receiver
+
+    def datagram_received(self, data, addr):
+        self.receiver._datagram_received(data)
@@ -0,0 +1,118 @@
+"""Binary input streams for log ingestion (byte counting and transparent decompression)"""
+import bz2
+import gzip
+import io
+import lzma
+from collections import deque
+
+try:
+    import zstandard
+except ImportError:  # zstd support is optional
+    zstandard = None
+
+# Leading bytes of each supported compression format
+COMPRESSION_MAGIC = {
+    'gzip': b'\x1f\x8b',
+    'bz2': b'BZh',
+    'xz': b'\xfd7zXZ\x00',
+    'zstd': b'\x28\xb5\x2f\xfd',
+}
+
+COMPRESSED_EXTENSIONS = ('.gz', '.bz2', '.xz', '.zst')
+
+
+class CountingReader(io.RawIOBase):
+    """Read-through wrapper that counts the bytes consumed from a raw stream
+
+    When copy_to is given, every byte read is also written to that file object,
+    which lets an upload be saved while it is being parsed. When hasher is given
+    (a hashlib object), it is fed the same bytes; prefix_sizes lists byte offsets
+    at which the digest of everything read so far is kept in prefix_digests.
+    """
+
+    def __init__(self, raw, copy_to=None, hasher=None, prefix_sizes=()):
+        self.raw = raw
+        self.copy_to = copy_to
+        self.hasher = hasher
+        self.bytes_read = 0
+        self.prefix_digests = {}
+        self._pending_prefixes = deque(sorted(size for size in set(prefix_sizes) if size > 0))
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.raw.read(len(buffer))
+        size = len(data)
+        buffer[:size] = data
+        self.bytes_read += size
+        if self.copy_to is not None and size:
+            self.copy_to.write(data)
+        if self.hasher is not None and size:
+            self._update_hash(data)
+        return size
+
+    def _update_hash(self, data):
+        """Feed newly read data to the hasher, noting digests at the prefix offsets"""
+        view = memoryview(data)
+        start = self.bytes_read - len(data)
+        position = 0
+        pending = self._pending_prefixes
+        while pending and pending[0] <= self.bytes_read:
+            boundary = pending.popleft() - start
+            self.hasher.update(view[position:boundary])
+            position = boundary
+            self.prefix_digests[start + boundary] = self.hasher.hexdigest()
+        self.hasher.update(view[position:])
+
+    def drain(self, chunk_size=64 * 1024):
+        """Consume whatever is left in the underlying stream"""
+        while self.read(chunk_size):
+            pass
+
+
+def skip_bytes(stream, count, chunk_size=1024 * 1024):
+    """Read and discard count bytes from a stream that may not support seeking"""
+    while count > 0:
+        data = stream.read(min(count, chunk_size))
+        if not data:
+            break
+        count -= len(data)
+
+
+def detect_compression(header):
+    """Return the compression format name for the first bytes of a file, or None"""
+    for name, magic in COMPRESSION_MAGIC.items():
+        if header.startswith(magic):
+            return name
+    return None
+
+
+def is_compressed_file(file_path):
+    """Check whether a file on disk starts with a supported compression header"""
+    with open(file_path, 'rb') as f:
+        return detect_compression(f.read(6)) is not None
+
+
+def open_log_stream(raw):
+    """Wrap a binary stream so compressed logs are decompressed on the fly
+
+    The format is detected from the magic bytes rather than the file name.
+    Decompression is streaming, so memory use does not grow with the
+    uncompressed size. Plain text is returned buffered but otherwise untouched.
+    """
+    buffered = io.BufferedReader(raw, buffer_size=64 * 1024)
+    compression = detect_compression(buffered.peek(6)[:6])
+
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=buffered, mode='rb')
+    if compression == 'bz2':
+        return bz2.BZ2File(buffered, mode='rb')
+    if compression == 'xz':
+        return lzma.LZMAFile(buffered, mode='rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError('Zstandard compressed logs require the zstandard package')
+        reader = zstandard.ZstdDecompressor().stream_reader(buffered, read_across_frames=True)
+        return io.BufferedReader(reader, buffer_size=64 * 1024)
+    return buffered
@@ -0,0 +1,334 @@
+"""Mergeable summaries of log data, kept per file and time bucket at ingestion"""
+import hashlib
+import heapq
+import json
+import math
+import zlib
+from functools import lru_cache
+
+# Width of the time buckets sketches are kept for, in seconds. Each file also
+# has a whole-file sketch of every kind, stored under SKETCH_TOTAL_BUCKET (and rows
+# without a timestamp go to bucket -1).
+SKETCH_BUCKET_SECONDS = 3600
+SKETCH_TOTAL_BUCKET = -2
+
+# Latency histograms bin values in milliseconds on a logarithmic scale, so any
+# value is within LATENCY_RELATIVE_ACCURACY of its bin's representative value.
+# Bin numbers are stored (latency_rollups), so changing this needs a rebuild.
+LATENCY_RELATIVE_ACCURACY = 0.02
+LATENCY_MIN_MS = 0.001
+_LATENCY_GAMMA = (1 + LATENCY_RELATIVE_ACCURACY) / (1 - LATENCY_RELATIVE_ACCURACY)
+_LATENCY_LOG_GAMMA = math.log(_LATENCY_GAMMA)
+
+
+class SpaceSaving:
+    """Top-K heavy hitters summary (Metwally et al.'s Space-Saving algorithm)
+
+    Keeps at most capacity counters. An item not being tracked replaces the one
+    with the smallest count and inherits that count as its possible error, so
+    every count is an upper bound that overestimates by at most error. Any item
+    occurring more than total / capacity times is guaranteed to be tracked.
+    Summaries of different files or time buckets merge into one for the union.
+    """
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+
+    def update(self, counts):
+        """Add a {item: occurrences} mapping, e.g. a Counter over one batch of rows
+
+        The batch is merged in as an exact summary: new items start from the
+        current smallest count (their possible error) and the capacity largest
+        counts are kept. This is the Space-Saving update applied a batch at a
+        time, without an eviction per item.
+        """
+        floor = min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+        for item, count in counts.items():
+            if item in self.counts:
+                self.counts[item] += count
+            else:
+                self.counts[item] = floor + count
+                self.errors[item] = floor
+        if len(self.counts) > self.capacity:
+            self._truncate()
+
+    def _truncate(self):
+        kept = heapq.nlargest(self.capacity, self.counts, key=self.counts.get)
+        self.counts = {item: self.counts[item] for item in kept}
+        self.errors = {item: self.errors[item] for item in kept}
+
+    def merge(self, other):
+        """Fold another summary into this one (Agarwal et al.'s mergeable summaries)
+
+        An item tracked by only one side may have been evicted from the other,
+        so it is credited with the other side's smallest count, if that side is
+        full. The capacity largest counts are kept.
+        """
+        floor = min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+        other_floor = min(other.counts.values()) if len(other.counts) >= other.capacity else 0
+        counts = {}
+        errors = {}
+        for item in self.counts.keys() | other.counts.keys():
+            if item in self.counts and item in other.counts:
+                counts[item] = self.counts[item] + other.counts[item]
+                errors[item] = self.errors[item] + other.errors[item]
+            elif item in self.counts:
+                counts[item] = self.counts[item] + other_floor
+                errors[item] = self.errors[item] + other_floor
+            else:
+                counts[item] = other.counts[item] + floor
+                errors[item] = other.errors[item] + floor
+        self.capacity = max(self.capacity, other.capacity)
+        self.counts = counts
+        self.errors = errors
+        if len(self.counts) > self.capacity:
+            self._truncate()
+        return self
+
+    def top(self, k):
+        """The k items with the highest counts as (item, count, error) tuples"""
+        items = sorted(self.counts, key=lambda item: (-self.counts[item], -self.errors[item]))[:k]
+        return [(item, self.counts[item], self.errors[item]) for item in items]
+
+    def guaranteed(self, k):
+        """Whether top(k) is certainly the true top k set (not necessarily in order)
+
+        It is when every one of them occurs, at the least, as often as the next
+        item could. On flat distributions with more distinct items than capacity
+        this fails and the counts are rough.
+        """
+        top = self.top(k + 1)
+        if len(top) <= k:
+            # Everything seen is still tracked unless the summary was ever full
+            return all(error == 0 for _, _, error in top)
+        return min(count - error for _, count, error in top[:k]) >= top[k][1]
+
+    def to_bytes(self):
+        # Triples rather than an object, so integer items (interned ids) stay integers
+        return json.dumps({
+            'capacity': self.capacity,
+            'items': [[item, count, self.errors[item]] for item, count in self.counts.items()],
+        }, separators=(',', ':')).encode()
+
+    @classmethod
+    def from_bytes(cls, data):
+        state = json.loads(data)
+        sketch = cls(state['capacity'])
+        for item, count, error in state['items']:
+            sketch.counts[item] = count
+            sketch.errors[item] = error
+        return sketch
+
+
+class HyperLogLog:
+    """Distinct count estimate (Flajolet et al.'s HyperLogLog) in 2 ** precision registers
+
+    The standard error is about 1.04 / sqrt(2 ** precision): 1.6% at the default
+    precision of 12, whose registers take 4 KB (much less serialized, as sparse
+    buckets compress well). Sketches merge by register-wise maximum, so the
+    estimate for any union of files or buckets is as good as for a single one.
+    """
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def update(self, counts):
+        """Add the items of an iterable or {item: occurrences} mapping (occurrences are ignored)"""
+        registers = self.registers
+        precision = self.precision
+        for item in counts:
+            index, rank = _register_position(item, precision)
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def _folded(self, precision):
+        """Registers as they would be at a lower precision (the same hashes, fewer index bits)"""
+        dropped = self.precision - precision
+        registers = bytearray(1 << precision)
+        for index, rank in enumerate(self.registers):
+            if not rank:
+                continue
+            # The dropped index bits become the leading bits of the rest of the hash
+            low = index & ((1 << dropped) - 1)
+            rank = dropped - low.bit_length() + 1 if low else dropped + rank
+            target = index >> dropped
+            if rank > registers[target]:
+                registers[target] = rank
+        return registers
+
+    def merge(self, other):
+        """Fold another sketch into this one; the result has the lower of the two precisions"""
+        if other.precision < self.precision:
+            self.registers = self._folded(other.precision)
+            self.precision = other.precision
+        theirs = other.registers if other.precision == self.precision else other._folded(self.precision)
+        self.registers = bytearray(map(max, self.registers, theirs))
+        return self
+
+    def count(self):
+        """Estimated number of distinct items
+
+        Uses Ertl's improved raw estimator ("New cardinality estimation algorithms
+        for HyperLogLog sketches", 2017), which stays unbiased across the range
+        where the original estimator needs small range and bias corrections.
+        """
+        m = len(self.registers)
+        q = 64 - self.precision
+        histogram = [0] * (q + 2)
+        for rank in self.registers:
+            histogram[rank] += 1
+        if histogram[0] == m:
+            return 0
+        z = m * _tau(1 - histogram[q + 1] / m)
+        for k in range(q, 0, -1):
+            z = 0.5 * (z + histogram[k])
+        z += m * _sigma(histogram[0] / m)
+        return round(m * m / (2 * math.log(2) * z))
+
+    def to_bytes(self):
+        return bytes([self.precision]) + zlib.compress(bytes(self.registers), 1)
+
+    @classmethod
+    def from_bytes(cls, data):
+        sketch = cls(data[0])
+        sketch.registers = bytearray(zlib.decompress(data[1:]))
+        return sketch
+
+
+@lru_cache(maxsize=1 << 16)
+def _register_position(item, precision):
+    """(register index, rank) of an item's 64-bit hash for a HyperLogLog of the given precision
+
+    Items are strings or interned integer ids; both hash by their text. Cached,
+    as the same IPs and APIs come up in batch after batch.
+    """
+    value = int.from_bytes(hashlib.blake2b(str(item).encode(), digest_size=8).digest(), 'big')
+    rest_bits = 64 - precision
+    return value >> rest_bits, rest_bits - (value & ((1 << rest_bits) - 1)).bit_length() + 1
+
+
+@lru_cache(maxsize=1 << 16)
+def latency_bin(ms):
+    """Histogram bin of a latency in milliseconds (values below LATENCY_MIN_MS share the lowest)"""
+    return math.ceil(math.log(max(ms, LATENCY_MIN_MS)) / _LATENCY_LOG_GAMMA)
+
+
+def latency_bin_sql(ms):
+    """SQL for latency_bin of the SQL expression ms, for engines with LN and GREATEST (DuckDB)"""
+    return f'CAST(CEIL(LN(GREATEST({ms}, {LATENCY_MIN_MS!r})) / {_LATENCY_LOG_GAMMA!r}) AS INTEGER)'
+
+
+def latency_bin_value(index):
+    """Representative latency of a bin in milliseconds, within the relative accuracy of all its values"""
+    return 2 * _LATENCY_GAMMA ** index / (_LATENCY_GAMMA + 1)
+
+
+class LatencyHistogram:
+    """Latency distribution in logarithmic bins (as in DDSketch), for percentiles
+
+    Percentiles are within LATENCY_RELATIVE_ACCURACY of the exact ones, whatever
+    the distribution. Histograms merge by adding bin counts, so per-bucket ones
+    combine into any window or set of files.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+
+    def add(self, ms, count=1):
+        self.add_bin(latency_bin(ms), count)
+
+    def add_bin(self, index, count):
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.total += count
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.add_bin(index, count)
+        return self
+
+    def quantile(self, q):
+        """The latency in milliseconds below which a fraction q of the values fall, or None if empty"""
+        if not self.total:
+            return None
+        rank = q * (self.total - 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen > rank:
+                return latency_bin_value(index)
+        return latency_bin_value(max(self.counts))
+
+    def percentiles(self, percents=(50, 90, 99)):
+        """{'p50': ms, ...} for the given percentiles, rounded to the microsecond"""
+        values = {}
+        for percent in percents:
+            value = self.quantile(percent / 100)
+            values[f'p{percent}'] = round(value, 3) if value is not None else None
+        return values
+
+
+def _sigma(x):
+    if x == 1:
+        return math.inf
+    y = 1
+    z = x
+    while True:
+        x *= x
+        previous = z
+        z += x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def _tau(x):
+    if x == 0 or x == 1:
+        return 0
+    y = 1
+    z = 1 - x
+    while True:
+        x = math.sqrt(x)
+        previous = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+
+def merge_sketches(sketch_class, blobs):
+    """Merge serialized sketches of one kind into a single sketch, or None if there are none"""
+    merged = None
+    for data in blobs:
+        sketch = sketch_class.from_bytes(data)
+        merged = sketch if merged is None else merged.merge(sketch)
+    return merged
+
+
+def load_sketch(cursor, sketch_class, kind, file_ids=None, start=None, end=None):
+    """Merge the stored sketches of a kind for some files (or all) and a [start, end) window
+
+    Without a window the whole-file sketches are used. Otherwise every bucket
+    overlapping the window counts in full, so windows that are not aligned to
+    SKETCH_BUCKET_SECONDS include some rows just outside them.
+    """
+    where = 'kind = ?'
+    params = [kind]
+    if file_ids is not None:
+        file_ids = list(file_ids)
+        where += f' AND file_id IN ({",".join("?" * len(file_ids))})'
+        params.extend(file_ids)
+    if start is None and end is None:
+        where += ' AND bucket = ?'
+        params.append(SKETCH_TOTAL_BUCKET)
+    else:
+        where += ' AND bucket >= ?'
+        params.append(start - start % SKETCH_BUCKET_SECONDS if start is not None else 0)
+        if end is not None:
+            where += ' AND bucket < ?'
+            params.append(end)
+    cursor.execute(f'SELECT data FROM log_sketches WHERE {where}', params)
+    return merge_sketches(sketch_class, (row[0] for row in cursor.fetchall()))
@@ -67,10 +67,10 @@ document.addEventListener('DOMContentLoaded', function() {
     if (fileInput) {
         fileInput.addEventListener('change', function() {
             const filePath = fileInput.value;
-            const allowedExtensions = /(\.log|\.txt)$/i;
+            const allowedExtensions = /(\.log|\.txt)(\.\d+)?(\.gz|\.bz2|\.xz|\.zst)?$/i;
             
             if (!allowedExtensions.exec(filePath)) {
-                alert('Please upload file having extensions .log or .txt only.');
+                alert('Please upload .log or .txt files (optionally compressed as .gz, .bz2, .xz or .zst).');
                 fileInput.value = '';
                 return false;
             }